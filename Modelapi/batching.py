@@ -0,0 +1,95 @@
+# batching.py
+# Dynamic micro-batching: concurrent callers submit single items, a collector groups
+# whatever arrives within a short window into one batch and runs it in one call.
+
+import asyncio
+import time
+
+import metrics
+
+# Buckets for batch sizes (items per batch)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class MicroBatcher:
+    """
+    Collects submitted items for up to `max_wait_ms` (or until `max_batch_size` items
+    are waiting) and hands them to `run_batch` in one call.
+
+    `run_batch` is a blocking function taking a list of items and returning a list of
+    results in the same order. It is executed through `execute`, an async callable
+    (fn, *args) -> result, e.g. a wrapper around loop.run_in_executor. Up to
+    `concurrency` batches may be running at the same time.
+    """
+
+    def __init__(self, run_batch, execute, max_batch_size=8, max_wait_ms=5.0, concurrency=1, name="batch"):
+        self.run_batch = run_batch
+        self.execute = execute
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.concurrency = max(1, concurrency)
+        self._queue = None
+        self._collectors = []
+        self._batch_size = metrics.histogram(f"{name}_size", BATCH_SIZE_BUCKETS)
+        self._queue_wait = metrics.histogram(f"{name}_queue_wait_seconds")
+        self._run_time = metrics.histogram(f"{name}_run_seconds")
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if not self._collectors:
+            self._collectors = [asyncio.create_task(self._collect()) for _ in range(self.concurrency)]
+
+    async def submit(self, item):
+        """Queue one item and wait for its individual result."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future, time.perf_counter()))
+        return await future
+
+    async def close(self):
+        """Stop the collectors and fail anything still waiting."""
+        for task in self._collectors:
+            task.cancel()
+        await asyncio.gather(*self._collectors, return_exceptions=True)
+        self._collectors = []
+        while self._queue is not None and not self._queue.empty():
+            _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Batcher is shutting down"))
+
+    async def _collect(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # Callers that gave up (client disconnected) don't need a slot in the batch
+            batch = [entry for entry in batch if not entry[1].cancelled()]
+            if not batch:
+                continue
+
+            dispatched = time.perf_counter()
+            for _, _, queued_at in batch:
+                self._queue_wait.observe(dispatched - queued_at)
+            self._batch_size.observe(len(batch))
+
+            try:
+                results = await self.execute(self.run_batch, [item for item, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self._run_time.observe(time.perf_counter() - dispatched)
+
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
@@ -0,0 +1,100 @@
+# bench_chat.py
+# Chat fan-out throughput against the number of API workers (see chat_broker.py).
+#
+# Usage (needs a Redis server; nothing is stored):
+#   python bench_chat.py [--workers 1 2 4] [--users 50] [--messages 2000] [--broker redis]
+#
+# Every worker process is a node holding --users connected users and sends --messages
+# messages to users picked at random across all nodes, so with N workers (N-1)/N of
+# the traffic crosses workers. Reports end-to-end messages/s and the share reported as
+# delivered. --broker memory shows the per-process behaviour: only 1/N gets delivered.
+
+import argparse
+import asyncio
+import multiprocessing
+import random
+import time
+
+import chat_broker
+
+CONCURRENT_PUBLISHES = 100
+QUIET_SECONDS = 1.0
+
+
+def user(node, i):
+    return f"bench-{node}-{i}@example.com"
+
+
+async def node_main(node, args, start_barrier, done_barrier, results):
+    received = {"count": 0, "last": 0.0}
+
+    async def deliver(email, message):
+        received["count"] += 1
+        received["last"] = time.time()
+
+    broker = chat_broker.create_broker(args.broker, redis_url=args.redis_url)
+    await broker.start(deliver)
+    for i in range(args.users):
+        await broker.subscribe(user(node, i))
+    await asyncio.to_thread(start_barrier.wait)
+
+    started = time.time()
+    rng = random.Random(node)
+    delivered = 0
+    for offset in range(0, args.messages, CONCURRENT_PUBLISHES):
+        batch = range(offset, min(offset + CONCURRENT_PUBLISHES, args.messages))
+        counts = await asyncio.gather(*[
+            broker.publish(user(rng.randrange(args.node_count), rng.randrange(args.users)), {"seq": seq, "sender": node})
+            for seq in batch
+        ])
+        delivered += sum(1 for c in counts if c)
+    await asyncio.to_thread(done_barrier.wait)
+
+    # Drain: stop once nothing has arrived for QUIET_SECONDS
+    last_count = -1
+    while received["count"] != last_count:
+        last_count = received["count"]
+        await asyncio.sleep(QUIET_SECONDS)
+    await broker.close()
+    results.put((started, received["last"], delivered, received["count"]))
+
+
+def run_node(node, args, start_barrier, done_barrier, results):
+    asyncio.run(node_main(node, args, start_barrier, done_barrier, results))
+
+
+def run(node_count, args):
+    args.node_count = node_count
+    ctx = multiprocessing.get_context("spawn")
+    start_barrier, done_barrier, results = ctx.Barrier(node_count), ctx.Barrier(node_count), ctx.Queue()
+    procs = [ctx.Process(target=run_node, args=(n, args, start_barrier, done_barrier, results)) for n in range(node_count)]
+    for p in procs:
+        p.start()
+    rows = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    started = min(r[0] for r in rows)
+    finished = max(r[1] for r in rows) or time.time()
+    sent = args.messages * node_count
+    delivered = sum(r[2] for r in rows)
+    received = sum(r[3] for r in rows)
+    return sent, delivered, received, received / max(finished - started, 1e-9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure chat fan-out throughput against worker count.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--users", type=int, default=50, help="connected users per worker")
+    parser.add_argument("--messages", type=int, default=2000, help="messages sent per worker")
+    parser.add_argument("--broker", choices=["memory", "redis"], default="redis")
+    parser.add_argument("--redis-url", default=chat_broker.CHAT_REDIS_URL)
+    args = parser.parse_args()
+
+    print(f"{'workers':>8}{'sent':>10}{'delivered':>12}{'received':>10}{'msg/s':>12}")
+    for node_count in args.workers:
+        sent, delivered, received, rate = run(node_count, args)
+        print(f"{node_count:>8}{sent:>10}{delivered / sent:>12.1%}{received:>10}{rate:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
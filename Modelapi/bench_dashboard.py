@@ -0,0 +1,117 @@
+# bench_dashboard.py
+# Query count and latency of /doctor/dashboard-summary's reads against patient count.
+#
+# Usage (seeds and then drops a scratch database):
+#   python bench_dashboard.py --uri mongodb://localhost:27017 [--patients 10 100 300] [--runs 5]
+#
+# Compares the previous per-patient find_one loop with dashboard_queries.dashboard_summary
+# on both of its paths: "fallback" before any patient has a clinical_summary (aggregating
+# the source collections), and "summary" after patient_summaries.backfill, the path
+# production takes. Against Atlas, multiply the query columns by the round-trip time.
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+import motor.motor_asyncio
+from pymongo import monitoring
+
+import dashboard_queries
+import db_indexes
+import patient_summaries
+
+
+class QueryCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        if event.command_name in ("find", "aggregate", "count", "getMore"):
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+async def legacy_summary(users, assessments, cognitive_tests, patient_emails):
+    """The pre-aggregation implementation: two find_one calls per patient."""
+    high_risk_query = {"owner_email": {"$in": patient_emails}, "prediction": {"$in": dashboard_queries.HIGH_RISK_PREDICTIONS}}
+    await assessments.count_documents(high_risk_query)
+    async for patient_doc in users.find({"email": {"$in": patient_emails}}):
+        await assessments.find_one({"owner_email": patient_doc["email"]}, sort=[("created_at", -1)])
+        await cognitive_tests.find_one({"owner_email": patient_doc["email"]}, sort=[("created_at", -1)])
+    await users.find({"email": {"$in": patient_emails}}, {"email": 1, "full_name": 1}).to_list(length=None)
+    await assessments.find(high_risk_query).sort("created_at", -1).limit(5).to_list(length=None)
+
+
+async def seed(db, patients, per_patient):
+    now = datetime.now(timezone.utc)
+    emails = [f"patient{i}@example.com" for i in range(patients)]
+    await db.users.insert_many([{"email": e, "full_name": f"Patient {i}", "role": "patient"} for i, e in enumerate(emails)])
+    predictions = ["Non Demented", "Very Mild Impairment", "Mild Impairment", "Moderate Impairment"]
+    await db.assessments.insert_many([
+        {"owner_email": e, "prediction": predictions[(i + j) % 4], "confidence": 0.9, "created_at": now - timedelta(days=j)}
+        for i, e in enumerate(emails) for j in range(per_patient)
+    ])
+    await db.cognitive_tests.insert_many([
+        {"owner_email": e, "test_type": "mmse", "score": 25, "total_questions": 30, "created_at": now - timedelta(days=j)}
+        for e in emails for j in range(per_patient)
+    ])
+    return emails
+
+
+async def measure(fn, db, emails, counter, runs):
+    times, queries = [], []
+    for _ in range(runs):
+        counter.count = 0
+        start = time.perf_counter()
+        await fn(db.users, db.assessments, db.cognitive_tests, emails)
+        times.append(time.perf_counter() - start)
+        queries.append(counter.count)
+    return statistics.median(queries), statistics.median(times) * 1000
+
+
+async def run(args):
+    counter = QueryCounter()
+    client = motor.motor_asyncio.AsyncIOMotorClient(args.uri, event_listeners=[counter])
+    db = client[args.db]
+    print(
+        f"{'patients':>9}{'legacy queries':>16}{'legacy ms':>11}{'fallback queries':>18}{'fallback ms':>13}"
+        f"{'summary queries':>17}{'summary ms':>12}"
+    )
+    try:
+        for patients in args.patients:
+            await client.drop_database(args.db)
+            await db_indexes.ensure_indexes(db)
+            emails = await seed(db, patients, args.per_patient)
+            legacy = await measure(legacy_summary, db, emails, counter, args.runs)
+            fallback = await measure(dashboard_queries.dashboard_summary, db, emails, counter, args.runs)
+            await patient_summaries.backfill(db)
+            summary = await measure(dashboard_queries.dashboard_summary, db, emails, counter, args.runs)
+            print(
+                f"{patients:>9}{legacy[0]:>16.0f}{legacy[1]:>11.1f}{fallback[0]:>18.0f}{fallback[1]:>13.1f}"
+                f"{summary[0]:>17.0f}{summary[1]:>12.1f}"
+            )
+    finally:
+        await client.drop_database(args.db)
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the doctor dashboard queries.")
+    parser.add_argument("--uri", default=os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="alzAwareDB_bench")
+    parser.add_argument("--patients", type=int, nargs="+", default=[10, 100, 300])
+    parser.add_argument("--per-patient", type=int, default=5, help="Assessments and cognitive tests per patient")
+    parser.add_argument("--runs", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
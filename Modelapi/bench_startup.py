@@ -0,0 +1,51 @@
+# bench_startup.py
+# Startup-time benchmark for the API.
+#
+# Usage:
+#   python bench_startup.py [--runs 3]
+#
+# For each MODEL_LOADING mode, measures in a fresh interpreter how long `import main`
+# takes (what uvicorn waits for before it can accept connections) and, separately,
+# how long building and loading the classifier takes. Needs best_model.pth for the
+# model-load column; MongoDB is not contacted beyond client construction.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+LOAD_SNIPPET = (
+    "import time; t = time.perf_counter(); import inference; t_import = time.perf_counter() - t; "
+    "t = time.perf_counter(); inference.load_model(); print(t_import, time.perf_counter() - t)"
+)
+
+
+def run(snippet, env_overrides):
+    env = {**os.environ, **env_overrides}
+    out = subprocess.run([sys.executable, "-c", snippet], env=env, capture_output=True, text=True, check=True)
+    return [float(x) for x in out.stdout.strip().splitlines()[-1].split()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API import and model load time.")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'MODEL_LOADING':<15}{'import main (s)':>18}")
+    for mode in ["startup", "lazy", "disabled"]:
+        times = [run(IMPORT_SNIPPET, {"MODEL_LOADING": mode})[0] for _ in range(args.runs)]
+        print(f"{mode:<15}{statistics.median(times):>18.3f}")
+
+    try:
+        results = [run(LOAD_SNIPPET, {}) for _ in range(args.runs)]
+    except subprocess.CalledProcessError as e:
+        print(f"\nModel load not measured: {e.stderr.strip().splitlines()[-1]}")
+        return
+    print(f"\nimport inference (torch): {statistics.median(r[0] for r in results):.3f}s")
+    print(f"load_model():             {statistics.median(r[1] for r in results):.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# chat_broker.py
+# Routes chat messages to whichever API worker holds the receiver's WebSocket.
+#
+# Each worker subscribes to one channel per user connected to it and publishes every
+# outgoing message to the receiver's channel. publish() returns how many workers took
+# the message, which is what the sender's `delivered` flag reports.
+#
+# CHAT_BROKER=memory (default) keeps routing inside the process: correct for a single
+# uvicorn worker and for tests. CHAT_BROKER=redis uses Redis pub/sub so any number of
+# workers and nodes share one chat. Pass redis_client= to use a stand-in such as fakeredis.
+#
+# Load test: python bench_chat.py --workers 1 2 4
+
+import asyncio
+import json
+import os
+
+import metrics
+
+CHAT_BROKER = os.getenv("CHAT_BROKER", "memory")
+CHAT_REDIS_URL = os.getenv("CHAT_REDIS_URL", "redis://localhost:6379/0")
+CHANNEL_PREFIX = "alzaware:chat:user:"
+# Pause before reconnecting after the subscriber connection drops
+RESUBSCRIBE_DELAY_SECONDS = 1.0
+
+published = metrics.counter("chat_broker_published_total")
+undelivered = metrics.counter("chat_broker_undelivered_total")
+received = metrics.counter("chat_broker_received_total")
+
+
+class InMemoryBroker:
+    """Single-process broker: publish() hands the message straight to this worker's handler."""
+
+    def __init__(self):
+        self._handler = None
+        self._subscriptions = set()
+
+    async def start(self, handler):
+        self._handler = handler
+
+    async def subscribe(self, email):
+        self._subscriptions.add(email)
+
+    async def unsubscribe(self, email):
+        self._subscriptions.discard(email)
+
+    async def publish(self, email, message):
+        published.inc()
+        if email not in self._subscriptions:
+            undelivered.inc()
+            return 0
+        received.inc()
+        await self._handler(email, message)
+        return 1
+
+    async def close(self):
+        self._subscriptions.clear()
+
+
+class RedisBroker:
+    """Redis pub/sub broker: one channel per connected user, shared by every worker."""
+
+    def __init__(self, redis_client=None, redis_url=CHAT_REDIS_URL):
+        if redis_client is None:
+            import redis.asyncio as redis
+
+            redis_client = redis.from_url(redis_url)
+        self._redis = redis_client
+        self._handler = None
+        self._pubsub = None
+        self._channels = set()
+        self._task = None
+
+    async def start(self, handler):
+        self._handler = handler
+        self._pubsub = self._redis.pubsub()
+        self._task = asyncio.create_task(self._listen())
+
+    async def subscribe(self, email):
+        channel = CHANNEL_PREFIX + email
+        self._channels.add(channel)
+        try:
+            await self._pubsub.subscribe(channel)
+        except Exception as e:
+            # _listen() resubscribes every channel in self._channels once Redis is back
+            print(f"[ERROR] Chat broker could not subscribe {email}: {str(e)}")
+
+    async def unsubscribe(self, email):
+        channel = CHANNEL_PREFIX + email
+        self._channels.discard(channel)
+        try:
+            await self._pubsub.unsubscribe(channel)
+        except Exception as e:
+            print(f"[WARN] Chat broker could not unsubscribe {email}: {str(e)}")
+
+    async def publish(self, email, message):
+        published.inc()
+        try:
+            receivers = await self._redis.publish(CHANNEL_PREFIX + email, json.dumps(message))
+        except Exception as e:
+            # The message is already stored; the receiver sees it in their chat history
+            print(f"[ERROR] Chat broker publish to {email} failed: {str(e)}")
+            receivers = 0
+        if not receivers:
+            undelivered.inc()
+        return receivers
+
+    async def _listen(self):
+        while True:
+            try:
+                if not self._pubsub.subscribed:
+                    # get_message() needs a subscription: either nobody is connected to this
+                    # worker yet, or a (re)subscribe failed while Redis was unreachable
+                    await asyncio.sleep(0.1 if not self._channels else RESUBSCRIBE_DELAY_SECONDS)
+                    if self._channels:
+                        await self._resubscribe()
+                    continue
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[ERROR] Chat broker subscription lost, reconnecting: {str(e)}")
+                await asyncio.sleep(RESUBSCRIBE_DELAY_SECONDS)
+                await self._resubscribe()
+                continue
+            if message is None or message["type"] != "message":
+                continue
+            channel = message["channel"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            received.inc()
+            try:
+                await self._handler(channel[len(CHANNEL_PREFIX):], json.loads(message["data"]))
+            except Exception as e:
+                print(f"[ERROR] Chat broker handler failed for {channel}: {str(e)}")
+
+    async def _resubscribe(self):
+        old, self._pubsub = self._pubsub, self._redis.pubsub()
+        try:
+            await old.reset()
+        except Exception:
+            pass
+        try:
+            if self._channels:
+                await self._pubsub.subscribe(*self._channels)
+        except Exception as e:
+            print(f"[ERROR] Chat broker resubscribe failed: {str(e)}")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.reset()
+            except Exception:
+                pass
+
+
+def create_broker(backend=CHAT_BROKER, redis_client=None, redis_url=CHAT_REDIS_URL):
+    if backend == "memory":
+        return InMemoryBroker()
+    if backend == "redis":
+        return RedisBroker(redis_client=redis_client, redis_url=redis_url)
+    raise ValueError(f"Unknown CHAT_BROKER '{backend}'. Choose 'memory' or 'redis'.")
@@ -0,0 +1,169 @@
+# chat_connections.py
+# This worker's chat WebSockets (see chat_broker.py for routing between workers).
+#
+# A user may hold several sockets (one per tab). Every socket gets a bounded outbound
+# queue drained by its own writer task, so delivering a message never waits on the
+# receiver's network: a slow peer only fills its own queue. When a queue is full the
+# message is dropped (CHAT_SLOW_CONSUMER=drop) or the socket is closed so the client
+# reconnects and reloads history (=disconnect, default).
+#
+# Heartbeats: every CHAT_PING_INTERVAL_SECONDS each socket is sent {"type": "ping"}; the
+# client answers {"type": "pong"}. Sockets silent for longer than the interval plus
+# CHAT_PONG_TIMEOUT_SECONDS are closed, so half-open connections don't pile up.
+
+import asyncio
+import os
+import time
+
+import metrics
+
+CHAT_SEND_QUEUE_SIZE = int(os.getenv("CHAT_SEND_QUEUE_SIZE", "256"))
+CHAT_SLOW_CONSUMER = os.getenv("CHAT_SLOW_CONSUMER", "disconnect")
+CHAT_SEND_TIMEOUT_SECONDS = float(os.getenv("CHAT_SEND_TIMEOUT_SECONDS", "10"))
+CHAT_PING_INTERVAL_SECONDS = float(os.getenv("CHAT_PING_INTERVAL_SECONDS", "20"))
+CHAT_PONG_TIMEOUT_SECONDS = float(os.getenv("CHAT_PONG_TIMEOUT_SECONDS", "20"))
+PING = {"type": "ping"}
+# 1013 try again later for slow consumers and failed sends (clients reconnect),
+# 1001 going away for missed heartbeats
+SLOW_CONSUMER_CLOSE_CODE = 1013
+HEARTBEAT_CLOSE_CODE = 1001
+# Application code for a rejected token: the one close clients must not retry
+AUTH_FAILED_CLOSE_CODE = 4401
+
+connections_open = metrics.gauge("chat_connections")
+users_connected = metrics.gauge("chat_connected_users")
+queued_messages = metrics.gauge("chat_send_queue_depth")
+max_queue_depth = metrics.gauge("chat_send_queue_max_depth")
+messages_dropped = metrics.counter("chat_messages_dropped_total")
+slow_consumers_closed = metrics.counter("chat_slow_consumers_closed_total")
+heartbeats_missed = metrics.counter("chat_heartbeat_timeouts_total")
+send_seconds = metrics.histogram("chat_send_seconds")
+
+
+class ChatConnection:
+    def __init__(self, email, websocket, queue_size):
+        self.email = email
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.last_seen = time.monotonic()
+        self.closed = False
+        self.writer = None
+
+    def touch(self):
+        """Record inbound traffic (any message, pongs included) for the heartbeat."""
+        self.last_seen = time.monotonic()
+
+
+class ConnectionManager:
+    """Manages this worker's WebSocket connections; chat_broker routes messages between workers"""
+
+    def __init__(self, broker, queue_size=CHAT_SEND_QUEUE_SIZE, slow_consumer=CHAT_SLOW_CONSUMER,
+                 ping_interval=CHAT_PING_INTERVAL_SECONDS, pong_timeout=CHAT_PONG_TIMEOUT_SECONDS):
+        if slow_consumer not in ["drop", "disconnect"]:
+            raise ValueError(f"Unknown CHAT_SLOW_CONSUMER '{slow_consumer}'. Choose 'drop' or 'disconnect'.")
+        # {email: {ChatConnection, ...}}
+        self.active_connections: dict[str, set[ChatConnection]] = {}
+        self.broker = broker
+        self.queue_size = queue_size
+        self.slow_consumer = slow_consumer
+        self.ping_interval = ping_interval
+        self.pong_timeout = pong_timeout
+        # Slow-consumer closes in flight (the event loop only keeps weak references to tasks)
+        self._closing = set()
+
+    async def connect(self, email, websocket):
+        """Accept a WebSocket and start its writer; returns the ChatConnection"""
+        await websocket.accept()
+        connection = ChatConnection(email, websocket, self.queue_size)
+        connection.writer = asyncio.create_task(self._write_loop(connection))
+        first = email not in self.active_connections
+        self.active_connections.setdefault(email, set()).add(connection)
+        if first:
+            await self.broker.subscribe(email)
+        connections_open.inc()
+        users_connected.set(len(self.active_connections))
+        print(f"[WebSocket] User {email} connected. Active connections: {connections_open.value}")
+        return connection
+
+    async def disconnect(self, connection):
+        """Forget a connection and stop its writer (safe to call more than once)"""
+        if connection.closed:
+            return
+        connection.closed = True
+        if connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+        queued_messages.dec(connection.queue.qsize())
+        sockets = self.active_connections.get(connection.email)
+        if sockets is not None:
+            sockets.discard(connection)
+            if not sockets:
+                del self.active_connections[connection.email]
+                await self.broker.unsubscribe(connection.email)
+        connections_open.dec()
+        users_connected.set(len(self.active_connections))
+        print(f"[WebSocket] User {connection.email} disconnected. Active connections: {connections_open.value}")
+
+    def send(self, connection, message):
+        """Queue a message on one connection without waiting; False if it was dropped"""
+        if connection.closed:
+            return False
+        try:
+            connection.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            messages_dropped.inc()
+            if self.slow_consumer == "disconnect":
+                print(f"[WARN] Closing slow chat consumer {connection.email}: {self.queue_size} messages queued")
+                slow_consumers_closed.inc()
+                task = asyncio.create_task(self.close(connection, SLOW_CONSUMER_CLOSE_CODE))
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+            return False
+        queued_messages.inc()
+        return True
+
+    async def send_personal_message(self, message, email):
+        """Route a message to the worker(s) holding the user's connections; True if one took it"""
+        return await self.broker.publish(email, message) > 0
+
+    async def deliver_local(self, email, message):
+        """Broker handler: queue a routed message on every connection of the user on this worker"""
+        for connection in list(self.active_connections.get(email, ())):
+            self.send(connection, message)
+
+    async def close(self, connection, code):
+        await self.disconnect(connection)
+        try:
+            await connection.websocket.close(code=code)
+        except Exception:
+            # Already closed by the peer
+            pass
+
+    async def _write_loop(self, connection):
+        try:
+            while True:
+                message = await connection.queue.get()
+                queued_messages.dec()
+                start = time.perf_counter()
+                await asyncio.wait_for(connection.websocket.send_json(message), CHAT_SEND_TIMEOUT_SECONDS)
+                send_seconds.observe(time.perf_counter() - start)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[WebSocket] Error sending to {connection.email}: {e!r}")
+            await self.close(connection, SLOW_CONSUMER_CLOSE_CODE)
+
+    async def heartbeat(self):
+        """Background task: ping every connection and close the ones that stopped answering"""
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            deadline = time.monotonic() - self.ping_interval - self.pong_timeout
+            for sockets in list(self.active_connections.values()):
+                for connection in list(sockets):
+                    if connection.last_seen < deadline:
+                        heartbeats_missed.inc()
+                        await self.close(connection, HEARTBEAT_CLOSE_CODE)
+                    else:
+                        self.send(connection, PING)
+            max_queue_depth.set(max(
+                (c.queue.qsize() for sockets in self.active_connections.values() for c in sockets), default=0
+            ))
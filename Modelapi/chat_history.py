@@ -0,0 +1,140 @@
+# chat_history.py
+# Conversation-keyed chat history.
+#
+# Every message carries `participants` (both emails, sorted) and `conversation_id`
+# (the same pair joined by ":", which no address accepted by EmailStr can contain), so a
+# thread is one indexed range (conversation_id, timestamp, _id) and a user's inbox is
+# one aggregation over the multikey (participants, timestamp) index.
+#
+# History pages (GET /messages/{a}/{b}):
+#   no cursor          newest page; X-Next-Cursor = `before` for the page older than it
+#   ?before=<cursor>   the page older than cursor
+#   ?since=<cursor>    messages newer than cursor, oldest first; X-Next-Cursor = `since`
+#                      for the rest when more than one page arrived
+# The newest page and every `since` page also set X-Latest-Cursor: pass it as `since`
+# on the next sync to fetch only what arrived after it. Messages are stored behind the
+# relay (message_writer.py), possibly out of timestamp order across workers, so the
+# cursor is held back by settle_seconds: the next sync returns the last few seconds'
+# messages again (clients de-duplicate by _id) rather than skip one stored late.
+#
+# Messages stored before conversation_id existed are keyed by running once:
+#   python chat_history.py --uri "mongodb+srv://..." [--db alzAwareDB]
+
+import argparse
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+import pagination
+
+LATEST_CURSOR_HEADER = "X-Latest-Cursor"
+CONVERSATION_SEPARATOR = ":"
+
+
+def participants(email1, email2):
+    return sorted([email1, email2])
+
+
+def conversation_id(email1, email2):
+    return CONVERSATION_SEPARATOR.join(participants(email1, email2))
+
+
+def _settled_cursor(newest, settle_seconds):
+    """Cursor for newest, or for the settle cutoff if newest is more recent than that."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settle_seconds)
+    timestamp = newest["timestamp"]
+    if timestamp.tzinfo is None:
+        # Motor returns naive UTC datetimes
+        cutoff = cutoff.replace(tzinfo=None)
+    if timestamp <= cutoff:
+        return pagination.encode_cursor(newest, "timestamp")
+    # The smallest ObjectId: everything stamped after the cutoff is fetched again
+    return pagination.encode_cursor({"timestamp": cutoff, "_id": ObjectId(b"\x00" * 12)}, "timestamp")
+
+
+async def history_page(collection, conversation, since=None, before=None, limit=pagination.DEFAULT_PAGE_SIZE, projection=None, settle_seconds=0):
+    """
+    One page of a conversation, oldest first.
+
+    Returns:
+        (docs, next_cursor, latest_cursor); latest_cursor is None for `before` pages
+        and when docs is empty
+    """
+    query = {"conversation_id": conversation}
+    if since:
+        docs, next_cursor = await pagination.find_page(collection, query, "timestamp", since, limit, descending=False, projection=projection)
+    else:
+        docs, next_cursor = await pagination.find_page(collection, query, "timestamp", before, limit, projection=projection)
+        docs.reverse()
+    latest_cursor = _settled_cursor(docs[-1], settle_seconds) if docs and not before else None
+    return docs, next_cursor, latest_cursor
+
+
+async def conversations_for(collection, email, limit=pagination.DEFAULT_PAGE_SIZE):
+    """
+    email's conversations, most recent first, each with its last message and the number
+    of messages to email still unread - one aggregation on (participants, timestamp).
+    """
+    pipeline = [
+        {"$match": {"participants": email}},
+        # Equality on participants, so the sort comes straight from the index
+        {"$sort": {"timestamp": -1}},
+        {"$group": {
+            "_id": "$conversation_id",
+            "last_message": {"$first": "$$ROOT"},
+            "unread_count": {"$sum": {"$cond": [
+                {"$and": [{"$eq": ["$receiver_email", email]}, {"$eq": ["$read", False]}]}, 1, 0,
+            ]}},
+        }},
+        {"$sort": {"last_message.timestamp": -1}},
+        {"$limit": max(1, min(limit, pagination.MAX_PAGE_SIZE))},
+    ]
+    conversations = []
+    async for row in collection.aggregate(pipeline):
+        last = row["last_message"]
+        last["_id"] = str(last["_id"])
+        partner = last["receiver_email"] if last["sender_email"] == email else last["sender_email"]
+        conversations.append({
+            "conversation_id": row["_id"],
+            "partner_email": partner,
+            "last_message": last,
+            "unread_count": row["unread_count"],
+        })
+    return conversations
+
+
+async def backfill(db):
+    """Set participants/conversation_id on messages stored without them. Returns messages updated."""
+    sender, receiver = "$sender_email", "$receiver_email"
+    ordered = {"$cond": [{"$lte": [sender, receiver]}, [sender, receiver], [receiver, sender]]}
+    result = await db.messages.update_many({"conversation_id": {"$exists": False}}, [
+        {"$set": {"participants": ordered}},
+        {"$set": {"conversation_id": {"$concat": [
+            {"$arrayElemAt": ["$participants", 0]}, CONVERSATION_SEPARATOR, {"$arrayElemAt": ["$participants", 1]},
+        ]}}},
+    ])
+    return result.modified_count
+
+
+def main():
+    import motor.motor_asyncio
+
+    parser = argparse.ArgumentParser(description="Key stored chat messages by conversation.")
+    parser.add_argument("--uri", default=os.getenv("MONGO_URI"), required=os.getenv("MONGO_URI") is None)
+    parser.add_argument("--db", default="alzAwareDB")
+    args = parser.parse_args()
+
+    async def run():
+        client = motor.motor_asyncio.AsyncIOMotorClient(args.uri)
+        try:
+            return await backfill(client[args.db])
+        finally:
+            client.close()
+
+    print(f"[INFO] Set conversation_id on {asyncio.run(run())} messages.")
+
+
+if __name__ == "__main__":
+    main()
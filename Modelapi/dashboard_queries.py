@@ -0,0 +1,84 @@
+# dashboard_queries.py
+# MongoDB reads behind /doctor/dashboard-summary.
+# A fixed number of queries, issued concurrently, however many patients a doctor has.
+# Latest results come from the clinical_summary each patient's user document carries
+# (see patient_summaries.py); patients whose summary isn't complete yet (history from
+# before summaries existed, not yet backfilled) fall back to one $group aggregation
+# per collection.
+
+import asyncio
+
+HIGH_RISK_PREDICTIONS = ["Moderate Impairment", "Mild Impairment"]
+HIGH_RISK_PREVIEW = 5
+
+
+async def latest_by_owner(collection, owner_emails):
+    """
+    Newest document (by created_at) of each owner in owner_emails, as {owner_email: doc}.
+    The $sort matches the (owner_email, created_at desc) index, so MongoDB can answer
+    the $group/$first with one index seek per owner.
+    """
+    pipeline = [
+        {"$match": {"owner_email": {"$in": owner_emails}}},
+        {"$sort": {"owner_email": 1, "created_at": -1}},
+        {"$group": {"_id": "$owner_email", "doc": {"$first": "$$ROOT"}}},
+    ]
+    latest = {}
+    async for row in collection.aggregate(pipeline):
+        doc = row["doc"]
+        doc["_id"] = str(doc["_id"])
+        latest[row["_id"]] = doc
+    return latest
+
+
+async def dashboard_summary(users, assessments, cognitive_tests, patient_emails):
+    """
+    Raw data for a doctor's dashboard: the patients' user documents (one indexed read)
+    and the high-risk preview, concurrently.
+
+    Returns:
+        dict with high_risk_count, patients (user docs, each with last_mri_result,
+        last_cognitive_score and their clinical_summary aggregates) and high_risk
+        (newest high-risk assessments, each with patient_full_name)
+    """
+    if not patient_emails:
+        return {"high_risk_count": 0, "patients": [], "high_risk": []}
+
+    high_risk_query = {"owner_email": {"$in": patient_emails}, "prediction": {"$in": HIGH_RISK_PREDICTIONS}}
+    patient_docs, high_risk = await asyncio.gather(
+        users.find({"email": {"$in": patient_emails}}).to_list(length=None),
+        assessments.find(high_risk_query).sort("created_at", -1).limit(HIGH_RISK_PREVIEW).to_list(length=None),
+    )
+
+    unsummarized = [doc["email"] for doc in patient_docs if not doc.get("clinical_summary", {}).get("complete")]
+    last_mri, last_cognitive, unsummarized_high_risk = {}, {}, 0
+    if unsummarized:
+        last_mri, last_cognitive, unsummarized_high_risk = await asyncio.gather(
+            latest_by_owner(assessments, unsummarized),
+            latest_by_owner(cognitive_tests, unsummarized),
+            assessments.count_documents({"owner_email": {"$in": unsummarized}, "prediction": {"$in": HIGH_RISK_PREDICTIONS}}),
+        )
+
+    high_risk_count = unsummarized_high_risk
+    name_map = {doc["email"]: doc.get("full_name", "N/A") for doc in patient_docs}
+    for doc in patient_docs:
+        doc["_id"] = str(doc["_id"])
+        summary = doc.pop("clinical_summary", None)
+        if not (summary or {}).get("complete"):
+            # A partial summary only holds what was saved since the rollout
+            doc["last_mri_result"] = last_mri.get(doc["email"])
+            doc["last_cognitive_score"] = last_cognitive.get(doc["email"])
+            continue
+        high_risk_count += summary.get("high_risk_count", 0)
+        doc.update(
+            last_mri_result=summary.get("last_mri_result"),
+            last_cognitive_score=summary.get("last_cognitive_score"),
+            assessment_count=summary.get("assessment_count", 0),
+            cognitive_test_count=summary.get("cognitive_test_count", 0),
+            trend=summary.get("trend"),
+            high_risk=summary.get("high_risk", False),
+        )
+    for doc in high_risk:
+        doc["_id"] = str(doc["_id"])
+        doc["patient_full_name"] = name_map.get(doc["owner_email"], "N/A")
+    return {"high_risk_count": high_risk_count, "patients": patient_docs, "high_risk": high_risk}
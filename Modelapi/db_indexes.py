@@ -0,0 +1,135 @@
+# db_indexes.py
+# MongoDB indexes behind the API's queries, created at startup (see main.lifespan),
+# and a query-plan check that fails if any of those queries falls back to a COLLSCAN.
+#
+# Usage (against a scratch database on a local mongod; mongomock has no query planner):
+#   python db_indexes.py --uri mongodb://localhost:27017 --db alzAwareDB_indexcheck
+# test_db_indexes.py runs the same check under pytest when MONGO_TEST_URI is set.
+#
+# When a new endpoint adds a query, add its index to INDEXES and its shape to QUERY_PLANS.
+
+import argparse
+import asyncio
+import os
+import sys
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+# collection -> indexes; compound keys follow "equality fields first, then the sort field"
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel([("role", ASCENDING), ("_id", ASCENDING)], name="role_id"),
+    ],
+    "assessments": [
+        # _id last: keyset pages order by (sort field, _id), see pagination.py
+        IndexModel([("owner_email", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="owner_created_id"),
+        IndexModel([("heatmap_key", ASCENDING)], name="heatmap_key", sparse=True),
+    ],
+    "cognitive_tests": [
+        IndexModel([("owner_email", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="owner_created_id"),
+    ],
+    "audio_recall_tests": [
+        IndexModel([("owner_email", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="owner_created_id"),
+    ],
+    "notifications": [
+        IndexModel([("user_email", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], name="user_timestamp_id"),
+        IndexModel([("user_email", ASCENDING), ("status", ASCENDING)], name="user_status"),
+    ],
+    "messages": [
+        IndexModel([("conversation_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], name="conversation_timestamp_id"),
+        # multikey: a user's conversations, newest message first (see chat_history.py)
+        IndexModel([("participants", ASCENDING), ("timestamp", DESCENDING)], name="participants_timestamp"),
+        IndexModel([("sender_email", ASCENDING), ("receiver_email", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], name="pair_timestamp_id"),
+    ],
+    "heatmap_jobs": [
+        # TTL: MongoDB removes job documents once expires_at has passed
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+}
+
+HIGH_RISK = {"$in": ["Moderate Impairment", "Mild Impairment"]}
+# (endpoint, collection, filter, sort) for every filtered query in main.py
+QUERY_PLANS = [
+    ("get_current_user / login", "users", {"email": "a@example.com"}, None),
+    ("doctor/patient lists", "users", {"role": "doctor"}, [("_id", 1)]),
+    ("doctor patients", "users", {"email": {"$in": ["a@example.com", "b@example.com"]}}, None),
+    ("GET /assessments/", "assessments", {"owner_email": "a@example.com"}, [("created_at", -1), ("_id", -1)]),
+    ("GET /assessments/high-risk", "assessments", {"owner_email": {"$in": ["a@example.com"]}, "prediction": HIGH_RISK}, [("created_at", -1), ("_id", -1)]),
+    ("dashboard high-risk", "assessments", {"owner_email": {"$in": ["a@example.com"]}, "prediction": HIGH_RISK}, [("created_at", -1)]),
+    ("heatmap sweeper", "assessments", {"heatmap_key": {"$in": ["heatmaps/x.png"]}}, None),
+    ("GET /cognitive-tests/", "cognitive_tests", {"owner_email": "a@example.com"}, [("created_at", -1), ("_id", -1)]),
+    ("GET /cognitive-tests/audio-recall", "audio_recall_tests", {"owner_email": "a@example.com"}, [("created_at", -1), ("_id", -1)]),
+    ("GET /notifications/", "notifications", {"user_email": "a@example.com"}, [("timestamp", -1), ("_id", -1)]),
+    ("PATCH /notifications/mark-read, GET /notifications/unread-count", "notifications", {"user_email": "a@example.com", "status": "unread"}, None),
+    ("GET /messages/{a}/{b}", "messages", {"conversation_id": "a@example.com:b@example.com"}, [("timestamp", -1), ("_id", -1)]),
+    ("GET /messages/{a}/{b}?since=", "messages", {"conversation_id": "a@example.com:b@example.com"}, [("timestamp", 1), ("_id", 1)]),
+    ("GET /messages/conversations", "messages", {"participants": "a@example.com"}, [("timestamp", -1)]),
+    ("PATCH /messages/mark-read", "messages", {"sender_email": "b@example.com", "receiver_email": "a@example.com", "read": False}, None),
+]
+
+
+async def ensure_indexes(db):
+    """Create any missing index in INDEXES (a no-op for ones that already exist)."""
+    for collection, indexes in INDEXES.items():
+        try:
+            await db[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            # e.g. duplicate emails already stored block the unique index; keep the others
+            print(f"[ERROR] Could not create indexes on '{collection}': {str(e)}")
+    print("[INFO] MongoDB indexes ensured.")
+
+
+def _stages(plan):
+    """Every stage name in an explain() plan tree (classic and slot-based engines)."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _stages(value)
+
+
+async def find_collscans(db):
+    """Explain every QUERY_PLANS entry; returns the (endpoint, collection) pairs that COLLSCAN."""
+    offenders = []
+    for endpoint, collection, query, sort in QUERY_PLANS:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        if "COLLSCAN" in _stages(explain["queryPlanner"]["winningPlan"]):
+            offenders.append((endpoint, collection))
+    return offenders
+
+
+async def _check(uri, db_name):
+    import motor.motor_asyncio
+
+    client = motor.motor_asyncio.AsyncIOMotorClient(uri)
+    db = client[db_name]
+    await ensure_indexes(db)
+    offenders = await find_collscans(db)
+    client.close()
+    return offenders
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the API's MongoDB indexes and check query plans for COLLSCANs.")
+    parser.add_argument("--uri", default=os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="alzAwareDB_indexcheck")
+    args = parser.parse_args()
+
+    offenders = asyncio.run(_check(args.uri, args.db))
+    for endpoint, collection in offenders:
+        print(f"[ERROR] COLLSCAN on '{collection}' for {endpoint}")
+    if offenders:
+        sys.exit(1)
+    print(f"[INFO] All {len(QUERY_PLANS)} query shapes use an index.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# export_onnx.py
+# Export best_model.pth to ONNX for the onnxruntime backend (INFERENCE_BACKEND=onnx)
+# and check the exported graph against the PyTorch model.
+#
+# Usage:
+#   python export_onnx.py [--output best_model.onnx] [--samples DIR] [--opset 17]
+#
+# The parity check runs after every export and exits non-zero when onnxruntime and
+# torch disagree, so a broken export never reaches the API.
+
+import argparse
+import json
+import sys
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+import inference
+from inference_backends import build_inference_model, load_sample_tensors
+
+
+class GradCAMExport(nn.Module):
+    """
+    ResNet50 + fc head that also returns the Grad-CAM map of every class.
+
+    For the head avgpool -> Linear -> ReLU -> Dropout -> Linear (eval mode) the gradient
+    of logit c w.r.t. the layer4 activations is the same at every spatial position:
+    (W2[c] * relu'(h)) @ W1 / (H * W). That closed form is what GradCAMEngine gets from
+    autograd, so the exported graph produces identical maps without a backward pass.
+    """
+
+    def __init__(self, split_model):
+        super().__init__()
+        self.backbone = split_model.backbone
+        self.avgpool = split_model.avgpool
+        self.fc1 = split_model.fc[0]
+        self.fc2 = split_model.fc[3]
+
+    def forward(self, x):
+        activations = self.backbone(x)  # (N, 2048, 7, 7)
+        hidden = self.fc1(torch.flatten(self.avgpool(activations), 1))  # (N, 512)
+        logits = self.fc2(torch.relu(hidden))
+        # d logit_c / d pooled for every class: (N, num_classes, 2048)
+        grads = (self.fc2.weight.unsqueeze(0) * (hidden > 0).to(hidden.dtype).unsqueeze(1)) @ self.fc1.weight
+        weights = grads / (activations.shape[2] * activations.shape[3])
+        cams = torch.einsum("nkc,nchw->nkhw", weights, activations)  # before ReLU
+        return logits, cams
+
+
+def export(output_path, opset):
+    ckpt = torch.load(inference.CKPT_PATH, map_location="cpu")
+    inference.device = torch.device("cpu")
+    net = inference.build_network(ckpt)
+    split_model = build_inference_model(net, "eager", None)
+    wrapper = GradCAMExport(split_model).eval()
+
+    dummy = torch.randn(1, 3, 224, 224)
+    torch.onnx.export(
+        wrapper, dummy, output_path,
+        input_names=["input"], output_names=["logits", "cams"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}, "cams": {0: "batch"}},
+        opset_version=opset,
+    )
+
+    import onnx
+    onnx_model = onnx.load(output_path)
+    meta = onnx_model.metadata_props.add()
+    meta.key, meta.value = "class_names", json.dumps(list(ckpt["class_names"]))
+    onnx.save(onnx_model, output_path)
+    print(f"[INFO] Exported ONNX model to {output_path}")
+    return split_model
+
+
+def check_parity(split_model, onnx_path, samples, prob_atol=1e-3):
+    """Compare onnxruntime against torch on the same inputs: probabilities, top-1 and heatmaps."""
+    import onnx_inference
+
+    onnx_inference.CKPT_PATH = onnx_path
+    onnx_inference.load_model()
+    engine = inference.GradCAMEngine(split_model, split_model.backbone, head=split_model.head)
+
+    logits, activations = engine.forward(samples)
+    torch_probs = torch.softmax(logits.detach(), dim=1).numpy()
+    torch_maps = engine.heatmaps(logits, activations, torch_probs.argmax(axis=1).tolist())
+    engine.remove()
+
+    results = onnx_inference.predict_batch([(x, True) for x in samples.numpy()])
+    onnx_pred = np.array([result[0] for result in results])
+    onnx_maps = np.stack([result[2] for result in results])
+    onnx_logits, _ = onnx_inference.session.run(["logits", "cams"], {"input": samples.numpy()})
+    onnx_probs = np.exp(onnx_logits) / np.exp(onnx_logits).sum(axis=1, keepdims=True)
+
+    report = {
+        "samples": len(samples),
+        "top1_agreement": float((onnx_pred == torch_probs.argmax(axis=1)).mean()),
+        "max_prob_diff": float(np.abs(onnx_probs - torch_probs).max()),
+        # heatmaps are uint8; allow off-by-a-few from float rounding and resize differences
+        "max_heatmap_diff": int(np.abs(onnx_maps.astype(np.int16) - torch_maps.astype(np.int16)).max()),
+    }
+    report["ok"] = report["top1_agreement"] == 1.0 and report["max_prob_diff"] <= prob_atol and report["max_heatmap_diff"] <= 8
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the AlzAware classifier to ONNX.")
+    parser.add_argument("--output", default="best_model.onnx")
+    parser.add_argument("--samples", default=inference.SAMPLE_DIR, help="Directory of sample MRIs for the parity check")
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+
+    split_model = export(args.output, args.opset)
+
+    samples = load_sample_tensors(args.samples)
+    if samples is None:
+        print("[WARN] No sample directory given; checking parity on synthetic inputs.")
+        samples = torch.randn(8, 3, 224, 224)
+    report = check_parity(split_model, args.output, samples)
+    print(f"[INFO] Parity check: {report}")
+    if not report["ok"]:
+        print("[ERROR] onnxruntime output does not match torch; do not deploy this export.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
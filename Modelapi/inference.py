@@ -0,0 +1,265 @@
+# inference.py
+# PyTorch inference backend: model loading, Grad-CAM and the blocking batch prediction
+# routine that the API runs inside its inference worker pool. Image validation and
+# overlay rendering live in preprocessing.py (shared with onnx_inference.py).
+# Nothing in here imports FastAPI or MongoDB, so worker processes stay lightweight.
+
+import io
+import os
+import threading
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torchvision import models
+
+from inference_backends import build_inference_model, load_sample_tensors, verify_backend
+from prediction_cache import checkpoint_fingerprint
+# Re-exported so callers can use either backend module interchangeably
+from preprocessing import (
+    InvalidImageError, StudyTooLargeError, iter_study_slices, prepare_image, render_heatmap, study_members,
+    summarize_probabilities,
+)
+
+CKPT_PATH = "best_model.pth"
+
+# Intra-op threads per worker (0 keeps the torch default)
+TORCH_THREADS = int(os.getenv("INFERENCE_TORCH_THREADS", "0"))
+# Backbone execution mode, see inference_backends.BACKENDS
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "eager")
+CHANNELS_LAST = os.getenv("INFERENCE_CHANNELS_LAST", "0") == "1"
+# Sample MRIs used to calibrate int8 and to verify non-eager backends against fp32
+SAMPLE_DIR = os.getenv("INFERENCE_SAMPLE_DIR") or None
+MIN_TOP1_AGREEMENT = float(os.getenv("INFERENCE_MIN_TOP1_AGREEMENT", "0.98"))
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+model = None
+gradcam = None
+class_names = None
+backend_report = None
+
+
+def build_network(ckpt):
+    """Rebuild the fine-tuned ResNet50 from a checkpoint dict, in eval mode on `device`."""
+    # No pretrained weights: every parameter is overwritten by load_state_dict below,
+    # so fetching/reading the ImageNet weights would only slow down startup
+    net = models.resnet50(weights=None)
+    in_features = net.fc.in_features
+    net.fc = nn.Sequential(nn.Linear(in_features, 512), nn.ReLU(inplace=True), nn.Dropout(0.5), nn.Linear(512, len(ckpt["class_names"])))
+    net.load_state_dict(ckpt["model_state"])
+    net = net.to(device)
+    net.eval()
+    # Inference only: Grad-CAM differentiates w.r.t. activations, never the weights
+    net.requires_grad_(False)
+    return net
+
+
+def load_model():
+    """Load the classifier from CKPT_PATH into the module globals."""
+    global model, gradcam, class_names, backend_report
+    if TORCH_THREADS > 0:
+        torch.set_num_threads(TORCH_THREADS)
+    if not os.path.exists(CKPT_PATH):
+        raise FileNotFoundError(f"Model checkpoint not found at: {CKPT_PATH}.")
+    # Read once: the fingerprint must describe exactly the bytes that get loaded
+    with open(CKPT_PATH, "rb") as f:
+        data = f.read()
+    ckpt = torch.load(io.BytesIO(data), map_location=device)
+    class_names = ckpt["class_names"]
+    net = build_network(ckpt)
+    model, backend_report = select_backend(net)
+    backend_report = {**backend_report, "checkpoint": checkpoint_fingerprint(data)}
+    # Hook the backbone output, i.e. the last convolutional layer (layer4 in ResNet50)
+    gradcam = GradCAMEngine(model, model.backbone, head=model.head)
+    print(f"[INFO] Model loaded and ready (pid {os.getpid()}, backend {backend_report['backend']}).")
+
+
+def select_backend(net):
+    """
+    Build the configured INFERENCE_BACKEND and check it against the fp32 eager model.
+    Falls back to eager if top-1 agreement on the sample set is below MIN_TOP1_AGREEMENT.
+    """
+    reference = build_inference_model(net, "eager", None)
+    if INFERENCE_BACKEND == "eager" and not CHANNELS_LAST:
+        return reference, {"backend": "eager"}
+
+    samples = load_sample_tensors(SAMPLE_DIR)
+    if samples is None:
+        if INFERENCE_BACKEND == "int8":
+            raise ValueError("INFERENCE_SAMPLE_DIR must point at sample MRIs to calibrate the int8 backend.")
+        print("[WARN] No INFERENCE_SAMPLE_DIR; verifying the inference backend on synthetic inputs.")
+        samples = torch.randn(8, 3, 224, 224)
+    samples = samples.to(device)
+
+    start = time.perf_counter()
+    candidate = build_inference_model(net, INFERENCE_BACKEND, samples, channels_last=CHANNELS_LAST)
+    report = {"backend": INFERENCE_BACKEND, "channels_last": CHANNELS_LAST, "build_seconds": round(time.perf_counter() - start, 3)}
+    report.update(verify_backend(reference, candidate, samples))
+    print(f"[INFO] Inference backend check: {report}")
+
+    if report["top1_agreement"] < MIN_TOP1_AGREEMENT:
+        print(f"[WARN] Backend '{INFERENCE_BACKEND}' agrees with fp32 on only {report['top1_agreement']:.1%} of samples; using eager.")
+        return reference, {**report, "backend": "eager", "rejected_backend": INFERENCE_BACKEND}
+    return candidate, report
+
+
+def describe_backend():
+    """Backend details reported by /health/ready (called in the worker that loaded the model)."""
+    return {**backend_report, "class_names": list(class_names)}
+
+
+def init_worker():
+    """Process-pool initializer: every worker process loads its own copy of the model."""
+    load_model()
+
+
+# -------------------
+# Grad-CAM Helper Functions
+# -------------------
+
+class GradCAMEngine:
+    """
+    Grad-CAM for a model whose forward hook stays attached for the life of the process.
+
+    The hook only acts while the calling thread has armed it, so worker threads can share
+    one model. Captured activations are detached and fed back into the network as a leaf
+    tensor, so the backward pass from the logits stops at the target layer instead of
+    walking the whole backbone.
+    """
+
+    def __init__(self, model, target_layer, head):
+        self.model = model
+        # Maps target-layer activations to logits (everything after the hooked layer)
+        self.head = head
+        self._local = threading.local()
+        self._handle = target_layer.register_forward_hook(self._forward_hook)
+
+    def _forward_hook(self, module, input, output):
+        if not getattr(self._local, "armed", False):
+            return None
+        activations = output.detach().requires_grad_(True)
+        self._local.activations = activations
+        return activations
+
+    def forward(self, img_tensor):
+        """
+        Run one forward pass and capture the target layer's feature maps.
+
+        Args:
+            img_tensor: Input image tensor (N, 3, 224, 224)
+
+        Returns:
+            (logits, activations): (N, num_classes) logits and (N, 2048, 7, 7) feature maps
+        """
+        self._local.armed = True
+        try:
+            with torch.enable_grad():
+                logits = self.model(img_tensor)
+            activations = self._local.activations
+        finally:
+            self._local.armed = False
+            self._local.activations = None
+        return logits, activations
+
+    def heatmaps(self, logits, activations, target_classes, size=(224, 224)):
+        """
+        Grad-CAM heatmaps for a whole batch with one backward pass.
+
+        Args:
+            logits, activations: Output of forward() for the same batch
+            target_classes: Index of the class to explain, one per image
+            size: (height, width) of the returned heatmaps
+
+        Returns:
+            heatmaps: uint8 numpy array (N, height, width) with values 0-255
+        """
+        # Samples are independent in eval mode, so summing their target scores
+        # gives every image its own gradient in a single backward pass
+        rows = torch.arange(len(target_classes), device=logits.device)
+        target = logits[rows, torch.as_tensor(target_classes, device=logits.device)].sum()
+        (gradients,) = torch.autograd.grad(target, activations)
+
+        # Global average pooling of gradients, then the channel-weighted sum as one contraction
+        weights = gradients.mean(dim=(2, 3))  # (N, 2048)
+        cam = torch.relu(torch.einsum("nc,nchw->nhw", weights, activations.detach()))  # (N, 7, 7)
+
+        # Normalize each map to 0-1 (all-zero maps stay zero)
+        peak = cam.amax(dim=(1, 2), keepdim=True)
+        cam = cam / peak.clamp_min(1e-12)
+
+        cam = F.interpolate(cam.unsqueeze(1), size=size, mode="bilinear", align_corners=False).squeeze(1)
+        return (255 * cam.clamp(0, 1)).to(torch.uint8).cpu().numpy()
+
+    def heatmaps_from_activations(self, activations, target_classes, size=(224, 224)):
+        """
+        Grad-CAM heatmaps from activations saved by an earlier forward() call.
+        Only the head is re-run, so a deferred heatmap costs no extra backbone pass.
+        """
+        activations = activations.detach().requires_grad_(True)
+        with torch.enable_grad():
+            logits = self.head(activations)
+        return self.heatmaps(logits, activations, target_classes, size)
+
+    def remove(self):
+        self._handle.remove()
+
+
+# -------------------
+# Prediction stages (run inside the inference worker pool)
+# -------------------
+# /predict is split so the forward pass can be micro-batched across requests:
+# prepare_image -> predict_batch (many uploads at once, probabilities and Grad-CAM
+# from one forward pass) -> render_heatmap. Only predict_batch needs torch.
+
+def predict_batch(items):
+    """
+    Classify a batch from a single forward pass.
+
+    Args:
+        items: List of (img_input, with_heatmap) tuples, img_input being a (3, 224, 224) array
+
+    Returns:
+        One (pred_idx, summary, heatmap, activations, probs) tuple per item, in order.
+        Items that asked for a heatmap get it from the same pass; the others get
+        their layer4 activations instead, for render_deferred_heatmap. probs is the
+        raw softmax row as a list of floats.
+    """
+    batch = torch.from_numpy(np.stack([img_input for img_input, _ in items])).to(device)
+    logits, activations = gradcam.forward(batch)
+    probs = torch.softmax(logits.detach(), dim=1).cpu().numpy()
+    summaries = [summarize_probabilities(row, class_names) for row in probs]
+
+    heatmaps = [None] * len(items)
+    wanted = [i for i, (_, with_heatmap) in enumerate(items) if with_heatmap]
+    if wanted:
+        try:
+            if len(wanted) == len(items):
+                maps = gradcam.heatmaps(logits, activations, [summaries[i][0] for i in wanted])
+            else:
+                maps = gradcam.heatmaps_from_activations(activations[wanted], [summaries[i][0] for i in wanted])
+            for i, heatmap in zip(wanted, maps):
+                heatmaps[i] = heatmap
+        except Exception as e:
+            print(f"[ERROR] Failed to generate heatmap: {str(e)}")
+
+    results = []
+    for i, ((pred_idx, summary), heatmap) in enumerate(zip(summaries, heatmaps)):
+        # clone() so a process worker pickles one sample, not the whole batch storage
+        saved = None if items[i][1] else activations[i].detach().clone()
+        results.append((pred_idx, summary, heatmap, saved, probs[i].tolist()))
+    return results
+
+
+def render_deferred_heatmap(overlay_base, activations, pred_idx):
+    """
+    Build the Grad-CAM overlay for a prediction that was returned without one.
+    Returns render_heatmap's (key, data, content_type), or None if rendering failed.
+    """
+    try:
+        heatmap = gradcam.heatmaps_from_activations(activations.unsqueeze(0).to(device), [pred_idx])[0]
+    except Exception as e:
+        print(f"[ERROR] Failed to generate heatmap: {str(e)}")
+        return None
+    return render_heatmap(overlay_base, heatmap)
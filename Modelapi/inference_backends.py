@@ -0,0 +1,122 @@
+# inference_backends.py
+# Selectable CPU inference backends for the ResNet50 classifier.
+#
+# The network is split into a backbone (conv1..layer4) and a head (avgpool + fc).
+# Only the backbone - where nearly all of the compute is - gets traced, compiled or
+# quantized; the head stays eager fp32 so Grad-CAM can still differentiate the logits
+# with respect to the layer4 activations.
+
+import copy
+import os
+
+import torch
+import torch.nn as nn
+
+from preprocessing import decode_image, to_model_input
+
+# eager | torchscript | compile | int8
+BACKENDS = ("eager", "torchscript", "compile", "int8")
+SAMPLE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+class BackboneWrapper(nn.Module):
+    """Plain nn.Module around a (possibly scripted or compiled) backbone so Python forward hooks still fire."""
+
+    def __init__(self, module):
+        super().__init__()
+        self.module = module
+
+    def forward(self, x):
+        return self.module(x)
+
+
+class SplitResNet(nn.Module):
+    def __init__(self, backbone, avgpool, fc, channels_last=False):
+        super().__init__()
+        self.backbone = BackboneWrapper(backbone)
+        self.avgpool = avgpool
+        self.fc = fc
+        self.channels_last = channels_last
+
+    def forward(self, x):
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
+        return self.head(self.backbone(x))
+
+    def head(self, activations):
+        """Logits from layer4 activations (N, 2048, 7, 7)."""
+        return self.fc(torch.flatten(self.avgpool(activations), 1))
+
+
+def resnet_backbone(net):
+    return nn.Sequential(net.conv1, net.bn1, net.relu, net.maxpool, net.layer1, net.layer2, net.layer3, net.layer4)
+
+
+def load_sample_tensors(sample_dir, limit=64):
+    """Preprocessed (N, 3, 224, 224) batch from the images in sample_dir, or None if there are none."""
+    if not sample_dir or not os.path.isdir(sample_dir):
+        return None
+    tensors = []
+    for name in sorted(os.listdir(sample_dir)):
+        if not name.lower().endswith(SAMPLE_EXTENSIONS):
+            continue
+        with open(os.path.join(sample_dir, name), "rb") as f:
+            tensors.append(torch.from_numpy(to_model_input(decode_image(f.read()))))
+        if len(tensors) >= limit:
+            break
+    return torch.stack(tensors) if tensors else None
+
+
+def build_inference_model(net, backend, samples, channels_last=False):
+    """
+    Wrap an eval-mode fp32 ResNet50 into a SplitResNet using the given backend.
+
+    Args:
+        net: The loaded torchvision ResNet50 (custom fc head included)
+        backend: One of BACKENDS
+        samples: (N, 3, 224, 224) tensor used for tracing and int8 calibration
+        channels_last: Run the backbone in NHWC memory format
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}'. Choose one of: {', '.join(BACKENDS)}.")
+
+    backbone = resnet_backbone(net)
+    if backend != "eager":
+        backbone = copy.deepcopy(backbone)
+    if channels_last:
+        backbone = backbone.to(memory_format=torch.channels_last)
+        samples = samples.contiguous(memory_format=torch.channels_last)
+
+    if backend == "torchscript":
+        with torch.no_grad():
+            traced = torch.jit.trace(backbone, samples[:1])
+            backbone = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+    elif backend == "compile":
+        backbone = torch.compile(backbone)
+    elif backend == "int8":
+        # Static post-training quantization; dynamic quantization would only touch nn.Linear
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+        if samples.device.type != "cpu":
+            raise ValueError("The int8 backend only runs on CPU.")
+        torch.backends.quantized.engine = "x86"
+        prepared = prepare_fx(backbone, get_default_qconfig_mapping("x86"), example_inputs=(samples[:1],))
+        with torch.no_grad():
+            for batch in samples.split(8):
+                prepared(batch)
+        backbone = convert_fx(prepared)
+
+    return SplitResNet(backbone, net.avgpool, net.fc, channels_last=channels_last).eval()
+
+
+def verify_backend(reference, candidate, samples):
+    """Compare a candidate backend with the fp32 reference: top-1 agreement and max probability drift."""
+    with torch.no_grad():
+        ref_probs = torch.softmax(reference(samples), dim=1)
+        cand_probs = torch.softmax(candidate(samples), dim=1)
+    return {
+        "samples": len(samples),
+        "top1_agreement": float((ref_probs.argmax(dim=1) == cand_probs.argmax(dim=1)).float().mean()),
+        "max_prob_drift": float((ref_probs - cand_probs).abs().max()),
+    }
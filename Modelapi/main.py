@@ -1,29 +1,43 @@
-import io
+import asyncio
+import heapq
+import importlib
 import os
+import socket
+import time
 import uuid
-from PIL import Image
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import asynccontextmanager
 from typing import Annotated, Optional, List
-from datetime import datetime, timezone
-import shutil
+from datetime import datetime, timedelta, timezone
 import certifi
-import numpy as np
-import cv2 # <-- ADDED THIS IMPORT
 from difflib import SequenceMatcher
 
-import torch
-import torch.nn as nn
-from fastapi import FastAPI, File, UploadFile, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, File, UploadFile, Depends, HTTPException, Response, status, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from fastapi.staticfiles import StaticFiles
-from torchvision import models, transforms
-from torchvision.models import ResNet50_Weights
 from pydantic import BaseModel, EmailStr, Field
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 from jose import JWTError, jwt
 
+import chat_broker
+from chat_connections import AUTH_FAILED_CLOSE_CODE, ConnectionManager
+from message_writer import MessageWriter
+import metrics
+import storage
+import upload_limits
+from batching import MicroBatcher
+from prediction_cache import PredictionCache, hash_upload
+from user_cache import USER_CACHE_BACKEND, USER_CACHE_REDIS_URL, USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS, UserCache
+
 # --- MongoDB Imports ---
 import motor.motor_asyncio
+import chat_history
+import dashboard_queries
+import db_indexes
+import pagination
+import patient_summaries
 import security
 
 # -------------------
@@ -44,6 +58,8 @@ cognitive_test_collection = db.get_collection("cognitive_tests")
 audio_recall_collection = db.get_collection("audio_recall_tests")
 notification_collection = db.get_collection("notifications")
 messages_collection = db.get_collection("messages")
+lease_collection = db.get_collection("leases")
+heatmap_job_collection = db.get_collection("heatmap_jobs")
 
 # -------------------
 # 2. Pydantic Schemas
@@ -80,9 +96,13 @@ class UserPublic(BaseModel):
     pending_patients: Optional[List[dict]] = None
     professional_details: Optional[DoctorProfessionalDetails] = None
 
+# User list endpoints skip the embedded request arrays (and never fetch passwords)
+USER_LIST_PROJECTION = pagination.projection_for(UserPublic, exclude=("doctor_requests", "pending_patients"))
+
 class AssessmentCreate(BaseModel):
     prediction: str
     confidence: float
+    heatmap_url: Optional[str] = None
 
 class AssessmentPublic(BaseModel):
     id: str = Field(alias="_id")
@@ -90,6 +110,7 @@ class AssessmentPublic(BaseModel):
     confidence: float
     created_at: datetime
     owner_email: str
+    heatmap_url: Optional[str] = None
 
 class HighRiskAssessmentPublic(AssessmentPublic):
     patient_full_name: str
@@ -214,10 +235,22 @@ class NotificationPublic(BaseModel):
     class Config:
         populate_by_name = True
 
+# --- Heatmap Job Schemas ---
+class HeatmapJobPublic(BaseModel):
+    job_id: str
+    status: str  # 'pending', 'running', 'done', 'failed'
+    heatmap_url: Optional[str] = None
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+
 # --- Schemas for the Doctor Dashboard ---
 class PatientSummary(UserPublic):
     last_mri_result: Optional[AssessmentPublic] = None
     last_cognitive_score: Optional[CognitiveTestResultPublic] = None
+    assessment_count: Optional[int] = None
+    cognitive_test_count: Optional[int] = None
+    trend: Optional[str] = None
+    high_risk: Optional[bool] = None
 
 class DoctorDashboardData(BaseModel):
     total_patients: int
@@ -241,10 +274,26 @@ class MessagePublic(BaseModel):
     class Config:
         populate_by_name = True
 
+class ConversationSummary(BaseModel):
+    conversation_id: str
+    partner_email: str
+    partner_full_name: Optional[str] = None
+    last_message: MessagePublic
+    unread_count: int = 0
+
 # -------------------
 # 3. Authentication Setup
 # -------------------
 
+# Authenticated users, see user_cache.py; every endpoint that writes a user document
+# must invalidate that user's entry
+user_cache = UserCache(
+    backend=USER_CACHE_BACKEND,
+    ttl_seconds=USER_CACHE_TTL_SECONDS,
+    max_entries=USER_CACHE_SIZE,
+    redis_url=USER_CACHE_REDIS_URL,
+)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
@@ -261,9 +310,14 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
     except JWTError:
         raise credentials_exception
     
-    user = await user_collection.find_one({"email": email})
+    user = await user_cache.get(email)
     if user is None:
-        raise credentials_exception
+        # The clinical summary changes on every saved result and no endpoint reads it from here;
+        # the password hash is only ever checked by /token, which reads the user itself
+        user = await user_collection.find_one({"email": email}, {"clinical_summary": 0, "hashed_password": 0})
+        if user is None:
+            raise credentials_exception
+        await user_cache.put(email, user)
     return user
 
 async def require_doctor(current_user: Annotated[dict, Depends(get_current_user)]):
@@ -271,151 +325,434 @@ async def require_doctor(current_user: Annotated[dict, Depends(get_current_user)
         raise HTTPException(status_code=403, detail="Only doctors can access this resource")
     return current_user
 
+async def is_assigned_patient(doctor: dict, patient_email: str) -> bool:
+    """
+    Whether patient_email is assigned to the doctor. The cached user can lag an assignment
+    made on another worker (memory cache) by up to USER_CACHE_TTL_SECONDS, so a miss is
+    confirmed against MongoDB before access is denied.
+    """
+    if patient_email in doctor.get("assigned_patients", []):
+        return True
+    return await user_collection.count_documents({"_id": doctor["_id"], "assigned_patients": patient_email}, limit=1) > 0
+
 # -------------------
 # 4. App & Middleware Setup
 # -------------------
 
-app = FastAPI(title="AlzAware API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if os.getenv("DB_ENSURE_INDEXES", "1") == "1":
+        try:
+            await db_indexes.ensure_indexes(db)
+        except Exception as e:
+            # Serve anyway (just slower) if the cluster is briefly unreachable at boot
+            print(f"[ERROR] Failed to ensure MongoDB indexes: {str(e)}")
+    if MODEL_LOADING == "startup":
+        # Don't hold up startup: the API serves everything else while the model loads
+        start_model_loading()
+    heatmap_workers = [asyncio.create_task(heatmap_job_worker()) for _ in range(HEATMAP_JOB_WORKERS)]
+    if HEATMAP_SWEEPER_ENABLED:
+        heatmap_workers.append(asyncio.create_task(heatmap_sweeper()))
+    message_writer.start()
+    await manager.broker.start(manager.deliver_local)
+    chat_heartbeat = asyncio.create_task(manager.heartbeat())
+    yield
+    chat_heartbeat.cancel()
+    await asyncio.gather(chat_heartbeat, return_exceptions=True)
+    await manager.broker.close()
+    # After the sockets stop feeding it: store every chat message still buffered
+    await message_writer.close()
+    for task in heatmap_workers:
+        task.cancel()
+    await asyncio.gather(*heatmap_workers, return_exceptions=True)
+    if predict_batcher is not None:
+        await predict_batcher.close()
+    if inference_pool is not None:
+        inference_pool.shutdown(wait=True, cancel_futures=True)
+
+app = FastAPI(title="AlzAware API", lifespan=lifespan)
 
 os.makedirs("uploads", exist_ok=True)
 os.makedirs("uploads/heatmaps", exist_ok=True)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Set SERVE_UPLOADS=0 when a reverse proxy or CDN serves uploads/ (see storage.py),
+# so static file traffic doesn't compete with the API workers
+if os.getenv("SERVE_UPLOADS", "1") == "1":
+    app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
+# Added before CORS so 413s sent by the size limit still carry CORS headers
+app.add_middleware(
+    upload_limits.BodySizeLimitMiddleware,
+    limits={
+        "/predict": upload_limits.MRI_UPLOAD_MAX_BYTES + upload_limits.MULTIPART_OVERHEAD_BYTES,
+        "/predict/batch": upload_limits.STUDY_UPLOAD_MAX_BYTES + upload_limits.MULTIPART_OVERHEAD_BYTES,
+        "/users/me/photo": upload_limits.PHOTO_UPLOAD_MAX_BYTES + upload_limits.MULTIPART_OVERHEAD_BYTES,
+    },
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[pagination.NEXT_CURSOR_HEADER, chat_history.LATEST_CURSOR_HEADER],
 )
 
 # -------------------
-# 5. AI Model Loading
+# 5. AI Model & Inference Worker Pool
 # -------------------
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-ckpt_path = "best_model.pth"
-if not os.path.exists(ckpt_path):
-    raise FileNotFoundError(f"Model checkpoint not found at: {ckpt_path}.")
-ckpt = torch.load(ckpt_path, map_location=device)
-class_names = ckpt["class_names"]
-weights = ResNet50_Weights.IMAGENET1K_V2
-model = models.resnet50(weights=weights)
-in_features = model.fc.in_features
-model.fc = nn.Sequential(nn.Linear(in_features, 512), nn.ReLU(inplace=True), nn.Dropout(0.5), nn.Linear(512, len(class_names)))
-model.load_state_dict(ckpt["model_state"])
-model = model.to(device)
-model.eval()
-eval_transforms = transforms.Compose([transforms.Resize(256), transforms.CenterCrop(224), transforms.ToTensor(), transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])])
-
-print("[INFO] Model loaded and ready.")
-print("[INFO] Connected to MongoDB Atlas.")
+# Model work (decode, validation, forward pass, Grad-CAM) is CPU-bound and must never
+# run on the event loop, otherwise /token, chat and dashboards stall behind an upload.
+# `inference` is the PyTorch backend module, or onnx_inference when INFERENCE_BACKEND=onnx.
+# INFERENCE_EXECUTOR="thread" shares one model between threads (torch releases the GIL);
+# "process" loads a private copy of the model in every worker process.
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "eager")
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+# Uploads scored together in one forward pass, and how long to wait for a batch to fill
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "8"))
+INFERENCE_BATCH_WAIT_MS = float(os.getenv("INFERENCE_BATCH_WAIT_MS", "5"))
+# Requests allowed to wait beyond what the workers can hold before /predict answers 503
+INFERENCE_MAX_QUEUE = int(os.getenv("INFERENCE_MAX_QUEUE", "8"))
+INFERENCE_RETRY_AFTER = int(os.getenv("INFERENCE_RETRY_AFTER", "5"))
+# /predict/batch limits: slices per study (across all files and archives) and bytes per slice
+PREDICT_BATCH_MAX_SLICES = int(os.getenv("PREDICT_BATCH_MAX_SLICES", "256"))
+PREDICT_BATCH_MAX_SLICE_BYTES = int(os.getenv("PREDICT_BATCH_MAX_SLICE_BYTES", str(20 * 1024 * 1024)))
+# ...and expanded bytes per study, so a small archive of highly compressible members can't balloon
+PREDICT_BATCH_MAX_EXPANDED_BYTES = int(os.getenv("PREDICT_BATCH_MAX_EXPANDED_BYTES", str(upload_limits.STUDY_UPLOAD_MAX_BYTES)))
+# When the model is loaded: "startup" (in the background once the server is up),
+# "lazy" (on the first /predict) or "disabled" (chat/dashboard-only workers never import torch)
+MODEL_LOADING = os.getenv("MODEL_LOADING", "startup")
+
+# Set once the model is loaded, see ensure_model_loaded()
+inference = None
+inference_pool = None
+predict_batcher = None
+model_state = {"status": "disabled" if MODEL_LOADING == "disabled" else "not_loaded", "backend": None, "load_seconds": None, "error": None}
+_model_loading_task = None
+
+inference_in_flight = metrics.gauge("inference_in_flight")
+inference_rejected = metrics.counter("inference_rejected_total")
+
+def _load_inference_backend():
+    """Blocking: import the backend module, start the worker pool and load the model."""
+    module = importlib.import_module("onnx_inference" if INFERENCE_BACKEND == "onnx" else "inference")
+    if INFERENCE_EXECUTOR == "process":
+        pool = ProcessPoolExecutor(max_workers=INFERENCE_WORKERS, initializer=module.init_worker)
+        # Waits for a worker to spawn and finish loading, so "ready" means ready
+        report = pool.submit(module.describe_backend).result()
+    else:
+        module.load_model()
+        pool = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+        report = module.describe_backend()
+    return module, pool, report
+
+async def _load_model():
+    global inference, inference_pool, predict_batcher, _model_loading_task
+    model_state.update(status="loading", error=None)
+    start = time.perf_counter()
+    try:
+        module, pool, report = await asyncio.to_thread(_load_inference_backend)
+    except Exception as e:
+        print(f"[ERROR] Model failed to load: {str(e)}")
+        model_state.update(status="failed", error=str(e))
+        # Let the next /predict retry, e.g. once best_model.pth has been copied in
+        _model_loading_task = None
+        raise
+    inference, inference_pool = module, pool
+    # Sits between /predict and the model: concurrent uploads share one batched forward pass
+    predict_batcher = MicroBatcher(
+        inference.predict_batch,
+        run_in_inference_pool,
+        max_batch_size=INFERENCE_BATCH_SIZE,
+        max_wait_ms=INFERENCE_BATCH_WAIT_MS,
+        concurrency=INFERENCE_WORKERS,
+        name="predict_batch",
+    )
+    # Scope the prediction cache to the checkpoint this process actually loaded
+    await asyncio.to_thread(prediction_cache.set_version, report["checkpoint"])
+    model_state.update(status="ready", backend=report, load_seconds=round(time.perf_counter() - start, 3))
+    metrics.gauge("model_load_seconds").set(model_state["load_seconds"])
+    print(f"[INFO] Model ready in {model_state['load_seconds']}s.")
+
+def start_model_loading():
+    global _model_loading_task
+    if _model_loading_task is None:
+        _model_loading_task = asyncio.create_task(_load_model())
+    return _model_loading_task
+
+async def ensure_model_loaded():
+    """Wait until the model is loaded, starting the load if nobody has yet."""
+    if MODEL_LOADING == "disabled":
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="This API worker does not serve predictions.",
+        )
+    if model_state["status"] == "ready":
+        return
+    try:
+        # shield: a client disconnecting must not cancel the load for everyone else
+        await asyncio.shield(start_model_loading())
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The analysis model is not available. Please retry shortly.",
+            headers={"Retry-After": str(INFERENCE_RETRY_AFTER)},
+        )
+
+async def run_in_inference_pool(fn, *args):
+    """Run a blocking inference function in the worker pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_pool, fn, *args)
+
+@asynccontextmanager
+async def inference_admission(weight=1):
+    """
+    Admit a request into the inference pipeline; weight is how many slices it scores at once.
+    Raises 503 with Retry-After once the workers and the wait queue are full.
+    """
+    if inference_in_flight.value + weight > INFERENCE_WORKERS * INFERENCE_BATCH_SIZE + INFERENCE_MAX_QUEUE:
+        inference_rejected.inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The analysis service is busy. Please retry shortly.",
+            headers={"Retry-After": str(INFERENCE_RETRY_AFTER)},
+        )
+    inference_in_flight.inc(weight)
+    try:
+        yield
+    finally:
+        inference_in_flight.dec(weight)
+
+async def store_heatmap(rendered) -> Optional[str]:
+    """
+    Store an overlay from render_heatmap/render_deferred_heatmap and return its URL once the
+    object can be fetched, so clients never get a link that 404s. None if rendering or the write failed.
+    """
+    if rendered is None:
+        return None
+    try:
+        return await asyncio.wrap_future(storage.put_async(*rendered))
+    except Exception:
+        # Already logged by the storage writer
+        return None
 
 # -------------------
-# 5b. Grad-CAM Helper Function
+# 5b. Deferred Heatmap Jobs
 # -------------------
+# /predict?heatmap=deferred answers with the class and confidence straight away and
+# queues the Grad-CAM overlay here; clients poll GET /heatmaps/{job_id} for the URL.
+# Job state lives in MongoDB so the poll can reach any API worker; the render itself
+# runs in the worker that accepted the job, which holds the activations. Job documents
+# expire HEATMAP_JOB_TTL_SECONDS after they were last updated (TTL index on expires_at).
+# Queued jobs run after inference_admission is released, so the queue is bounded:
+# once full, results come back with heatmap_job_id None.
+HEATMAP_JOB_WORKERS = int(os.getenv("HEATMAP_JOB_WORKERS", "1"))
+HEATMAP_JOB_TTL_SECONDS = int(os.getenv("HEATMAP_JOB_TTL_SECONDS", "3600"))
+HEATMAP_JOB_QUEUE_SIZE = int(os.getenv("HEATMAP_JOB_QUEUE_SIZE", "64"))
+
+heatmap_job_queue: asyncio.Queue = asyncio.Queue(maxsize=HEATMAP_JOB_QUEUE_SIZE)
+heatmap_jobs_pending = metrics.gauge("heatmap_jobs_pending")
+heatmap_jobs_rejected = metrics.counter("heatmap_jobs_rejected_total")
+
+async def update_heatmap_job(job_id, **fields):
+    now = datetime.now(timezone.utc)
+    await heatmap_job_collection.update_one(
+        {"_id": job_id}, {"$set": {**fields, "expires_at": now + timedelta(seconds=HEATMAP_JOB_TTL_SECONDS)}}
+    )
 
-def generate_gradcam_heatmap(model, img_tensor, target_class):
+async def enqueue_heatmap_job(overlay_base, activations, pred_idx, cache_digest=None, result=None) -> Optional[str]:
     """
-    Generate Grad-CAM heatmap for the given image tensor.
-    
-    Args:
-        model: The ResNet50 model
-        img_tensor: Input image tensor (1, 3, 224, 224)
-        target_class: Index of the predicted class
-    
-    Returns:
-        heatmap: Numpy array of the heatmap (0-255)
+    Queue a deferred Grad-CAM render and return its job id, or None if the queue is full.
+    If cache_digest is given, the cached prediction gains the heatmap_url once rendered.
     """
-    # Get the last convolutional layer (layer4 in ResNet50)
-    target_layer = model.layer4[-1]
-    
-    # Hook to capture feature maps and gradients
-    feature_maps = []
-    gradients = []
-    
-    def forward_hook(module, input, output):
-        feature_maps.append(output)
-    
-    def backward_hook(module, grad_input, grad_output):
-        gradients.append(grad_output[0])
-    
-    # Register hooks
-    forward_handle = target_layer.register_forward_hook(forward_hook)
-    backward_handle = target_layer.register_full_backward_hook(backward_hook)
-    
-    # Forward pass
-    model.zero_grad()
-    output = model(img_tensor)
-    
-    # Backward pass for the target class
-    target = output[0, target_class]
-    target.backward()
-    
-    # Remove hooks
-    forward_handle.remove()
-    backward_handle.remove()
-    
-    # Get feature maps and gradients
-    feature_map = feature_maps[0].cpu().detach().numpy()[0]  # (2048, 7, 7)
-    gradient = gradients[0].cpu().detach().numpy()[0]  # (2048, 7, 7)
-    
-    # Global average pooling of gradients
-    weights = np.mean(gradient, axis=(1, 2))  # (2048,)
-    
-    # Weighted combination of feature maps
-    cam = np.zeros(feature_map.shape[1:], dtype=np.float32)  # (7, 7)
-    for i, w in enumerate(weights):
-        cam += w * feature_map[i]
-    
-    # Apply ReLU to cam
-    cam = np.maximum(cam, 0)
-    
-    # Normalize to 0-1
-    if cam.max() > 0:
-        cam = cam / cam.max()
-    
-    # Resize to 224x224
-    cam_resized = cv2.resize(cam, (224, 224))
-    
-    # Convert to 0-255
-    heatmap = np.uint8(255 * cam_resized)
-    
-    return heatmap
+    if heatmap_job_queue.full():
+        heatmap_jobs_rejected.inc()
+        print(f"[WARN] Heatmap job queue full ({HEATMAP_JOB_QUEUE_SIZE}); returning the prediction without an overlay.")
+        return None
+
+    now = datetime.now(timezone.utc)
+    job_id = str(uuid.uuid4())
+    # Stored before it is queued, so the worker's status updates always find it
+    await heatmap_job_collection.insert_one({
+        "_id": job_id, "status": "pending", "heatmap_url": None, "created_at": now, "completed_at": None,
+        "expires_at": now + timedelta(seconds=HEATMAP_JOB_TTL_SECONDS),
+    })
+    try:
+        heatmap_job_queue.put_nowait((job_id, overlay_base, activations, pred_idx, cache_digest, result))
+    except asyncio.QueueFull:
+        # Filled up while the job was being stored
+        heatmap_jobs_rejected.inc()
+        await heatmap_job_collection.delete_one({"_id": job_id})
+        return None
+    heatmap_jobs_pending.inc()
+    return job_id
+
+async def heatmap_job_worker():
+    """Background task rendering queued heatmaps in the inference pool."""
+    while True:
+        job_id, overlay_base, activations, pred_idx, cache_digest, result = await heatmap_job_queue.get()
+        heatmap_jobs_pending.dec()
+        start = time.perf_counter()
+        heatmap_url = None
+        try:
+            await update_heatmap_job(job_id, status="running")
+            heatmap_url = await store_heatmap(
+                await run_in_inference_pool(inference.render_deferred_heatmap, overlay_base, activations, pred_idx)
+            )
+        except Exception as e:
+            print(f"[ERROR] Heatmap job {job_id} failed: {str(e)}")
+        try:
+            await update_heatmap_job(
+                job_id, status="done" if heatmap_url else "failed", heatmap_url=heatmap_url,
+                completed_at=datetime.now(timezone.utc),
+            )
+        except Exception as e:
+            print(f"[ERROR] Could not record heatmap job {job_id}: {str(e)}")
+        if cache_digest and heatmap_url:
+            await asyncio.to_thread(prediction_cache.put, cache_digest, {**result, "heatmap_url": heatmap_url})
+        metrics.histogram("heatmap_job_seconds").observe(time.perf_counter() - start)
+
+# -------------------
+# 5c. Prediction Cache
+# -------------------
+# Re-uploads of the same slice are answered from a cache keyed by the SHA-256 of the
+# bytes, scoped to the fingerprint of the checkpoint loaded at startup (a new one takes
+# effect, and invalidates the cache, on restart). No hits are served before it loads.
+PREDICTION_CACHE_ENABLED = os.getenv("PREDICTION_CACHE", "1") == "1"
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "1024"))
+# Optional on-disk tier shared by restarts (and by workers on the same node)
+PREDICTION_CACHE_DIR = os.getenv("PREDICTION_CACHE_DIR") or None
+PREDICTION_CACHE_DISK_SIZE = int(os.getenv("PREDICTION_CACHE_DISK_SIZE", "10000"))
+
+prediction_cache = PredictionCache(
+    max_entries=PREDICTION_CACHE_SIZE, disk_dir=PREDICTION_CACHE_DIR, max_disk_entries=PREDICTION_CACHE_DISK_SIZE,
+)
+prediction_cache_hits = metrics.counter("prediction_cache_hits_total")
+prediction_cache_misses = metrics.counter("prediction_cache_misses_total")
 
+def lookup_cached_prediction(contents: bytes):
+    """Hash an upload and look it up. Blocking (hashing, disk tier): run off the event loop."""
+    digest = hash_upload(contents)
+    return digest, prediction_cache.get(digest)
 
-def create_heatmap_overlay(original_img, heatmap):
+# -------------------
+# 5d. Heatmap Retention
+# -------------------
+# Overlays are content-addressed (identical ones share a file) and every /predict may
+# write one, but only those linked to a saved assessment need to stay. The sweeper
+# deletes overlays older than HEATMAP_RETENTION_SECONDS that no assessment references.
+# Every worker may start it, but only the holder of a MongoDB lease sweeps: one per
+# node for local storage (each node has its own directory), one overall for S3.
+# A cache hit refreshes the overlay it returns (see heatmap_still_stored), so a result
+# keeps its overlay for at least half the retention period after it was last served.
+HEATMAP_SWEEPER_ENABLED = os.getenv("HEATMAP_SWEEPER", "1") == "1"
+HEATMAP_RETENTION_SECONDS = int(os.getenv("HEATMAP_RETENTION_SECONDS", str(24 * 3600)))
+HEATMAP_SWEEP_INTERVAL_SECONDS = int(os.getenv("HEATMAP_SWEEP_INTERVAL_SECONDS", "3600"))
+HEATMAP_PREFIX = "heatmaps/"
+
+HEATMAP_SWEEPER_LEASE = (
+    f"heatmap_sweeper:{socket.gethostname()}" if storage.STORAGE_BACKEND == "local" else "heatmap_sweeper"
+)
+LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+heatmaps_swept = metrics.counter("heatmaps_swept_total")
+heatmaps_reclaimed_bytes = metrics.counter("heatmaps_reclaimed_bytes_total")
+heatmaps_stored_bytes = metrics.gauge("heatmaps_stored_bytes")
+
+async def sweep_heatmaps():
+    """One retention pass. Returns {"removed", "reclaimed_bytes", "kept", "kept_bytes"}."""
+    store = storage.get_storage()
+    cutoff = time.time() - HEATMAP_RETENTION_SECONDS
+    objects = await asyncio.to_thread(lambda: list(store.list(HEATMAP_PREFIX)))
+    report = {"removed": 0, "reclaimed_bytes": 0, "kept": 0, "kept_bytes": 0}
+    expired = {}
+    for key, size, modified in objects:
+        if modified < cutoff:
+            expired[key] = size
+        else:
+            report["kept"] += 1
+            report["kept_bytes"] += size
+
+    keys = list(expired)
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        linked = await assessment_collection.distinct("heatmap_key", {"heatmap_key": {"$in": chunk}})
+        linked = set(linked)
+        removed_urls = []
+        for key in chunk:
+            if key in linked:
+                report["kept"] += 1
+                report["kept_bytes"] += expired[key]
+                continue
+            # Re-check: a cache hit may have refreshed it since the listing
+            modified = await asyncio.to_thread(store.modified, key)
+            if modified is None or modified >= cutoff:
+                continue
+            await asyncio.to_thread(store.delete, key)
+            removed_urls.append(store.url(key))
+            report["removed"] += 1
+            report["reclaimed_bytes"] += expired[key]
+        if removed_urls:
+            await asyncio.to_thread(prediction_cache.forget_heatmaps, removed_urls)
+
+    heatmaps_swept.inc(report["removed"])
+    heatmaps_reclaimed_bytes.inc(report["reclaimed_bytes"])
+    heatmaps_stored_bytes.set(report["kept_bytes"])
+    return report
+
+def heatmap_still_stored(url):
     """
-    Create an overlay of the heatmap on the original image.
-    
-    Args:
-        original_img: PIL Image object (grayscale or RGB)
-        heatmap: Numpy array (224, 224) with values 0-255
-    
-    Returns:
-        overlay: PIL Image object of the blended result
+    Whether a cached heatmap_url still points at a stored overlay. An overlay past half
+    its retention period is touched so the sweeper leaves it alone for a while longer.
+    Blocking (storage round trips): run off the event loop.
     """
-    # Resize original image to 224x224
-    img_resized = original_img.resize((224, 224))
-    img_array = np.array(img_resized)
-    
-    # Convert grayscale to RGB if needed
-    if len(img_array.shape) == 2:
-        img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB)
-    elif img_array.shape[2] == 4:
-        img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2RGB)
-    
-    # Apply colormap to heatmap (JET colormap)
-    heatmap_colored = cv2.applyColorMap(heatmap, cv2.COLORMAP_JET)
-    heatmap_colored = cv2.cvtColor(heatmap_colored, cv2.COLOR_BGR2RGB)
-    
-    # Blend the heatmap with the original image
-    alpha = 0.4  # Transparency factor
-    overlay = cv2.addWeighted(img_array, 1 - alpha, heatmap_colored, alpha, 0)
-    
-    # Convert back to PIL Image
-    overlay_pil = Image.fromarray(overlay)
-    
-    return overlay_pil
+    key = storage.key_for_url(url)
+    if key is None:
+        return True
+    store = storage.get_storage()
+    try:
+        modified = store.modified(key)
+        if modified is None:
+            return False
+        if time.time() - modified > HEATMAP_RETENTION_SECONDS / 2:
+            return store.touch(key)
+    except Exception as e:
+        # Storage hiccup: serve the cached URL rather than failing the request
+        print(f"[WARN] Could not check heatmap {key}: {str(e)}")
+    return True
+
+async def acquire_sweeper_lease() -> bool:
+    """Take or renew the sweeper lease; False while another live worker holds it."""
+    now = datetime.now(timezone.utc)
+    try:
+        await lease_collection.update_one(
+            {"_id": HEATMAP_SWEEPER_LEASE, "$or": [{"owner": LEASE_OWNER}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": LEASE_OWNER, "expires_at": now + timedelta(seconds=2 * HEATMAP_SWEEP_INTERVAL_SECONDS)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        # The filter missed because someone else holds it, so the upsert collided on _id
+        return False
+
+async def heatmap_sweeper():
+    """Background task running sweep_heatmaps() every HEATMAP_SWEEP_INTERVAL_SECONDS on the lease holder."""
+    while True:
+        try:
+            if not await acquire_sweeper_lease():
+                await asyncio.sleep(HEATMAP_SWEEP_INTERVAL_SECONDS)
+                continue
+            report = await sweep_heatmaps()
+            print(
+                f"[INFO] Heatmap sweep: removed {report['removed']} orphaned heatmaps, "
+                f"reclaimed {report['reclaimed_bytes'] / (1024 * 1024):.1f} MB; "
+                f"{report['kept']} kept ({report['kept_bytes'] / (1024 * 1024):.1f} MB)."
+            )
+        except Exception as e:
+            print(f"[ERROR] Heatmap sweep failed: {str(e)}")
+        await asyncio.sleep(HEATMAP_SWEEP_INTERVAL_SECONDS)
+
+print("[INFO] Connected to MongoDB Atlas.")
 
 # -------------------
 # 6. API Endpoints
@@ -425,6 +762,21 @@ def create_heatmap_overlay(original_img, heatmap):
 def read_root():
     return {"message": "Welcome to the AlzAware Prediction API!"}
 
+@app.get("/health/ready")
+def read_readiness(response: Response):
+    """
+    Readiness probe. 200 once this worker can serve its role: model loaded, or model
+    disabled for chat/dashboard-only workers; 503 while loading or after a failed load.
+    """
+    if model_state["status"] not in ["ready", "disabled"]:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"model": model_state}
+
+@app.get("/metrics")
+def read_metrics():
+    """In-process counters, gauges and latency histograms for this worker."""
+    return metrics.snapshot()
+
 # --- User Endpoints ---
 @app.post("/users/", response_model=UserPublic, status_code=status.HTTP_201_CREATED)
 async def create_user(user: UserCreate):
@@ -447,6 +799,8 @@ async def create_user(user: UserCreate):
     elif user.role == "patient":
         user_data["assigned_doctor"] = None
         user_data["doctor_requests"] = []
+        # Nothing to summarize yet, so the summary starts complete (see patient_summaries.py)
+        user_data["clinical_summary"] = patient_summaries.new_summary()
     new_user = await user_collection.insert_one(user_data)
     created_user_doc = await user_collection.find_one({"_id": new_user.inserted_id})
     created_user_doc["_id"] = str(created_user_doc["_id"])
@@ -479,16 +833,17 @@ async def read_users_me(current_user: Annotated[dict, Depends(get_current_user)]
 
 @app.put("/users/me/photo", response_model=UserPublic)
 async def upload_profile_photo(current_user: Annotated[dict, Depends(get_current_user)], file: UploadFile = File(...)):
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{current_user['_id']}{file_extension}"
-    file_path = os.path.join("uploads", unique_filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    photo_url = f"http://127.0.0.1:8000/uploads/{unique_filename}"
+    file_path = await upload_limits.save_upload(
+        file, os.path.join("uploads", str(current_user["_id"])),
+        upload_limits.PHOTO_UPLOAD_MAX_BYTES, upload_limits.PHOTO_KINDS,
+    )
+    unique_filename = os.path.basename(file_path)
+    photo_url = f"{storage.PUBLIC_BASE_URL}/uploads/{unique_filename}"
     await user_collection.update_one(
         {"_id": current_user["_id"]},
         {"$set": {"profile_photo_url": photo_url}}
     )
+    await user_cache.invalidate(current_user["email"])
     updated_user_doc = await user_collection.find_one({"_id": current_user["_id"]})
     updated_user_doc["_id"] = str(updated_user_doc["_id"])
     return UserPublic.model_validate(updated_user_doc)
@@ -502,113 +857,196 @@ async def update_professional_details(
         {"_id": current_user["_id"]},
         {"$set": {"professional_details": details.model_dump()}}
     )
+    await user_cache.invalidate(current_user["email"])
     updated_user_doc = await user_collection.find_one({"_id": current_user["_id"]})
     updated_user_doc["_id"] = str(updated_user_doc["_id"])
     return UserPublic.model_validate(updated_user_doc)
 
 
-# --- HELPER FUNCTION FOR IMAGE VALIDATION (NEW) ---
-def is_brain_mri_shape(img_bytes: bytes, aspect_ratio_min=0.75, aspect_ratio_max=1.3) -> bool:
-    """
-    Checks if the main object in an image has an aspect ratio typical of a brain MRI.
-    Returns True if the shape is plausible, False otherwise.
-    """
-    try:
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
-        
-        # Threshold to create a binary mask and find contours
-        _, thresh = cv2.threshold(img, 30, 255, cv2.THRESH_BINARY)
-        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-        if not contours:
-            return False # No object found
-
-        # Find the largest contour (the brain/skull) and its bounding box
-        largest_contour = max(contours, key=cv2.contourArea)
-        x, y, w, h = cv2.boundingRect(largest_contour)
-
-        if h == 0 or w == 0:
-            return False
-
-        # Calculate the aspect ratio (width / height)
-        aspect_ratio = w / h
-        
-        # Check if the ratio is within the expected range for a brain scan
-        return aspect_ratio_min < aspect_ratio < aspect_ratio_max
-    except Exception:
-        # If any error occurs during processing, assume it's not a valid image
-        return False
-
-
 # --- AI Prediction Endpoint (UPDATED) ---
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
-    contents = await file.read()
+async def predict(response: Response, file: UploadFile = File(...), heatmap: str = "sync"):
+    """
+    Classify an MRI scan.
+    heatmap='sync' waits for the Grad-CAM overlay, 'deferred' returns a heatmap_job_id
+    to poll at /heatmaps/{job_id} (None while the job queue is full), and 'none' skips
+    the overlay entirely.
+    """
+    if heatmap not in ["sync", "deferred", "none"]:
+        raise HTTPException(status_code=400, detail="heatmap must be 'sync', 'deferred' or 'none'.")
+    contents, _ = await upload_limits.read_upload(file, upload_limits.MRI_UPLOAD_MAX_BYTES, upload_limits.MRI_KINDS)
+
+    digest = None
+    if PREDICTION_CACHE_ENABLED:
+        digest, cached = await asyncio.to_thread(lookup_cached_prediction, contents)
+        if cached is not None and cached["heatmap_url"]:
+            if not await asyncio.to_thread(heatmap_still_stored, cached["heatmap_url"]):
+                # Swept since it was cached (possibly by another worker's sweeper): render it again
+                cached = {**cached, "heatmap_url": None}
+        # A cached result without an overlay can't serve a request that wants one
+        if cached is not None and (cached["heatmap_url"] or heatmap == "none"):
+            prediction_cache_hits.inc()
+            response.headers["X-Cache"] = "hit"
+            return cached
+        prediction_cache_misses.inc()
+        response.headers["X-Cache"] = "miss"
+
+    start = time.perf_counter()
+    async with inference_admission():
+        await ensure_model_loaded()
+        try:
+            overlay_base, img_input, timings = await run_in_inference_pool(inference.prepare_image, contents)
+        except inference.InvalidImageError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        stage_start = time.perf_counter()
+        pred_idx, result, heatmap_array, activations, _ = await predict_batcher.submit((img_input, heatmap == "sync"))
+        timings["inference"] = time.perf_counter() - stage_start
+
+        # --- Step 3: Save the Grad-CAM overlay computed on the same pass ---
+        result["heatmap_url"] = None
+        if heatmap == "sync":
+            stage_start = time.perf_counter()
+            result["heatmap_url"] = await store_heatmap(
+                await run_in_inference_pool(inference.render_heatmap, overlay_base, heatmap_array)
+            )
+            timings["heatmap"] = time.perf_counter() - stage_start
+        elif heatmap == "deferred":
+            result["heatmap_job_id"] = await enqueue_heatmap_job(overlay_base, activations, pred_idx, digest, dict(result))
+
+    if digest is not None:
+        await asyncio.to_thread(prediction_cache.put, digest, result)
+
+    # Whatever the stages did not account for was spent waiting for a free worker
+    timings["queue"] = max(time.perf_counter() - start - sum(timings.values()), 0.0)
+    for stage, seconds in timings.items():
+        metrics.histogram(f"predict_{stage}_seconds").observe(seconds)
+    response.headers["Server-Timing"] = ", ".join(
+        f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()
+    )
+    return result
 
-    # --- Step 1: Validate the shape of the image FIRST ---
-    if not is_brain_mri_shape(contents):
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid image shape. Please upload a proper brain MRI scan."
-        )
+@app.post("/predict/batch")
+async def predict_study(files: List[UploadFile] = File(...), heatmap_top_k: int = 0):
+    """
+    Classify a multi-slice MRI study in one request.
+    files may be slice images and/or zip/tar archives of slices. Every slice is scored
+    through the same micro-batcher as /predict, and "study" aggregates them: mean and
+    max probability per class, with the study prediction taken from the highest mean.
+    Grad-CAM overlays are rendered only for the heatmap_top_k most confident slices.
+    Archives are checked against the slice and expanded-size limits from their directory
+    first, then decompressed one member at a time as workers free up.
+    """
+    if heatmap_top_k < 0:
+        raise HTTPException(status_code=400, detail="heatmap_top_k must not be negative.")
+
+    start = time.perf_counter()
+    await ensure_model_loaded()
+    uploads = []
+    slice_count = expanded_bytes = 0
+    for upload in files:
+        contents, _ = await upload_limits.read_upload(upload, upload_limits.STUDY_UPLOAD_MAX_BYTES, upload_limits.STUDY_KINDS)
+        try:
+            members = await asyncio.to_thread(inference.study_members, upload.filename, contents, PREDICT_BATCH_MAX_SLICE_BYTES)
+        except inference.StudyTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        slice_count += len(members)
+        expanded_bytes += sum(size for _, size in members)
+        if slice_count > PREDICT_BATCH_MAX_SLICES:
+            raise HTTPException(status_code=413, detail=f"A study can contain at most {PREDICT_BATCH_MAX_SLICES} slices.")
+        if expanded_bytes > PREDICT_BATCH_MAX_EXPANDED_BYTES:
+            raise HTTPException(status_code=413, detail=f"A study can expand to at most {PREDICT_BATCH_MAX_EXPANDED_BYTES} bytes.")
+        uploads.append((upload.filename, contents))
+    if not slice_count:
+        raise HTTPException(status_code=400, detail="No image slices found in the upload.")
+
+    # A study occupies at most what the workers can score at once, so single-slice
+    # /predict requests still get a share of the queue while it runs. The same bound
+    # caps how many decompressed slices are held at a time.
+    weight = min(slice_count, INFERENCE_WORKERS * INFERENCE_BATCH_SIZE)
+    semaphore = asyncio.Semaphore(weight)
+    # Min-heap of the heatmap_top_k most confident slices; everyone else's activations are dropped
+    top_slices = []
+
+    async def score_slice(index, name, contents):
+        # The caller acquired the semaphore before decompressing this slice
+        try:
+            try:
+                overlay_base, img_input, _ = await run_in_inference_pool(inference.prepare_image, contents)
+            except inference.InvalidImageError as e:
+                return {"filename": name, "error": str(e)}, None
+            del contents
+            pred_idx, result, _, activations, probs = await predict_batcher.submit((img_input, False))
+        finally:
+            semaphore.release()
+        if heatmap_top_k:
+            entry = (result["confidence"], -index, overlay_base, activations, pred_idx)
+            if len(top_slices) < heatmap_top_k:
+                heapq.heappush(top_slices, entry)
+            elif entry[:2] > top_slices[0][:2]:
+                heapq.heapreplace(top_slices, entry)
+        return {"filename": name, **result, "heatmap_url": None}, probs
+
+    async with inference_admission(weight):
+        tasks = []
+        try:
+            for upload_name, contents in uploads:
+                members = inference.iter_study_slices(upload_name, contents)
+                while True:
+                    await semaphore.acquire()
+                    member = await asyncio.to_thread(next, members, None)
+                    if member is None:
+                        semaphore.release()
+                        break
+                    tasks.append(asyncio.create_task(score_slice(len(tasks), *member)))
+            scored = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        async def render_and_store(overlay_base, activations, pred_idx):
+            return await store_heatmap(
+                await run_in_inference_pool(inference.render_deferred_heatmap, overlay_base, activations, pred_idx)
+            )
 
-    # --- Step 2: If shape is valid, proceed with prediction ---
-    img = Image.open(io.BytesIO(contents))
-    
-    # Check for grayscale (this is still a good check to keep)
-    img_array = np.array(img)
-    is_grayscale = len(img_array.shape) == 2 or (len(img_array.shape) == 3 and np.all(img_array[:,:,0] == img_array[:,:,1]))
-    if not is_grayscale:
-        raise HTTPException(status_code=400, detail="Incorrect image type. Please upload a grayscale MRI scan.")
-
-    # Convert to RGB and run through the Alzheimer's model
-    img_rgb = img.convert("RGB")
-    img_tensor = eval_transforms(img_rgb).unsqueeze(0).to(device)
-    
-    with torch.no_grad():
-        logits = model(img_tensor)
-        probs = torch.softmax(logits, dim=1).cpu().numpy()[0]
-        pred_idx = int(probs.argmax())
-        pred_class = class_names[pred_idx]
-        confidence = float(probs[pred_idx])
-
-    # --- Step 3: Generate Grad-CAM heatmap ---
-    try:
-        print("[INFO] Generating Grad-CAM heatmap...")
-        
-        # Create a new tensor that requires gradient
-        img_tensor_grad = eval_transforms(img_rgb).unsqueeze(0).to(device)
-        img_tensor_grad.requires_grad = True
-        
-        # Generate heatmap
-        heatmap = generate_gradcam_heatmap(model, img_tensor_grad, pred_idx)
-        
-        # Create overlay image
-        overlay_img = create_heatmap_overlay(img, heatmap)
-        
-        # Save the overlay image with unique filename
-        unique_id = str(uuid.uuid4())
-        heatmap_filename = f"heatmap_{unique_id}.png"
-        heatmap_path = os.path.join("uploads", "heatmaps", heatmap_filename)
-        overlay_img.save(heatmap_path)
-        
-        # Generate public URL
-        heatmap_url = f"http://127.0.0.1:8000/uploads/heatmaps/{heatmap_filename}"
-        
-        print(f"[INFO] Heatmap saved to: {heatmap_path}")
-        
-    except Exception as e:
-        print(f"[ERROR] Failed to generate heatmap: {str(e)}")
-        heatmap_url = None
+        heatmap_urls = await asyncio.gather(*(
+            render_and_store(overlay_base, activations, pred_idx)
+            for _, _, overlay_base, activations, pred_idx in top_slices
+        ))
+    for (_, neg_index, *_), url in zip(top_slices, heatmap_urls):
+        scored[-neg_index][0]["heatmap_url"] = url
+
+    slice_probs = [probs for _, probs in scored if probs is not None]
+    study = None
+    if slice_probs:
+        class_names = model_state["backend"]["class_names"]
+        mean_probs = [sum(column) / len(slice_probs) for column in zip(*slice_probs)]
+        max_probs = [max(column) for column in zip(*slice_probs)]
+        study_idx = max(range(len(mean_probs)), key=mean_probs.__getitem__)
+        study = {
+            "prediction": class_names[study_idx],
+            "confidence": mean_probs[study_idx],
+            "mean_probabilities": {name: f"{p:.2%}" for name, p in zip(class_names, mean_probs)},
+            "max_probabilities": {name: f"{p:.2%}" for name, p in zip(class_names, max_probs)},
+        }
 
+    metrics.histogram("predict_study_slices", buckets=(1, 8, 32, 64, 128, 256, 512)).observe(slice_count)
+    metrics.histogram("predict_study_seconds").observe(time.perf_counter() - start)
     return {
-        "prediction": pred_class,
-        "confidence": confidence,
-        "class_probabilities": {class_names[i]: f"{float(probs[i]):.2%}" for i in range(len(probs))},
-        "heatmap_url": heatmap_url
+        "study": study,
+        "slice_count": slice_count,
+        "valid_slice_count": len(slice_probs),
+        "slices": [result for result, _ in scored],
     }
 
+@app.get("/heatmaps/{job_id}", response_model=HeatmapJobPublic)
+async def get_heatmap_job(job_id: str):
+    """Status of a deferred heatmap; heatmap_url is set once status is 'done'."""
+    job = await heatmap_job_collection.find_one({"_id": job_id})
+    if job is None:
+        raise HTTPException(status_code=404, detail="Heatmap job not found.")
+    return HeatmapJobPublic(job_id=job["_id"], **{k: job.get(k) for k in ("status", "heatmap_url", "created_at", "completed_at")})
+
 
 # --- Assessment Endpoints ---
 @app.post("/assessments/", response_model=AssessmentPublic)
@@ -616,34 +1054,35 @@ async def create_assessment(assessment: AssessmentCreate, current_user: Annotate
     assessment_data = assessment.model_dump()
     assessment_data["owner_email"] = current_user["email"]
     assessment_data["created_at"] = datetime.now(timezone.utc)
+    # Links the overlay to this assessment so the heatmap sweeper keeps it
+    assessment_data["heatmap_key"] = storage.key_for_url(assessment.heatmap_url)
     new_assessment = await assessment_collection.insert_one(assessment_data)
+    await patient_summaries.record_assessment(user_collection, current_user["email"], assessment_data)
     created_assessment_doc = await assessment_collection.find_one({"_id": new_assessment.inserted_id})
     created_assessment_doc["_id"] = str(created_assessment_doc["_id"])
     return AssessmentPublic.model_validate(created_assessment_doc)
 
 @app.get("/assessments/", response_model=List[AssessmentPublic])
 async def get_my_assessments(
+    response: Response,
     current_user: Annotated[dict, Depends(get_current_user)],
-    patient_email: Optional[str] = None
+    patient_email: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = pagination.DEFAULT_PAGE_SIZE,
 ):
-    # Refresh user data from database to get latest assigned_patients
     if patient_email and current_user.get("role") == "doctor":
-        refreshed_user = await user_collection.find_one({"_id": current_user["_id"]})
-        assigned_patients = refreshed_user.get("assigned_patients", []) if refreshed_user else []
-        
-        if patient_email not in assigned_patients:
+        if not await is_assigned_patient(current_user, patient_email):
             print(f"[DEBUG] Doctor {current_user['email']} not authorized for patient {patient_email}")
-            print(f"[DEBUG] Assigned patients: {assigned_patients}")
             raise HTTPException(status_code=403, detail="Not authorized to view this patient's data")
         query_email = patient_email
     else:
         query_email = current_user["email"]
-    assessments = []
-    cursor = assessment_collection.find({"owner_email": query_email}).sort("created_at", -1)
-    async for doc in cursor:
-        doc["_id"] = str(doc["_id"])
-        assessments.append(AssessmentPublic.model_validate(doc))
-    return assessments
+    docs, next_cursor = await pagination.find_page(
+        assessment_collection, {"owner_email": query_email}, "created_at", cursor, limit,
+        projection=pagination.projection_for(AssessmentPublic),
+    )
+    pagination.set_next_cursor(response, next_cursor)
+    return pagination.with_string_ids(docs)
 
 # --- Cognitive Test Endpoints ---
 @app.post("/cognitive-tests/", response_model=CognitiveTestResultPublic)
@@ -664,6 +1103,7 @@ async def create_cognitive_test_result(result: CognitiveTestResultCreate, curren
         
         print(f"💾 Inserting into cognitive_test_collection...")
         new_result = await cognitive_test_collection.insert_one(result_data)
+        await patient_summaries.record_cognitive_test(user_collection, current_user["email"], result_data)
         
         print(f"✅ Test result saved with ID: {new_result.inserted_id}")
         
@@ -681,27 +1121,25 @@ async def create_cognitive_test_result(result: CognitiveTestResultCreate, curren
 
 @app.get("/cognitive-tests/", response_model=List[CognitiveTestResultPublic])
 async def get_my_cognitive_tests(
+    response: Response,
     current_user: Annotated[dict, Depends(get_current_user)],
-    patient_email: Optional[str] = None
+    patient_email: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = pagination.DEFAULT_PAGE_SIZE,
 ):
-    # Refresh user data from database to get latest assigned_patients
     if patient_email and current_user.get("role") == "doctor":
-        refreshed_user = await user_collection.find_one({"_id": current_user["_id"]})
-        assigned_patients = refreshed_user.get("assigned_patients", []) if refreshed_user else []
-        
-        if patient_email not in assigned_patients:
+        if not await is_assigned_patient(current_user, patient_email):
             print(f"[DEBUG] Doctor {current_user['email']} not authorized for patient {patient_email}")
-            print(f"[DEBUG] Assigned patients: {assigned_patients}")
             raise HTTPException(status_code=403, detail="Not authorized to view this patient's data")
         query_email = patient_email
     else:
         query_email = current_user["email"]
-    tests = []
-    cursor = cognitive_test_collection.find({"owner_email": query_email}).sort("created_at", -1)
-    async for doc in cursor:
-        doc["_id"] = str(doc["_id"])
-        tests.append(CognitiveTestResultPublic.model_validate(doc))
-    return tests
+    docs, next_cursor = await pagination.find_page(
+        cognitive_test_collection, {"owner_email": query_email}, "created_at", cursor, limit,
+        projection=pagination.projection_for(CognitiveTestResultPublic),
+    )
+    pagination.set_next_cursor(response, next_cursor)
+    return pagination.with_string_ids(docs)
 
 # --- Doctor-Specific Endpoints ---
 @app.get("/doctor/patients", response_model=List[UserPublic])
@@ -717,13 +1155,17 @@ async def get_my_patients(current_user: Annotated[dict, Depends(require_doctor)]
     return patients
 
 @app.get("/patients/all", response_model=List[UserPublic])
-async def get_all_patients(current_user: Annotated[dict, Depends(require_doctor)]):
-    patients = []
-    cursor = user_collection.find({"role": "patient"})
-    async for doc in cursor:
-        doc["_id"] = str(doc["_id"])
-        patients.append(UserPublic.model_validate(doc))
-    return patients
+async def get_all_patients(
+    response: Response,
+    current_user: Annotated[dict, Depends(require_doctor)],
+    cursor: Optional[str] = None,
+    limit: int = pagination.DEFAULT_PAGE_SIZE,
+):
+    docs, next_cursor = await pagination.find_page(
+        user_collection, {"role": "patient"}, "_id", cursor, limit, descending=False, projection=USER_LIST_PROJECTION,
+    )
+    pagination.set_next_cursor(response, next_cursor)
+    return pagination.with_string_ids(docs)
 
 @app.post("/doctor/assign-patient", response_model=UserPublic)
 async def assign_patient(
@@ -735,51 +1177,93 @@ async def assign_patient(
         {"_id": current_user["_id"]},
         {"$addToSet": {"assigned_patients": patient_email}}
     )
+    await user_cache.invalidate(current_user["email"])
     updated_doctor = await user_collection.find_one({"_id": current_user["_id"]})
     updated_doctor["_id"] = str(updated_doctor["_id"])
     return UserPublic.model_validate(updated_doctor)
 
 @app.get("/assessments/high-risk", response_model=List[HighRiskAssessmentPublic])
-async def get_high_risk_assessments(current_user: Annotated[dict, Depends(require_doctor)]):
-    high_risk_assessments = []
-    query = {"prediction": {"$in": ["Moderate Impairment", "Mild Impairment"]}}
-    patient_docs = await user_collection.find({}, {"email": 1, "full_name": 1}).to_list(length=None)
+async def get_high_risk_assessments(
+    response: Response,
+    current_user: Annotated[dict, Depends(require_doctor)],
+    cursor: Optional[str] = None,
+    limit: int = pagination.DEFAULT_PAGE_SIZE,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    """
+    High-risk assessments of the doctor's assigned patients, newest first.
+    Paginated: limit defaults to DEFAULT_PAGE_SIZE and is capped at MAX_PAGE_SIZE; pass
+    the X-Next-Cursor response header back as ?cursor= for the next page.
+    since/until optionally restrict created_at to a time window.
+    """
+    patient_emails = current_user.get("assigned_patients", [])
+    if not patient_emails:
+        return []
+    query = {
+        "owner_email": {"$in": patient_emails},
+        "prediction": {"$in": dashboard_queries.HIGH_RISK_PREDICTIONS},
+    }
+    if since or until:
+        query["created_at"] = {**({"$gte": since} if since else {}), **({"$lt": until} if until else {})}
+
+    docs, next_cursor = await pagination.find_page(
+        assessment_collection, query, "created_at", cursor, limit,
+        projection=pagination.projection_for(AssessmentPublic),
+    )
+    pagination.set_next_cursor(response, next_cursor)
+
+    # Names for this page only
+    page_emails = list({doc["owner_email"] for doc in docs})
+    patient_docs = await user_collection.find({"email": {"$in": page_emails}}, {"email": 1, "full_name": 1}).to_list(length=None)
     patient_name_map = {doc["email"]: doc.get("full_name", "N/A") for doc in patient_docs}
-    cursor = assessment_collection.find(query).sort("created_at", -1)
-    async for doc in cursor:
+    high_risk_assessments = []
+    for doc in docs:
         doc["_id"] = str(doc["_id"])
         doc["patient_full_name"] = patient_name_map.get(doc["owner_email"], "N/A")
         high_risk_assessments.append(HighRiskAssessmentPublic.model_validate(doc))
     return high_risk_assessments
 
 @app.get("/doctors/all", response_model=List[UserPublic])
-async def get_all_doctors(current_user: Annotated[dict, Depends(get_current_user)]):
-    doctors = []
-    cursor = user_collection.find({"role": "doctor"})
-    async for doc in cursor:
-        doc["_id"] = str(doc["_id"])
-        doctors.append(UserPublic.model_validate(doc))
-    return doctors
+async def get_all_doctors(
+    response: Response,
+    current_user: Annotated[dict, Depends(get_current_user)],
+    cursor: Optional[str] = None,
+    limit: int = pagination.DEFAULT_PAGE_SIZE,
+):
+    docs, next_cursor = await pagination.find_page(
+        user_collection, {"role": "doctor"}, "_id", cursor, limit, descending=False, projection=USER_LIST_PROJECTION,
+    )
+    pagination.set_next_cursor(response, next_cursor)
+    return pagination.with_string_ids(docs)
 
 @app.get("/users/doctors", response_model=List[UserPublic])
-async def get_doctors_list(current_user: Annotated[dict, Depends(get_current_user)]):
+async def get_doctors_list(
+    response: Response,
+    current_user: Annotated[dict, Depends(get_current_user)],
+    cursor: Optional[str] = None,
+    limit: int = pagination.DEFAULT_PAGE_SIZE,
+):
     """Alias for /doctors/all for frontend consistency"""
-    doctors = []
-    cursor = user_collection.find({"role": "doctor"})
-    async for doc in cursor:
-        doc["_id"] = str(doc["_id"])
-        doctors.append(UserPublic.model_validate(doc))
-    return doctors
+    docs, next_cursor = await pagination.find_page(
+        user_collection, {"role": "doctor"}, "_id", cursor, limit, descending=False, projection=USER_LIST_PROJECTION,
+    )
+    pagination.set_next_cursor(response, next_cursor)
+    return pagination.with_string_ids(docs)
 
 @app.get("/users/patients", response_model=List[UserPublic])
-async def get_patients_list(current_user: Annotated[dict, Depends(require_doctor)]):
+async def get_patients_list(
+    response: Response,
+    current_user: Annotated[dict, Depends(require_doctor)],
+    cursor: Optional[str] = None,
+    limit: int = pagination.DEFAULT_PAGE_SIZE,
+):
     """Get all patients for doctors to access in chat"""
-    patients = []
-    cursor = user_collection.find({"role": "patient"})
-    async for doc in cursor:
-        doc["_id"] = str(doc["_id"])
-        patients.append(UserPublic.model_validate(doc))
-    return patients
+    docs, next_cursor = await pagination.find_page(
+        user_collection, {"role": "patient"}, "_id", cursor, limit, descending=False, projection=USER_LIST_PROJECTION,
+    )
+    pagination.set_next_cursor(response, next_cursor)
+    return pagination.with_string_ids(docs)
 
 @app.post("/patient/request-doctor", response_model=UserPublic)
 async def request_doctor(
@@ -795,13 +1279,15 @@ async def request_doctor(
     if not doctor:
         raise HTTPException(status_code=404, detail="Doctor not found.")
     
-    # Check if already requested or assigned
-    existing_requests = current_user.get("doctor_requests", [])
+    # Check if already requested or assigned, against the stored user: the cached one may
+    # predate a request made a moment ago through another worker
+    patient = await user_collection.find_one({"_id": current_user["_id"]}, {"doctor_requests": 1, "assigned_doctor": 1})
+    existing_requests = (patient or {}).get("doctor_requests", [])
     for req in existing_requests:
         if req.get("doctor_email") == doctor_email and req.get("status") == "pending":
             raise HTTPException(status_code=400, detail="Request already pending with this doctor.")
     
-    if current_user.get("assigned_doctor") == doctor_email:
+    if (patient or {}).get("assigned_doctor") == doctor_email:
         raise HTTPException(status_code=400, detail="This doctor is already assigned to you.")
     
     # Create request object
@@ -813,11 +1299,13 @@ async def request_doctor(
         "requested_at": datetime.now(timezone.utc)
     }
     
-    # Add to patient's doctor_requests
-    await user_collection.update_one(
-        {"_id": current_user["_id"]},
+    # Add to patient's doctor_requests, unless a concurrent request got there first
+    pushed = await user_collection.update_one(
+        {"_id": current_user["_id"], "doctor_requests": {"$not": {"$elemMatch": {"doctor_email": doctor_email, "status": "pending"}}}},
         {"$push": {"doctor_requests": request_obj}}
     )
+    if pushed.matched_count == 0:
+        raise HTTPException(status_code=400, detail="Request already pending with this doctor.")
     
     # Add to doctor's pending_patients
     patient_request_obj = {
@@ -832,6 +1320,7 @@ async def request_doctor(
         {"_id": doctor["_id"]},
         {"$push": {"pending_patients": patient_request_obj}}
     )
+    await user_cache.invalidate(current_user["email"], doctor_email)
     
     # Return updated patient
     updated_patient = await user_collection.find_one({"_id": current_user["_id"]})
@@ -852,28 +1341,20 @@ async def respond_to_patient_request(
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found.")
     
-    # Find the pending request in doctor's pending_patients
-    pending_patients = current_user.get("pending_patients", [])
-    request_found = False
-    for req in pending_patients:
-        if req.get("patient_email") == patient_email and req.get("status") == "pending":
-            request_found = True
-            break
-    
-    if not request_found:
-        raise HTTPException(status_code=404, detail="No pending request from this patient.")
-    
     new_status = "approved" if request.action == "approve" else "rejected"
     
-    # Update doctor's pending_patients status
-    await user_collection.update_one(
-        {"_id": current_user["_id"], "pending_patients.patient_email": patient_email},
+    # Update the pending request in doctor's pending_patients. Matched against the stored
+    # doctor, not the cached one, which can predate a request made through another worker
+    responded = await user_collection.update_one(
+        {"_id": current_user["_id"], "pending_patients": {"$elemMatch": {"patient_email": patient_email, "status": "pending"}}},
         {"$set": {"pending_patients.$.status": new_status}}
     )
+    if responded.matched_count == 0:
+        raise HTTPException(status_code=404, detail="No pending request from this patient.")
     
     # Update patient's doctor_requests status
     await user_collection.update_one(
-        {"_id": patient["_id"], "doctor_requests.doctor_email": current_user["email"]},
+        {"_id": patient["_id"], "doctor_requests": {"$elemMatch": {"doctor_email": current_user["email"], "status": "pending"}}},
         {"$set": {"doctor_requests.$.status": new_status}}
     )
     
@@ -891,16 +1372,14 @@ async def respond_to_patient_request(
             {"$set": {"assigned_doctor": current_user["email"]}}
         )
         
-        # Create notification for the patient
-        notification_doc = {
-            "user_email": patient["email"],
-            "message": f"Dr. {current_user.get('full_name', 'Unknown')} has accepted your supervision request.",
-            "type": "doctor_acceptance",
-            "status": "unread",
-            "timestamp": datetime.now(timezone.utc)
-        }
-        await notification_collection.insert_one(notification_doc)
-        print(f"[Notification] Created notification for patient {patient['email']}")
+        # Create notification for the patient (and push it to any open socket of theirs)
+        await create_notification(
+            patient["email"],
+            f"Dr. {current_user.get('full_name', 'Unknown')} has accepted your supervision request.",
+            "doctor_acceptance",
+        )
+    
+    await user_cache.invalidate(current_user["email"], patient_email)
     
     # Return updated doctor
     updated_doctor = await user_collection.find_one({"_id": current_user["_id"]})
@@ -913,13 +1392,17 @@ async def get_my_doctor_requests(current_user: Annotated[dict, Depends(get_curre
     if current_user.get("role") != "patient":
         raise HTTPException(status_code=403, detail="Only patients can view their requests.")
     
-    requests = current_user.get("doctor_requests", [])
+    # Read from MongoDB: a request just sent through another worker may not be in the cached user yet
+    patient = await user_collection.find_one({"_id": current_user["_id"]}, {"doctor_requests": 1})
+    requests = (patient or {}).get("doctor_requests", [])
     return [DoctorRequestPublic(**req) for req in requests]
 
 @app.get("/doctor/pending-requests", response_model=List[PatientRequestPublic])
 async def get_pending_patient_requests(current_user: Annotated[dict, Depends(require_doctor)]):
     """Get doctor's pending patient requests"""
-    requests = current_user.get("pending_patients", [])
+    # Read from MongoDB: a request just sent through another worker may not be in the cached user yet
+    doctor = await user_collection.find_one({"_id": current_user["_id"]}, {"pending_patients": 1})
+    requests = (doctor or {}).get("pending_patients", [])
     # Filter only pending
     pending = [req for req in requests if req.get("status") == "pending"]
     return [PatientRequestPublic(**req) for req in pending]
@@ -928,62 +1411,15 @@ async def get_pending_patient_requests(current_user: Annotated[dict, Depends(req
 @app.get("/doctor/dashboard-summary", response_model=DoctorDashboardData)
 async def get_doctor_dashboard_summary(current_user: Annotated[dict, Depends(require_doctor)]):
     patient_emails = current_user.get("assigned_patients", [])
-    
-    # 1. Get total patients
-    total_patients = len(patient_emails)
-
-    # 2. Get high-risk cases count
-    high_risk_query = {
-        "owner_email": {"$in": patient_emails},
-        "prediction": {"$in": ["Moderate Impairment", "Mild Impairment"]}
-    }
-    high_risk_count = await assessment_collection.count_documents(high_risk_query)
-
-    # 3. Get summary for each patient
-    my_patients_summary = []
-    if patient_emails:
-        patients_cursor = user_collection.find({"email": {"$in": patient_emails}})
-        async for patient_doc in patients_cursor:
-            patient_doc["_id"] = str(patient_doc["_id"])
-
-            # Find last MRI result
-            last_mri = await assessment_collection.find_one(
-                {"owner_email": patient_doc["email"]}, sort=[("created_at", -1)]
-            )
-            if last_mri:
-                last_mri["_id"] = str(last_mri["_id"])
-
-            # Find last cognitive test
-            last_cognitive = await cognitive_test_collection.find_one(
-                {"owner_email": patient_doc["email"]}, sort=[("created_at", -1)]
-            )
-            if last_cognitive:
-                last_cognitive["_id"] = str(last_cognitive["_id"])
-            
-            patient_summary = PatientSummary(
-                **patient_doc,
-                last_mri_result=last_mri,
-                last_cognitive_score=last_cognitive
-            )
-            my_patients_summary.append(patient_summary)
-
-    # 4. Get high-risk patients details
-    high_risk_patients = []
-    if patient_emails:
-        patient_docs = await user_collection.find({"email": {"$in": patient_emails}}, {"email": 1, "full_name": 1}).to_list(length=None)
-        patient_name_map = {doc["email"]: doc.get("full_name", "N/A") for doc in patient_docs}
-
-        high_risk_cursor = assessment_collection.find(high_risk_query).sort("created_at", -1).limit(5)
-        async for doc in high_risk_cursor:
-            doc["_id"] = str(doc["_id"])
-            doc["patient_full_name"] = patient_name_map.get(doc["owner_email"], "N/A")
-            high_risk_patients.append(HighRiskAssessmentPublic.model_validate(doc))
-
+    # A fixed number of concurrent reads regardless of patient count, see dashboard_queries.py
+    summary = await dashboard_queries.dashboard_summary(
+        user_collection, assessment_collection, cognitive_test_collection, patient_emails
+    )
     return DoctorDashboardData(
-        total_patients=total_patients,
-        high_risk_cases_count=high_risk_count,
-        my_patients_summary=my_patients_summary,
-        high_risk_patients=high_risk_patients
+        total_patients=len(patient_emails),
+        high_risk_cases_count=summary["high_risk_count"],
+        my_patients_summary=[PatientSummary(**doc) for doc in summary["patients"]],
+        high_risk_patients=[HighRiskAssessmentPublic.model_validate(doc) for doc in summary["high_risk"]]
     )
 
 
@@ -1065,6 +1501,7 @@ async def create_audio_recall_test(
         
         # Insert into audio_recall_collection
         new_test = await audio_recall_collection.insert_one(test_dict)
+        await patient_summaries.record_audio_recall_test(user_collection, current_user["email"], test_dict)
         
         print(f"✅ Audio recall test saved with ID: {new_test.inserted_id}")
         
@@ -1086,18 +1523,21 @@ async def create_audio_recall_test(
 
 @app.get("/cognitive-tests/audio-recall", response_model=List[AudioRecallTestPublic])
 async def get_audio_recall_tests(
+    response: Response,
     current_user: Annotated[dict, Depends(get_current_user)],
-    patient_email: Optional[str] = None
+    patient_email: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = pagination.DEFAULT_PAGE_SIZE,
 ):
     """
     Retrieve audio recall test results for the current user or a specific patient (for doctors).
-    Returns all audio-based cognitive tests sorted by date (most recent first).
+    Returns one page of audio-based cognitive tests sorted by date (most recent first).
     """
     try:
         # Determine which email to query
         if patient_email and current_user.get("role") == "doctor":
             # Doctor viewing patient's results
-            if patient_email not in current_user.get("assigned_patients", []):
+            if not await is_assigned_patient(current_user, patient_email):
                 raise HTTPException(
                     status_code=403,
                     detail="Not authorized to view this patient's data"
@@ -1107,15 +1547,13 @@ async def get_audio_recall_tests(
             # User viewing their own results
             query_email = current_user["email"]
         
-        # Fetch tests from database
-        tests = []
-        cursor = audio_recall_collection.find({"owner_email": query_email}).sort("created_at", -1)
-        
-        async for doc in cursor:
-            doc["_id"] = str(doc["_id"])
-            tests.append(AudioRecallTestPublic.model_validate(doc))
-        
-        return tests
+        # Fetch one page of tests from database
+        docs, next_cursor = await pagination.find_page(
+            audio_recall_collection, {"owner_email": query_email}, "created_at", cursor, limit,
+            projection=pagination.projection_for(AudioRecallTestPublic),
+        )
+        pagination.set_next_cursor(response, next_cursor)
+        return pagination.with_string_ids(docs)
     
     except HTTPException:
         raise
@@ -1129,23 +1567,71 @@ async def get_audio_recall_tests(
 # Notification Endpoints
 # -------------------
 
+async def unread_notification_count(email):
+    # Counted from the (user_email, status) index alone
+    return await notification_collection.count_documents({"user_email": email, "status": "unread"})
+
+async def create_notification(user_email, message, notification_type):
+    """
+    Store a notification and push it over /ws/{email} to every socket the user has open,
+    on whichever worker holds it, as {"type": "notification", "notification": ..., "unread_count": n}.
+    """
+    notification_doc = {
+        "user_email": user_email,
+        "message": message,
+        "type": notification_type,
+        "status": "unread",
+        "timestamp": datetime.now(timezone.utc)
+    }
+    result = await notification_collection.insert_one(notification_doc)
+    print(f"[Notification] Created notification for {user_email}")
+    try:
+        notification = NotificationPublic.model_validate({**notification_doc, "_id": str(result.inserted_id)})
+        pushed = await manager.send_personal_message({
+            "type": "notification",
+            "notification": notification.model_dump(mode="json", by_alias=True),
+            "unread_count": await unread_notification_count(user_email),
+        }, user_email)
+        if pushed:
+            print(f"[Notification] Pushed notification to {user_email}")
+    except Exception as e:
+        # Stored already: the client picks it up from GET /notifications/ on its next load
+        print(f"[WARN] Failed to push notification to {user_email}: {str(e)}")
+
+@app.get("/notifications/unread-count")
+async def get_unread_notification_count(current_user: Annotated[dict, Depends(get_current_user)]):
+    """
+    Number of unread notifications for the current user (for badges; new ones are pushed over /ws)
+    """
+    try:
+        return {"unread_count": await unread_notification_count(current_user["email"])}
+    
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error counting notifications: {str(e)}"
+        )
+
 @app.get("/notifications/", response_model=List[NotificationPublic])
-async def get_notifications(current_user: Annotated[dict, Depends(get_current_user)]):
+async def get_notifications(
+    response: Response,
+    current_user: Annotated[dict, Depends(get_current_user)],
+    cursor: Optional[str] = None,
+    limit: int = pagination.DEFAULT_PAGE_SIZE,
+):
     """
-    Get all notifications for the current user, sorted by timestamp (newest first)
+    Get one page of notifications for the current user, sorted by timestamp (newest first)
     """
     try:
-        notifications = []
-        cursor = notification_collection.find(
-            {"user_email": current_user["email"]}
-        ).sort("timestamp", -1)
-        
-        async for doc in cursor:
-            doc["_id"] = str(doc["_id"])
-            notifications.append(NotificationPublic.model_validate(doc))
-        
-        return notifications
+        docs, next_cursor = await pagination.find_page(
+            notification_collection, {"user_email": current_user["email"]}, "timestamp", cursor, limit,
+            projection=pagination.projection_for(NotificationPublic),
+        )
+        pagination.set_next_cursor(response, next_cursor)
+        return pagination.with_string_ids(docs)
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -1178,65 +1664,53 @@ async def mark_notifications_as_read(current_user: Annotated[dict, Depends(get_c
 # Real-time Chat with WebSocket
 # -------------------
 
-class ConnectionManager:
-    """Manages WebSocket connections for real-time chat"""
-    
-    def __init__(self):
-        # Dictionary to store active connections: {email: WebSocket}
-        self.active_connections: dict[str, WebSocket] = {}
-    
-    async def connect(self, email: str, websocket: WebSocket):
-        """Accept and store a new WebSocket connection"""
-        await websocket.accept()
-        self.active_connections[email] = websocket
-        print(f"[WebSocket] User {email} connected. Active connections: {len(self.active_connections)}")
-    
-    def disconnect(self, email: str):
-        """Remove a WebSocket connection"""
-        if email in self.active_connections:
-            del self.active_connections[email]
-            print(f"[WebSocket] User {email} disconnected. Active connections: {len(self.active_connections)}")
-    
-    async def send_personal_message(self, message: dict, email: str):
-        """Send a message to a specific user if they're connected"""
-        if email in self.active_connections:
-            try:
-                await self.active_connections[email].send_json(message)
-                print(f"[WebSocket] Message sent to {email}")
-                return True
-            except Exception as e:
-                print(f"[WebSocket] Error sending to {email}: {e}")
-                self.disconnect(email)
-                return False
-        return False
-
-# Create a global connection manager instance
-manager = ConnectionManager()
+# Create a global connection manager instance (the broker and heartbeat start in lifespan)
+manager = ConnectionManager(chat_broker.create_broker())
+# Batches message inserts behind the relay, see message_writer.py
+message_writer = MessageWriter(messages_collection)
 
 @app.websocket("/ws/{email}")
-async def websocket_endpoint(websocket: WebSocket, email: str):
+async def websocket_endpoint(websocket: WebSocket, email: str, token: Optional[str] = None):
     """
-    WebSocket endpoint for real-time chat.
-    Each user connects with their email.
+    WebSocket endpoint for real-time chat and notifications.
+    Each user connects with their email and their access token (?token=, browsers
+    can't set headers on a WebSocket). Besides chat messages, the socket receives
+    {"type": "notification", ...} events as notifications are created.
     """
-    await manager.connect(email, websocket)
+    try:
+        user = await get_current_user(token or "")
+    except HTTPException:
+        user = None
+    if user is None or user["email"] != email:
+        # The socket carries private messages and notifications. Accept first: a close
+        # before the handshake reaches the browser as 1006, which clients retry.
+        await websocket.accept()
+        await websocket.close(code=AUTH_FAILED_CLOSE_CODE)
+        return
+    connection = await manager.connect(email, websocket)
     
     try:
         while True:
             # Receive message from client
             data = await websocket.receive_json()
+            connection.touch()
+            if data.get("type") == "pong":
+                continue
             
             receiver_email = data.get("receiver_email")
             message_text = data.get("message")
             
             if not receiver_email or not message_text:
-                await websocket.send_json({
+                manager.send(connection, {
                     "error": "Missing receiver_email or message"
                 })
                 continue
             
-            # Save message to database
+            # Save message to database (write-behind: the id is assigned here, the insert is batched)
             message_doc = {
+                "_id": ObjectId(),
+                "conversation_id": chat_history.conversation_id(email, receiver_email),
+                "participants": chat_history.participants(email, receiver_email),
                 "sender_email": email,
                 "receiver_email": receiver_email,
                 "message": message_text,
@@ -1244,14 +1718,20 @@ async def websocket_endpoint(websocket: WebSocket, email: str):
                 "read": False
             }
             
-            result = await messages_collection.insert_one(message_doc)
-            message_doc["_id"] = str(result.inserted_id)
+            try:
+                await message_writer.write(message_doc)
+            except Exception as e:
+                # Raised with CHAT_WRITE_DURABILITY=ack, or in either mode once the writer is
+                # closed for shutdown - before anything was relayed
+                print(f"[ERROR] Failed to save message from {email}: {str(e)}")
+                manager.send(connection, {"error": "Message could not be saved, please resend"})
+                continue
             
             print(f"[WebSocket] Message from {email} to {receiver_email}: {message_text[:50]}...")
             
             # Send to receiver if they're online
             message_to_send = {
-                "_id": str(result.inserted_id),
+                "_id": str(message_doc["_id"]),
                 "sender_email": email,
                 "receiver_email": receiver_email,
                 "message": message_text,
@@ -1261,28 +1741,63 @@ async def websocket_endpoint(websocket: WebSocket, email: str):
             
             sent = await manager.send_personal_message(message_to_send, receiver_email)
             
-            # Echo back to sender with delivery status
-            await websocket.send_json({
+            # Echo back to sender with delivery status (queued like every other write to
+            # this socket, so it never interleaves with messages routed to it)
+            manager.send(connection, {
                 **message_to_send,
                 "delivered": sent
             })
     
     except WebSocketDisconnect:
-        manager.disconnect(email)
+        await manager.disconnect(connection)
         print(f"[WebSocket] Client {email} disconnected normally")
     except Exception as e:
-        manager.disconnect(email)
+        await manager.disconnect(connection)
         print(f"[WebSocket] Error for {email}: {e}")
 
+@app.get("/messages/conversations", response_model=List[ConversationSummary])
+async def get_conversations(
+    current_user: Annotated[dict, Depends(get_current_user)],
+    limit: int = pagination.DEFAULT_PAGE_SIZE,
+):
+    """
+    The current user's conversations, most recent first, with the last message
+    and how many messages from the partner are still unread.
+    """
+    try:
+        conversations = await chat_history.conversations_for(messages_collection, current_user["email"], limit)
+        partner_emails = [c["partner_email"] for c in conversations]
+        names = {}
+        if partner_emails:
+            async for partner in user_collection.find({"email": {"$in": partner_emails}}, {"email": 1, "full_name": 1}):
+                names[partner["email"]] = partner.get("full_name")
+        for conversation in conversations:
+            conversation["partner_full_name"] = names.get(conversation["partner_email"])
+        return conversations
+    
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error retrieving conversations: {str(e)}"
+        )
+
 @app.get("/messages/{email1}/{email2}", response_model=List[MessagePublic])
 async def get_chat_history(
     email1: str,
     email2: str,
-    current_user: Annotated[dict, Depends(get_current_user)]
+    response: Response,
+    current_user: Annotated[dict, Depends(get_current_user)],
+    since: Optional[str] = None,
+    before: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = pagination.DEFAULT_PAGE_SIZE,
 ):
     """
     Get chat history between two users.
     Only accessible if current_user is one of the participants.
+    Returns the newest page, oldest first; X-Next-Cursor fetches the page before it
+    (?before=, or the older ?cursor=). ?since=X-Latest-Cursor returns only newer messages.
+    See chat_history.py.
     """
     # Verify current user is part of this conversation
     if current_user["email"] not in [email1, email2]:
@@ -1290,24 +1805,28 @@ async def get_chat_history(
             status_code=403,
             detail="You can only view your own conversations"
         )
+    if since and (before or cursor):
+        raise HTTPException(status_code=400, detail="Use either since or before, not both.")
     
     try:
-        # Find all messages between these two users (in both directions)
-        messages = []
-        cursor = messages_collection.find({
-            "$or": [
-                {"sender_email": email1, "receiver_email": email2},
-                {"sender_email": email2, "receiver_email": email1}
-            ]
-        }).sort("timestamp", 1)  # Oldest first
-        
-        async for doc in cursor:
-            doc["_id"] = str(doc["_id"])
-            messages.append(MessagePublic.model_validate(doc))
+        docs, next_cursor, latest_cursor = await chat_history.history_page(
+            messages_collection,
+            chat_history.conversation_id(email1, email2),
+            since=since,
+            before=before or cursor,
+            limit=limit,
+            projection=pagination.projection_for(MessagePublic),
+            settle_seconds=message_writer.max_delay_seconds,
+        )
+        pagination.set_next_cursor(response, next_cursor)
+        if latest_cursor:
+            response.headers[chat_history.LATEST_CURSOR_HEADER] = latest_cursor
         
-        print(f"[Chat] Retrieved {len(messages)} messages between {email1} and {email2}")
-        return messages
+        print(f"[Chat] Retrieved {len(docs)} messages between {email1} and {email2}")
+        return pagination.with_string_ids(docs)
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -0,0 +1,180 @@
+# message_writer.py
+# Write-behind persistence for chat messages.
+#
+# The WebSocket handler gives every message its ObjectId up front and hands it to
+# MessageWriter, which buffers messages and stores them with one insert_many per batch
+# (CHAT_WRITE_BATCH_SIZE messages, or whatever arrived within CHAT_WRITE_FLUSH_MS).
+#
+# CHAT_WRITE_DURABILITY:
+#   relay (default) - the message is relayed at once and stored behind it; if the process
+#                     is killed outright, at most the last flush window is lost.
+#   ack             - write() returns only once the batch holding the message is stored;
+#                     messages still share insert_many round trips with concurrent senders.
+# close() (called from lifespan) flushes everything still buffered before shutdown;
+# write() after that raises MessageWriterClosed in either mode, so nothing is dropped
+# silently or left waiting on a flush that will never come.
+# Messages become visible up to max_delay_seconds after their timestamp (flush window
+# plus every attempt timing out), so history syncs hold their `since` cursor back by
+# that much (see chat_history.py). That bound assumes flushes keep up; a MongoDB outage
+# long enough to queue batches behind each other can still exceed it.
+# Retries are safe: ids are assigned before the first attempt, so a batch that was
+# partly stored only hits duplicate-key errors, which count as stored.
+
+import asyncio
+import os
+import time
+
+from pymongo.errors import BulkWriteError
+
+import metrics
+
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "100"))
+CHAT_WRITE_FLUSH_MS = float(os.getenv("CHAT_WRITE_FLUSH_MS", "50"))
+CHAT_WRITE_DURABILITY = os.getenv("CHAT_WRITE_DURABILITY", "relay")
+# Buffered messages before write() waits for room (backpressure while MongoDB is slow)
+CHAT_WRITE_QUEUE_SIZE = int(os.getenv("CHAT_WRITE_QUEUE_SIZE", "10000"))
+CHAT_WRITE_RETRIES = int(os.getenv("CHAT_WRITE_RETRIES", "5"))
+# Per insert_many attempt, so the time a message can take to be stored is bounded
+CHAT_WRITE_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("CHAT_WRITE_ATTEMPT_TIMEOUT_SECONDS", "5"))
+RETRY_BACKOFF_SECONDS = 0.2
+DUPLICATE_KEY = 11000
+
+_STOP = object()
+
+
+class MessageWriterClosed(RuntimeError):
+    """write() was called after close(); the message was not stored."""
+
+
+pending = metrics.gauge("chat_write_pending")
+persisted = metrics.counter("chat_messages_persisted_total")
+failed = metrics.counter("chat_messages_persist_failed_total")
+batch_sizes = metrics.histogram("chat_write_batch_size", buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500))
+flush_seconds = metrics.histogram("chat_write_flush_seconds")
+
+
+class MessageWriter:
+    def __init__(self, collection, batch_size=CHAT_WRITE_BATCH_SIZE, flush_ms=CHAT_WRITE_FLUSH_MS,
+                 durability=CHAT_WRITE_DURABILITY, queue_size=CHAT_WRITE_QUEUE_SIZE, retries=CHAT_WRITE_RETRIES):
+        if durability not in ["relay", "ack"]:
+            raise ValueError(f"Unknown CHAT_WRITE_DURABILITY '{durability}'. Choose 'relay' or 'ack'.")
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_seconds = flush_ms / 1000
+        self.durability = durability
+        self.retries = retries
+        self.attempt_timeout = CHAT_WRITE_ATTEMPT_TIMEOUT_SECONDS
+        self._queue = None
+        self._queue_size = queue_size
+        self._task = None
+        self._closed = False
+        self._stopped = False
+
+    @property
+    def max_delay_seconds(self):
+        """Longest a message can take from write() to being stored: flush window plus retry budget."""
+        backoff = sum(RETRY_BACKOFF_SECONDS * 2 ** attempt for attempt in range(self.retries))
+        return self.flush_seconds + (self.retries + 1) * self.attempt_timeout + backoff
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def write(self, doc):
+        """
+        Buffer a message document (its _id already set) for the next insert_many.
+        In ack mode, waits until it is stored and raises if it could not be.
+        Raises MessageWriterClosed once close() has been called.
+        """
+        if self._closed:
+            raise MessageWriterClosed("Chat message storage is shutting down.")
+        done = asyncio.get_running_loop().create_future() if self.durability == "ack" else None
+        pending.inc()
+        await self._queue.put((doc, done))
+        if self._stopped:
+            # Waited for queue room while close() ran: no flush will pick this up
+            self._reject_queued()
+            if done is None:
+                raise MessageWriterClosed("Chat message storage is shutting down.")
+        if done is not None:
+            await done
+
+    async def close(self):
+        """Flush everything buffered so far and stop."""
+        self._closed = True
+        if self._task is None:
+            return
+        await self._queue.put((_STOP, None))
+        await self._task
+        self._task = None
+        self._reject_queued()
+
+    def _reject_queued(self):
+        """Fail whatever is still queued behind _STOP (writes that were waiting for queue room)."""
+        while not self._queue.empty():
+            _, done = self._queue.get_nowait()
+            pending.dec()
+            failed.inc()
+            print("[ERROR] Dropped a chat message queued after shutdown began.")
+            if done is not None and not done.done():
+                done.set_exception(MessageWriterClosed("Chat message storage is shutting down."))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch = []
+            item = await self._queue.get()
+            deadline = loop.time() + self.flush_seconds
+            while True:
+                if item[0] is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                timeout = deadline - loop.time()
+                if len(batch) >= self.batch_size or timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if batch:
+                await self._flush(batch)
+        self._stopped = True
+
+    async def _flush(self, batch):
+        docs = [doc for doc, _ in batch]
+        start = time.perf_counter()
+        error = None
+        for attempt in range(self.retries + 1):
+            try:
+                # A timed-out attempt may still land; its retry then only hits duplicate keys
+                await asyncio.wait_for(self.collection.insert_many(docs, ordered=False), self.attempt_timeout)
+                error = None
+                break
+            except BulkWriteError as e:
+                error = e
+                if all(err.get("code") == DUPLICATE_KEY for err in e.details.get("writeErrors", [])):
+                    # Stored by an earlier attempt whose reply was lost
+                    error = None
+                    break
+            except Exception as e:
+                error = e
+            if attempt < self.retries:
+                print(f"[WARN] Chat message flush failed (attempt {attempt + 1}), retrying: {str(error)}")
+                await asyncio.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt)
+        pending.dec(len(batch))
+        flush_seconds.observe(time.perf_counter() - start)
+        batch_sizes.observe(len(batch))
+        if error is not None:
+            failed.inc(len(batch))
+            print(f"[ERROR] Dropped {len(batch)} chat messages after {self.retries + 1} attempts: {str(error)}")
+        else:
+            persisted.inc(len(batch))
+        for _, done in batch:
+            if done is None or done.done():
+                continue
+            if error is not None:
+                done.set_exception(error)
+            else:
+                done.set_result(None)
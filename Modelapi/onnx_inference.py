@@ -0,0 +1,107 @@
+# onnx_inference.py
+# onnxruntime inference backend, selected with INFERENCE_BACKEND=onnx.
+# Serves the graph written by export_onnx.py and exposes the same functions as
+# inference.py, but never imports torch/torchvision, so worker processes stay small.
+#
+# The exported graph returns the logits and, for every class, the Grad-CAM map before
+# ReLU (see export_onnx.GradCAMExport), so heatmaps need no autograd at serving time.
+
+import json
+import os
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+
+from prediction_cache import checkpoint_fingerprint
+# Re-exported so callers can use either backend module interchangeably
+from preprocessing import (
+    CROP_SIZE, InvalidImageError, StudyTooLargeError, iter_study_slices, prepare_image, render_heatmap,
+    study_members, summarize_probabilities,
+)
+
+# The served model file (same name as inference.CKPT_PATH so the API treats both alike)
+CKPT_PATH = os.getenv("ONNX_MODEL_PATH", "best_model.onnx")
+# Threads inside one operator, and threads running independent operators in parallel
+INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+INTER_OP_THREADS = int(os.getenv("ONNX_INTER_OP_THREADS", "0"))
+
+session = None
+class_names = None
+backend_report = None
+
+
+def load_model():
+    """Open an onnxruntime CPU session for CKPT_PATH and read class_names from its metadata."""
+    global session, class_names, backend_report
+    if not os.path.exists(CKPT_PATH):
+        raise FileNotFoundError(f"ONNX model not found at: {CKPT_PATH}. Run export_onnx.py first.")
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    # 0 lets onnxruntime pick based on the available cores
+    options.intra_op_num_threads = INTRA_OP_THREADS
+    options.inter_op_num_threads = INTER_OP_THREADS
+    if INTER_OP_THREADS > 1:
+        options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    # Read once: the fingerprint must describe exactly the bytes that get loaded
+    with open(CKPT_PATH, "rb") as f:
+        data = f.read()
+    session = ort.InferenceSession(data, sess_options=options, providers=["CPUExecutionProvider"])
+    class_names = json.loads(session.get_modelmeta().custom_metadata_map["class_names"])
+    backend_report = {
+        "backend": "onnx", "intra_op_threads": INTRA_OP_THREADS, "inter_op_threads": INTER_OP_THREADS,
+        "checkpoint": checkpoint_fingerprint(data),
+    }
+    print(f"[INFO] ONNX model loaded and ready (pid {os.getpid()}).")
+
+
+def describe_backend():
+    """Backend details reported by /health/ready (called in the worker that loaded the model)."""
+    return {**backend_report, "class_names": list(class_names)}
+
+
+def init_worker():
+    """Process-pool initializer: every worker process opens its own session."""
+    load_model()
+
+
+def cam_to_heatmap(cam, size=(CROP_SIZE, CROP_SIZE)):
+    """Turn one raw (7, 7) Grad-CAM map into a uint8 (224, 224) heatmap."""
+    cam = np.maximum(cam, 0)
+    if cam.max() > 0:
+        cam = cam / cam.max()
+    cam_resized = cv2.resize(cam.astype(np.float32), size, interpolation=cv2.INTER_LINEAR)
+    return np.uint8(255 * np.clip(cam_resized, 0, 1))
+
+
+def predict_batch(items):
+    """
+    Classify a batch with one session.run call.
+
+    Args:
+        items: List of (img_input, with_heatmap) tuples, img_input being a (3, 224, 224) array
+
+    Returns:
+        One (pred_idx, summary, heatmap, raw_cam, probs) tuple per item, in order. Items that
+        did not ask for a heatmap get their raw (7, 7) map instead, for render_deferred_heatmap.
+        probs is the raw softmax row as a list of floats.
+    """
+    batch = np.stack([img_input for img_input, _ in items]).astype(np.float32, copy=False)
+    logits, cams = session.run(["logits", "cams"], {"input": batch})
+    shifted = np.exp(logits - logits.max(axis=1, keepdims=True))
+    probs = shifted / shifted.sum(axis=1, keepdims=True)
+
+    results = []
+    for i, (_, with_heatmap) in enumerate(items):
+        pred_idx, summary = summarize_probabilities(probs[i], class_names)
+        cam = cams[i, pred_idx]
+        if with_heatmap:
+            results.append((pred_idx, summary, cam_to_heatmap(cam), None, probs[i].tolist()))
+        else:
+            results.append((pred_idx, summary, None, cam.copy(), probs[i].tolist()))
+    return results
+
+
+def render_deferred_heatmap(overlay_base, cam, pred_idx):
+    """Build the Grad-CAM overlay for a prediction that was returned without one (see render_heatmap)."""
+    return render_heatmap(overlay_base, cam_to_heatmap(cam))
@@ -0,0 +1,91 @@
+# pagination.py
+# Keyset (cursor) pagination for list endpoints.
+#
+# Pages are ordered by (field, _id) - or by _id alone - and the cursor encodes the last
+# row's values, so fetching page N costs the same as page 1 - no skip(). Responses stay
+# plain JSON arrays; the cursor for the next page travels in the X-Next-Cursor header
+# (absent on the last page). Every list endpoint takes the same ?limit= and ?cursor=,
+# and no request returns more than MAX_PAGE_SIZE rows; clients that need a whole list
+# follow X-Next-Cursor (see frontend/src/lib/pagination.ts).
+
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def projection_for(model, exclude=()):
+    """Mongo projection fetching only the fields a response model declares."""
+    return {(info.alias or name): 1 for name, info in model.model_fields.items() if name not in exclude}
+
+
+def encode_cursor(doc, field):
+    value = doc[field]
+    if isinstance(value, datetime):
+        payload = {"dt": value.isoformat(), "id": str(doc["_id"])}
+    else:
+        payload = {"v": None if field == "_id" else value, "id": str(doc["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(sort field value, ObjectId) from a cursor; 400 if it was tampered with or truncated."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        value = datetime.fromisoformat(payload["dt"]) if "dt" in payload else payload["v"]
+        return value, ObjectId(payload["id"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor.")
+
+
+def keyset_query(query, field, cursor, descending=True):
+    """Narrow query to the rows after cursor in (field, _id) order."""
+    if not cursor:
+        return query
+    value, last_id = decode_cursor(cursor)
+    op = "$lt" if descending else "$gt"
+    if field == "_id":
+        after = {"_id": {op: last_id}}
+    else:
+        after = {"$or": [{field: {op: value}}, {field: value, "_id": {op: last_id}}]}
+    return {"$and": [query, after]} if query else after
+
+
+async def find_page(collection, query, field, cursor=None, limit=DEFAULT_PAGE_SIZE, descending=True, projection=None):
+    """
+    One page of collection.find(query) ordered by (field, _id).
+
+    Returns:
+        (docs, next_cursor), next_cursor being None on the last page
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    direction = -1 if descending else 1
+    sort = [("_id", direction)] if field == "_id" else [(field, direction), ("_id", direction)]
+    docs = await (
+        collection.find(keyset_query(query, field, cursor, descending), projection)
+        .sort(sort)
+        .limit(limit + 1)
+        .to_list(length=None)
+    )
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor(docs[-1], field)
+
+
+def set_next_cursor(response, next_cursor):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+
+def with_string_ids(docs):
+    for doc in docs:
+        doc["_id"] = str(doc["_id"])
+    return docs
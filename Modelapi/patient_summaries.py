@@ -0,0 +1,179 @@
+# patient_summaries.py
+# Per-patient "latest results" summary, kept on the patient's user document as
+# `clinical_summary` and updated whenever an assessment or cognitive test is saved,
+# so dashboards read one document per patient instead of scanning their history.
+#
+# Each record_* call is a single atomic update (an update pipeline reads the previous
+# values), so concurrent saves can't lose a count.
+#
+# Only summaries with `complete: true` are read. New patients start with a complete empty
+# summary (new_summary()); patients with history from before summaries existed get one
+# from the backfill. Until then record_* still folds writes into a partial summary, and
+# dashboards keep computing those patients' results from the source collections.
+#
+# Backfill existing data (safe to re-run; recomputes everything from the source collections).
+# Run it with result writes stopped: a save landing between its reads and its writes
+# would be overwritten.
+#   python patient_summaries.py --uri "mongodb+srv://..." [--db alzAwareDB]
+
+import argparse
+import asyncio
+import os
+from datetime import datetime, timezone
+
+from dashboard_queries import HIGH_RISK_PREDICTIONS
+
+# Least to most severe; trend compares the last two assessments on this scale
+SEVERITY_ORDER = ["No Impairment", "Very Mild Impairment", "Mild Impairment", "Moderate Impairment"]
+SUMMARY = "$clinical_summary"
+
+
+def _public(doc, drop=()):
+    doc = {k: v for k, v in doc.items() if k not in drop}
+    doc["_id"] = str(doc["_id"])
+    return doc
+
+
+def _literal(value):
+    # Update pipelines would read a string starting with "$" as a field path
+    return {"$literal": value}
+
+
+def _trend(previous, last):
+    """Aggregation expression: 'worsening' / 'improving' / 'stable', or None without two known values."""
+    return {"$let": {
+        "vars": {"p": {"$indexOfArray": [SEVERITY_ORDER, previous]}, "l": {"$indexOfArray": [SEVERITY_ORDER, last]}},
+        "in": {"$switch": {"branches": [
+            {"case": {"$or": [{"$lt": ["$$p", 0]}, {"$lt": ["$$l", 0]}]}, "then": None},
+            {"case": {"$gt": ["$$l", "$$p"]}, "then": "worsening"},
+            {"case": {"$lt": ["$$l", "$$p"]}, "then": "improving"},
+        ], "default": "stable"}},
+    }}
+
+
+def new_summary():
+    """Complete summary for a patient with no results yet (set at registration)."""
+    return {"complete": True, "updated_at": datetime.now(timezone.utc), "assessment_count": 0, "high_risk_count": 0,
+            "high_risk": False, "cognitive_test_count": 0, "audio_recall_count": 0}
+
+
+def _count(field, increment=1):
+    return {"$add": [{"$ifNull": [f"{SUMMARY}.{field}", 0]}, increment]}
+
+
+async def record_assessment(users, email, assessment_doc):
+    """Fold a newly inserted assessment into the owner's summary."""
+    prediction = assessment_doc["prediction"]
+    high_risk = prediction in HIGH_RISK_PREDICTIONS
+    await users.update_one({"email": email}, [
+        {"$set": {"clinical_summary.previous_prediction": f"{SUMMARY}.last_prediction"}},
+        {"$set": {
+            "clinical_summary.last_prediction": _literal(prediction),
+            "clinical_summary.last_mri_result": _literal(_public(assessment_doc, drop=("heatmap_key",))),
+            "clinical_summary.assessment_count": _count("assessment_count"),
+            "clinical_summary.high_risk_count": _count("high_risk_count", int(high_risk)),
+            "clinical_summary.high_risk": high_risk,
+            "clinical_summary.updated_at": datetime.now(timezone.utc),
+        }},
+        {"$set": {"clinical_summary.trend": _trend(f"{SUMMARY}.previous_prediction", f"{SUMMARY}.last_prediction")}},
+    ])
+
+
+async def record_cognitive_test(users, email, test_doc):
+    await users.update_one({"email": email}, [{"$set": {
+        "clinical_summary.last_cognitive_score": _literal(_public(test_doc)),
+        "clinical_summary.cognitive_test_count": _count("cognitive_test_count"),
+        "clinical_summary.updated_at": datetime.now(timezone.utc),
+    }}])
+
+
+async def record_audio_recall_test(users, email, test_doc):
+    await users.update_one({"email": email}, [{"$set": {
+        "clinical_summary.last_audio_recall": _literal(_public(test_doc, drop=("round_details",))),
+        "clinical_summary.audio_recall_count": _count("audio_recall_count"),
+        "clinical_summary.updated_at": datetime.now(timezone.utc),
+    }}])
+
+
+async def _latest(collection, extra_group=None, drop=()):
+    """{owner_email: {"doc": newest doc, "count": n, ...extra_group}} in one aggregation."""
+    group = {"_id": "$owner_email", "doc": {"$first": "$$ROOT"}, "count": {"$sum": 1}, **(extra_group or {})}
+    pipeline = [{"$sort": {"owner_email": 1, "created_at": -1}}, {"$group": group}]
+    rows = {}
+    async for row in collection.aggregate(pipeline, allowDiskUse=True):
+        row["doc"] = _public(row["doc"], drop=drop)
+        rows[row["_id"]] = row
+    return rows
+
+
+async def backfill(db):
+    """
+    Recompute every patient's clinical_summary from the source collections and mark it
+    complete. Returns patients updated. Run with result writes stopped (see top of file).
+    """
+    from pymongo import UpdateOne
+
+    assessments, cognitive, audio = await asyncio.gather(
+        _latest(db.assessments, extra_group={
+            "last_two": {"$firstN": {"n": 2, "input": "$prediction"}},
+            "high_risk_count": {"$sum": {"$cond": [{"$in": ["$prediction", HIGH_RISK_PREDICTIONS]}, 1, 0]}},
+        }, drop=("heatmap_key",)),
+        _latest(db.cognitive_tests),
+        _latest(db.audio_recall_tests, drop=("round_details",)),
+    )
+    updates = []
+    for email in set(assessments) | set(cognitive) | set(audio):
+        summary = new_summary()
+        if email in assessments:
+            row = assessments[email]
+            # $firstN after the $sort: newest first
+            last, previous = (row["last_two"] + [None])[:2]
+            summary.update(
+                last_prediction=last, previous_prediction=previous, last_mri_result=row["doc"],
+                assessment_count=row["count"], high_risk_count=row["high_risk_count"],
+                high_risk=last in HIGH_RISK_PREDICTIONS,
+                trend=_python_trend(previous, last),
+            )
+        if email in cognitive:
+            summary.update(last_cognitive_score=cognitive[email]["doc"], cognitive_test_count=cognitive[email]["count"])
+        if email in audio:
+            summary.update(last_audio_recall=audio[email]["doc"], audio_recall_count=audio[email]["count"])
+        updates.append(UpdateOne({"email": email}, {"$set": {"clinical_summary": summary}}))
+
+    for i in range(0, len(updates), 500):
+        await db.users.bulk_write(updates[i:i + 500], ordered=False)
+    # Everyone left has no results at all
+    empty = await db.users.update_many(
+        {"role": {"$ne": "doctor"}, "clinical_summary.complete": {"$ne": True}},
+        {"$set": {"clinical_summary": new_summary()}},
+    )
+    return len(updates) + empty.modified_count
+
+
+def _python_trend(previous, last):
+    if previous not in SEVERITY_ORDER or last not in SEVERITY_ORDER:
+        return None
+    p, l = SEVERITY_ORDER.index(previous), SEVERITY_ORDER.index(last)
+    return "worsening" if l > p else "improving" if l < p else "stable"
+
+
+def main():
+    import motor.motor_asyncio
+
+    parser = argparse.ArgumentParser(description="Backfill clinical_summary on every patient's user document.")
+    parser.add_argument("--uri", default=os.getenv("MONGO_URI"), required=os.getenv("MONGO_URI") is None)
+    parser.add_argument("--db", default="alzAwareDB")
+    args = parser.parse_args()
+
+    async def run():
+        client = motor.motor_asyncio.AsyncIOMotorClient(args.uri)
+        try:
+            return await backfill(client[args.db])
+        finally:
+            client.close()
+
+    print(f"[INFO] Backfilled clinical_summary for {asyncio.run(run())} patients.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# prediction_cache.py
+# Content-addressed cache of /predict results, keyed by the SHA-256 of the uploaded
+# bytes and scoped to one model checkpoint version: the fingerprint of the checkpoint
+# bytes the backend actually loaded (see load_model), so replacing the file on disk
+# without a restart can't mix its results into the running model's cache.
+# Tier 1 is an in-memory LRU; tier 2 (optional) is one JSON file per entry on disk,
+# shared by the workers on a node and capped at max_disk_entries: every so often the
+# least recently used files (by mtime, which hits refresh) are pruned. Disk failures
+# are logged and never fail the request that triggered them.
+# Nothing is served until set_version() is called with the loaded model's fingerprint.
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+import metrics
+
+
+def hash_upload(contents: bytes) -> str:
+    return hashlib.sha256(contents).hexdigest()
+
+
+def checkpoint_fingerprint(data: bytes) -> str:
+    """Version of a checkpoint, from the exact bytes a backend loaded."""
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+class PredictionCache:
+    def __init__(self, max_entries=1024, disk_dir=None, max_disk_entries=10000):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Disk writes since the last prune; pruning lists the whole directory, so not on every put
+        self._disk_writes = 0
+        self.invalidations = metrics.counter("prediction_cache_invalidations_total")
+
+    def set_version(self, version: str):
+        """Drop every entry cached for another checkpoint version."""
+        with self._lock:
+            if version == self.version:
+                return
+            previous, self.version = self.version, version
+            self._entries.clear()
+        if previous is not None:
+            self.invalidations.inc()
+            print(f"[Cache] Model checkpoint changed ({previous} -> {version}); prediction cache cleared.")
+        if self.disk_dir and os.path.isdir(self.disk_dir):
+            for name in os.listdir(self.disk_dir):
+                if name != version:
+                    shutil.rmtree(os.path.join(self.disk_dir, name), ignore_errors=True)
+
+    def _disk_path(self, digest):
+        return os.path.join(self.disk_dir, self.version, f"{digest}.json")
+
+    def get(self, digest):
+        """Return the cached result for an upload digest, or None."""
+        if self.version is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+        if entry is None and self.disk_dir:
+            path = self._disk_path(digest)
+            try:
+                with open(path) as f:
+                    entry = json.load(f)
+                # Recently used: keep it through the next prune
+                os.utime(path)
+            except (OSError, ValueError):
+                entry = None
+            if entry is not None:
+                self._remember(digest, entry)
+        return dict(entry) if entry is not None else None
+
+    def put(self, digest, result):
+        if self.version is None:
+            return
+        entry = {k: result[k] for k in ("prediction", "confidence", "class_probabilities", "heatmap_url")}
+        self._remember(digest, entry)
+        if self.disk_dir:
+            self._write_disk(digest, entry)
+
+    def _write_disk(self, digest, entry):
+        path = self._disk_path(digest)
+        # Unique temp name: other workers on the node may write the same digest concurrently
+        tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[WARN] Could not write prediction cache entry {digest}: {str(e)}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._disk_writes += 1
+            prune = self._disk_writes >= max(1, self.max_disk_entries // 10)
+            if prune:
+                self._disk_writes = 0
+        if prune:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Delete the least recently used files beyond max_disk_entries (down to 90% of it)."""
+        version_dir = os.path.join(self.disk_dir, self.version)
+        files = []
+        try:
+            with os.scandir(version_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".json"):
+                        try:
+                            files.append((entry.stat().st_mtime, entry.path))
+                        except FileNotFoundError:
+                            continue
+        except OSError as e:
+            print(f"[WARN] Could not prune the prediction cache directory: {str(e)}")
+            return
+        if len(files) <= self.max_disk_entries:
+            return
+        files.sort()
+        for _, path in files[:len(files) - int(self.max_disk_entries * 0.9)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _remember(self, digest, entry):
+        with self._lock:
+            self._entries[digest] = entry
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget_heatmaps(self, urls):
+        """Drop entries pointing at heatmaps that no longer exist (see the heatmap sweeper)."""
+        urls = set(urls)
+        with self._lock:
+            for digest in [d for d, entry in self._entries.items() if entry["heatmap_url"] in urls]:
+                del self._entries[digest]
+        if self.disk_dir and self.version and os.path.isdir(os.path.join(self.disk_dir, self.version)):
+            version_dir = os.path.join(self.disk_dir, self.version)
+            for name in os.listdir(version_dir):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(version_dir, name)
+                try:
+                    with open(path) as f:
+                        stale = json.load(f).get("heatmap_url") in urls
+                except (FileNotFoundError, ValueError):
+                    continue
+                if stale:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.disk_dir:
+            shutil.rmtree(self.disk_dir, ignore_errors=True)
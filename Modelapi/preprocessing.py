@@ -0,0 +1,293 @@
+# preprocessing.py
+# Torch-free image handling shared by every inference backend: upload validation,
+# model-input normalization and Grad-CAM overlay rendering.
+# Only depends on NumPy, OpenCV and Pillow, so onnxruntime workers never import torch.
+
+import hashlib
+import io
+import os
+import tarfile
+import time
+import zipfile
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Overlay encoding: png (lossless), jpeg or webp (several times smaller)
+HEATMAP_FORMAT = os.getenv("HEATMAP_FORMAT", "png").lower()
+HEATMAP_QUALITY = int(os.getenv("HEATMAP_QUALITY", "85"))
+HEATMAP_ENCODINGS = {"png": ("PNG", ".png", "image/png"), "jpeg": ("JPEG", ".jpg", "image/jpeg"), "webp": ("WEBP", ".webp", "image/webp")}
+
+# Input geometry and ImageNet normalization the classifier was trained with
+RESIZE_SIZE = 256
+CROP_SIZE = 224
+NORM_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32).reshape(3, 1, 1)
+NORM_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32).reshape(3, 1, 1)
+# Uploads larger than this (longer side, pixels) are downscaled right after decoding
+MAX_DECODE_SIDE = int(os.getenv("PREPROCESS_MAX_SIDE", "1024"))
+
+
+class InvalidImageError(ValueError):
+    """Raised when an upload is not a plausible grayscale brain MRI."""
+
+
+class StudyTooLargeError(ValueError):
+    """Raised when a /predict/batch upload has too many slices, an oversized slice or expands too far."""
+
+
+def _is_metadata(name):
+    base = os.path.basename(name)
+    return not base or base.startswith(".") or "__MACOSX" in name.split("/")
+
+
+def _open_study(filename, contents: bytes):
+    """("zip" | "tar", archive) or ("single", None); the caller closes the archive."""
+    stream = io.BytesIO(contents)
+    if zipfile.is_zipfile(stream):
+        return "zip", zipfile.ZipFile(stream)
+    stream.seek(0)
+    try:
+        return "tar", tarfile.open(fileobj=stream, mode="r:*")
+    except tarfile.TarError:
+        return "single", None
+
+
+def _slice_members(kind, archive):
+    """The archive's slice members in name order, skipping directories and dotfiles/__MACOSX metadata."""
+    if kind == "zip":
+        members = [i for i in archive.infolist() if not i.is_dir() and not _is_metadata(i.filename)]
+        return sorted(members, key=lambda i: i.filename)
+    members = [m for m in archive.getmembers() if m.isfile() and not _is_metadata(m.name)]
+    return sorted(members, key=lambda m: m.name)
+
+
+def study_members(filename, contents: bytes, max_slice_bytes):
+    """
+    [(name, size)] of the slices in one /predict/batch upload, read from the archive's
+    directory alone - nothing is decompressed. Zip and (optionally compressed) tar
+    archives list their regular files; anything else is a single slice. Sizes are the
+    expanded sizes (zipfile refuses to inflate a member past its declared size), so
+    callers can cap a study's total before iter_study_slices reads any of it.
+    """
+    kind, archive = _open_study(filename, contents)
+    if kind == "single":
+        members = [(filename or "upload", len(contents))]
+    else:
+        with archive:
+            if kind == "zip":
+                members = [(i.filename, i.file_size) for i in _slice_members(kind, archive)]
+            else:
+                members = [(m.name, m.size) for m in _slice_members(kind, archive)]
+    for name, size in members:
+        if size > max_slice_bytes:
+            raise StudyTooLargeError(f"Slice '{name}' is larger than {max_slice_bytes} bytes.")
+    return members
+
+
+def iter_study_slices(filename, contents: bytes):
+    """
+    Yield (name, bytes) for each slice of an upload, in study_members() order, reading
+    one member at a time so only the slices being scored are ever expanded in memory.
+    """
+    kind, archive = _open_study(filename, contents)
+    if kind == "single":
+        yield filename or "upload", contents
+        return
+    with archive:
+        for member in _slice_members(kind, archive):
+            if kind == "zip":
+                yield member.filename, archive.read(member)
+            else:
+                yield member.name, archive.extractfile(member).read()
+
+
+def decode_image(contents: bytes):
+    """
+    Decode an upload exactly once into an 8-bit buffer that every later step shares:
+    (H, W) for grayscale files, (H, W, 3) RGB otherwise. Images whose longer side
+    exceeds MAX_DECODE_SIDE (e.g. DICOM-exported PNGs) are downscaled right away so
+    validation and normalization never touch the full-resolution pixels.
+    """
+    buf = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_UNCHANGED)
+    if buf is None:
+        raise InvalidImageError("Invalid image shape. Please upload a proper brain MRI scan.")
+
+    # 16-bit scans: keep the high byte, the same as cv2's 8-bit decode
+    if buf.dtype == np.uint16:
+        buf = (buf >> 8).astype(np.uint8)
+    elif buf.dtype != np.uint8:
+        buf = cv2.normalize(buf, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+
+    if buf.ndim == 3:
+        if buf.shape[2] == 1:
+            buf = buf[:, :, 0]
+        elif buf.shape[2] == 4:
+            buf = cv2.cvtColor(buf, cv2.COLOR_BGRA2RGB)
+        else:
+            buf = cv2.cvtColor(buf, cv2.COLOR_BGR2RGB)
+
+    h, w = buf.shape[:2]
+    if max(h, w) > MAX_DECODE_SIDE:
+        scale = MAX_DECODE_SIDE / max(h, w)
+        buf = cv2.resize(buf, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    return buf
+
+
+# --- HELPER FUNCTION FOR IMAGE VALIDATION ---
+def is_brain_mri_shape(gray, aspect_ratio_min=0.75, aspect_ratio_max=1.3) -> bool:
+    """
+    Checks if the main object in a grayscale image has an aspect ratio typical of a brain MRI.
+    Returns True if the shape is plausible, False otherwise.
+    """
+    try:
+        # Threshold to create a binary mask and find contours
+        _, thresh = cv2.threshold(gray, 30, 255, cv2.THRESH_BINARY)
+        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        if not contours:
+            return False # No object found
+
+        # Find the largest contour (the brain/skull) and its bounding box
+        largest_contour = max(contours, key=cv2.contourArea)
+        x, y, w, h = cv2.boundingRect(largest_contour)
+
+        if h == 0 or w == 0:
+            return False
+
+        # Calculate the aspect ratio (width / height)
+        aspect_ratio = w / h
+
+        # Check if the ratio is within the expected range for a brain scan
+        return aspect_ratio_min < aspect_ratio < aspect_ratio_max
+    except Exception:
+        # If any error occurs during processing, assume it's not a valid image
+        return False
+
+
+def to_model_input(buf):
+    """
+    Resize(256) + CenterCrop(224) + ToTensor + Normalize on a decode_image() buffer,
+    returned as a float32 (3, 224, 224) NumPy array. Shrinking uses area interpolation,
+    which approximates the antialiased bilinear resize of torchvision's PIL pipeline.
+    Only the 224x224 crop is converted to float.
+    """
+    h, w = buf.shape[:2]
+    if w <= h:
+        new_w, new_h = RESIZE_SIZE, int(RESIZE_SIZE * h / w)
+    else:
+        new_w, new_h = int(RESIZE_SIZE * w / h), RESIZE_SIZE
+    interpolation = cv2.INTER_AREA if new_w < w else cv2.INTER_LINEAR
+    resized = cv2.resize(buf, (new_w, new_h), interpolation=interpolation)
+    top = int(round((new_h - CROP_SIZE) / 2.0))
+    left = int(round((new_w - CROP_SIZE) / 2.0))
+    crop = resized[top:top + CROP_SIZE, left:left + CROP_SIZE].astype(np.float32) / 255.0
+    if crop.ndim == 3:
+        crop = crop.transpose(2, 0, 1)
+    # A (224, 224) grayscale crop broadcasts against the per-channel statistics,
+    # which is the same as replicating it into three RGB channels
+    return ((crop - NORM_MEAN) / NORM_STD).astype(np.float32)
+
+
+def prepare_image(contents: bytes):
+    """
+    Validate an uploaded MRI and turn it into a normalized model input,
+    all from a single decode of the upload.
+
+    Returns:
+        (overlay_base, img_input, timings): the upload as a (224, 224, 3) RGB uint8
+        array for the heatmap overlay, a float32 (3, 224, 224) model input and a dict
+        of stage name -> seconds.
+    """
+    timings = {}
+    start = time.perf_counter()
+    buf = decode_image(contents)
+    timings["decode"] = time.perf_counter() - start
+
+    # --- Step 1: Validate the shape of the image FIRST ---
+    start = time.perf_counter()
+    gray = buf if buf.ndim == 2 else cv2.cvtColor(buf, cv2.COLOR_RGB2GRAY)
+    if not is_brain_mri_shape(gray):
+        raise InvalidImageError("Invalid image shape. Please upload a proper brain MRI scan.")
+
+    # Check for grayscale (this is still a good check to keep)
+    is_grayscale = buf.ndim == 2 or np.array_equal(buf[:, :, 0], buf[:, :, 1])
+    if not is_grayscale:
+        raise InvalidImageError("Incorrect image type. Please upload a grayscale MRI scan.")
+    timings["validate"] = time.perf_counter() - start
+
+    # --- Step 2: Normalize for the Alzheimer's model ---
+    start = time.perf_counter()
+    img_input = to_model_input(buf)
+    overlay_base = cv2.resize(buf, (CROP_SIZE, CROP_SIZE), interpolation=cv2.INTER_AREA)
+    if overlay_base.ndim == 2:
+        overlay_base = cv2.cvtColor(overlay_base, cv2.COLOR_GRAY2RGB)
+    timings["preprocess"] = time.perf_counter() - start
+    return overlay_base, img_input, timings
+
+
+def summarize_probabilities(probs, class_names):
+    """Build the class/confidence part of the /predict response from one softmax row."""
+    pred_idx = int(probs.argmax())
+    return pred_idx, {
+        "prediction": class_names[pred_idx],
+        "confidence": float(probs[pred_idx]),
+        "class_probabilities": {class_names[i]: f"{float(probs[i]):.2%}" for i in range(len(probs))},
+    }
+
+
+def create_heatmap_overlay(overlay_base, heatmap):
+    """
+    Create an overlay of the heatmap on the original image.
+
+    Args:
+        overlay_base: RGB uint8 array (224, 224, 3) from prepare_image
+        heatmap: Numpy array (224, 224) with values 0-255
+
+    Returns:
+        overlay: PIL Image object of the blended result
+    """
+    # Apply colormap to heatmap (JET colormap)
+    heatmap_colored = cv2.applyColorMap(heatmap, cv2.COLORMAP_JET)
+    heatmap_colored = cv2.cvtColor(heatmap_colored, cv2.COLOR_BGR2RGB)
+
+    # Blend the heatmap with the original image
+    alpha = 0.4  # Transparency factor
+    overlay = cv2.addWeighted(overlay_base, 1 - alpha, heatmap_colored, alpha, 0)
+
+    # Convert back to PIL Image
+    overlay_pil = Image.fromarray(overlay)
+
+    return overlay_pil
+
+
+def encode_overlay(overlay_img):
+    """Encode an overlay in HEATMAP_FORMAT; returns (bytes, file extension, content type)."""
+    pil_format, extension, content_type = HEATMAP_ENCODINGS[HEATMAP_FORMAT]
+    options = {} if pil_format == "PNG" else {"quality": HEATMAP_QUALITY}
+    buffer = io.BytesIO()
+    overlay_img.save(buffer, format=pil_format, **options)
+    return buffer.getvalue(), extension, content_type
+
+
+def render_heatmap(overlay_base, heatmap):
+    """
+    Blend a Grad-CAM heatmap over the upload and encode it for storage.
+    Returns (key, data, content_type), or None if rendering failed. The API stores it
+    (see main.store_heatmap) from the request, not the inference worker. Overlays are
+    keyed by their content hash, so the same slice scored twice reuses one file.
+    """
+    if heatmap is None:
+        return None
+    try:
+        # Create overlay image
+        overlay_img = create_heatmap_overlay(overlay_base, heatmap)
+        data, extension, content_type = encode_overlay(overlay_img)
+
+        # Key the overlay image by its content hash
+        key = f"heatmaps/heatmap_{hashlib.sha256(data).hexdigest()[:32]}{extension}"
+        return key, data, content_type
+
+    except Exception as e:
+        print(f"[ERROR] Failed to generate heatmap: {str(e)}")
+        return None
@@ -0,0 +1,185 @@
+# storage.py
+# Where generated files (Grad-CAM overlays) are kept and how clients reach them.
+#
+# STORAGE_BACKEND=local writes under uploads/ and builds URLs from PUBLIC_BASE_URL;
+# that directory can be served by this app's /uploads mount or, with SERVE_UPLOADS=0,
+# by a reverse proxy. STORAGE_BACKEND=s3 writes to any S3-compatible store (AWS, MinIO,
+# ...) so several API nodes share the same heatmaps.
+#
+# Writes go through a small background thread pool, off the event loop and the inference
+# workers; put_async() hands back a future that resolves to the URL once the object exists.
+
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+# Base URL clients use to reach this API (and, for local storage, its /uploads mount)
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "http://127.0.0.1:8000").rstrip("/")
+LOCAL_STORAGE_ROOT = os.getenv("LOCAL_STORAGE_ROOT", "uploads")
+# S3-compatible settings; S3_ENDPOINT_URL points at MinIO or another stand-in, unset for AWS
+S3_BUCKET = os.getenv("S3_BUCKET", "alzaware")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION") or None
+# Public URL prefix for stored objects (bucket website, CDN); defaults to endpoint/bucket
+S3_PUBLIC_URL = os.getenv("S3_PUBLIC_URL") or None
+STORAGE_WRITE_THREADS = int(os.getenv("STORAGE_WRITE_THREADS", "2"))
+
+
+class LocalStorage:
+    def __init__(self, root, public_url):
+        self.root = root
+        self.public_url = public_url
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def put(self, key, data: bytes, content_type):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique temp name: identical (deduplicated) overlays may be written concurrently
+        tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def modified(self, key):
+        """Last modified time as a Unix timestamp, or None if the object doesn't exist."""
+        try:
+            return os.stat(self._path(key)).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def touch(self, key):
+        """Reset the object's last modified time to now. Returns False if it doesn't exist."""
+        try:
+            os.utime(self._path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def list(self, prefix):
+        """(key, size in bytes, last modified as a Unix timestamp) for every object under prefix."""
+        directory = self._path(prefix.rstrip("/"))
+        if not os.path.isdir(directory):
+            return
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    st = entry.stat()
+                    yield f"{prefix.rstrip('/')}/{entry.name}", st.st_size, st.st_mtime
+
+    def url(self, key):
+        return f"{self.public_url}/uploads/{key}"
+
+
+class S3Storage:
+    def __init__(self, bucket, endpoint_url=None, region=None, public_url=None):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs boto3 (pip install boto3).")
+        self.bucket = bucket
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        if public_url is None:
+            public_url = f"{endpoint_url or 'https://s3.amazonaws.com'}/{bucket}"
+        self.public_url = public_url.rstrip("/")
+
+    def put(self, key, data: bytes, content_type):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType=content_type)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def _head(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ["404", "NoSuchKey", "NotFound"]:
+                return None
+            raise
+
+    def modified(self, key):
+        """Last modified time as a Unix timestamp, or None if the object doesn't exist."""
+        head = self._head(key)
+        return None if head is None else head["LastModified"].timestamp()
+
+    def touch(self, key):
+        """Reset the object's last modified time to now. Returns False if it doesn't exist."""
+        head = self._head(key)
+        if head is None:
+            return False
+        # S3 has no utime: copying the object onto itself (with REPLACE) rewrites LastModified
+        self.client.copy_object(
+            Bucket=self.bucket, Key=key, CopySource={"Bucket": self.bucket, "Key": key},
+            MetadataDirective="REPLACE", ContentType=head.get("ContentType", "application/octet-stream"),
+            Metadata=head.get("Metadata", {}),
+        )
+        return True
+
+    def list(self, prefix):
+        """(key, size in bytes, last modified as a Unix timestamp) for every object under prefix."""
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                yield obj["Key"], obj["Size"], obj["LastModified"].timestamp()
+
+    def url(self, key):
+        return f"{self.public_url}/{key}"
+
+
+_storage = None
+_storage_lock = threading.Lock()
+_writer = None
+
+
+def get_storage():
+    """The configured backend, created on first use (once per process)."""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            if STORAGE_BACKEND == "s3":
+                _storage = S3Storage(S3_BUCKET, S3_ENDPOINT_URL, S3_REGION, S3_PUBLIC_URL)
+            elif STORAGE_BACKEND == "local":
+                _storage = LocalStorage(LOCAL_STORAGE_ROOT, PUBLIC_BASE_URL)
+            else:
+                raise ValueError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}'. Choose 'local' or 's3'.")
+        return _storage
+
+
+def key_for_url(url):
+    """The storage key behind one of our public URLs, or None for anything else."""
+    prefix = get_storage().url("")
+    if url and url.startswith(prefix) and len(url) > len(prefix):
+        return url[len(prefix):]
+    return None
+
+
+def _write(key, data, content_type):
+    storage = get_storage()
+    try:
+        storage.put(key, data, content_type)
+    except Exception as e:
+        print(f"[ERROR] Failed to store {key}: {str(e)}")
+        raise
+    return storage.url(key)
+
+
+def put_async(key, data: bytes, content_type):
+    """
+    Queue a write on the storage threads. Returns a concurrent.futures.Future that
+    resolves to the object's public URL once it can be fetched (or raises if the write failed).
+    """
+    global _writer
+    with _storage_lock:
+        if _writer is None:
+            _writer = ThreadPoolExecutor(max_workers=STORAGE_WRITE_THREADS, thread_name_prefix="storage")
+    return _writer.submit(_write, key, data, content_type)
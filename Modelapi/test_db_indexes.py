@@ -0,0 +1,36 @@
+# test_db_indexes.py
+# Fails if any query shape in db_indexes.QUERY_PLANS falls back to a COLLSCAN.
+#
+# Needs a real mongod (mongomock has no query planner), so it is skipped unless
+# MONGO_TEST_URI is set:
+#   MONGO_TEST_URI=mongodb://localhost:27017 python -m pytest -q test_db_indexes.py
+# It works in a throwaway database that is dropped afterwards.
+
+import asyncio
+import os
+import uuid
+
+import pytest
+
+MONGO_TEST_URI = os.getenv("MONGO_TEST_URI")
+if not MONGO_TEST_URI:
+    pytest.skip("MONGO_TEST_URI is not set", allow_module_level=True)
+
+motor_asyncio = pytest.importorskip("motor.motor_asyncio")
+
+import db_indexes  # noqa: E402  (needs pymongo, which comes with motor)
+
+
+def test_no_query_plan_uses_a_collscan():
+    async def check():
+        client = motor_asyncio.AsyncIOMotorClient(MONGO_TEST_URI)
+        db_name = f"alzAwareDB_indexcheck_{uuid.uuid4().hex[:8]}"
+        try:
+            await db_indexes.ensure_indexes(client[db_name])
+            return await db_indexes.find_collscans(client[db_name])
+        finally:
+            await client.drop_database(db_name)
+            client.close()
+
+    offenders = asyncio.run(check())
+    assert offenders == [], f"COLLSCAN for: {offenders}"
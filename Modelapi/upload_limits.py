@@ -0,0 +1,162 @@
+# upload_limits.py
+# Bounded, chunked ingestion of user uploads (MRI slices, study archives, profile photos).
+#
+# Two layers keep a large or malicious upload from ballooning worker memory:
+#   - BodySizeLimitMiddleware rejects a request by its Content-Length before the body is
+#     read, and aborts it mid-stream once it goes past the limit (chunked bodies too).
+#   - read_upload()/save_upload() sniff the first bytes of each file and refuse anything
+#     that isn't an expected type before reading further, then read or write the rest in
+#     fixed-size chunks with a hard cap. Disk writes run in a thread, off the event loop.
+
+import asyncio
+import os
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+# Per-file limits (bytes)
+MRI_UPLOAD_MAX_BYTES = int(os.getenv("MRI_UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+STUDY_UPLOAD_MAX_BYTES = int(os.getenv("STUDY_UPLOAD_MAX_BYTES", str(200 * 1024 * 1024)))
+PHOTO_UPLOAD_MAX_BYTES = int(os.getenv("PHOTO_UPLOAD_MAX_BYTES", str(5 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+# Room for multipart boundaries and headers on top of a file limit
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+# Enough leading bytes to recognise every format below (tar's magic sits at offset 257)
+SNIFF_BYTES = 512
+
+# Leading-byte signatures: (kind, offset, magic)
+SIGNATURES = [
+    ("png", 0, b"\x89PNG\r\n\x1a\n"),
+    ("jpeg", 0, b"\xff\xd8\xff"),
+    ("bmp", 0, b"BM"),
+    ("tiff", 0, b"II*\x00"),
+    ("tiff", 0, b"MM\x00*"),
+    ("gif", 0, b"GIF87a"),
+    ("gif", 0, b"GIF89a"),
+    ("zip", 0, b"PK\x03\x04"),
+    ("gzip", 0, b"\x1f\x8b"),
+    ("bzip2", 0, b"BZh"),
+    ("xz", 0, b"\xfd7zXZ\x00"),
+    ("tar", 257, b"ustar"),
+]
+EXTENSIONS = {"png": ".png", "jpeg": ".jpg", "bmp": ".bmp", "tiff": ".tif", "gif": ".gif", "webp": ".webp"}
+
+# What each endpoint accepts
+MRI_KINDS = {"png", "jpeg", "bmp", "tiff", "webp"}
+STUDY_KINDS = MRI_KINDS | {"zip", "gzip", "bzip2", "xz", "tar"}
+PHOTO_KINDS = {"png", "jpeg", "gif", "webp"}
+
+
+def sniff_kind(head: bytes):
+    """Identify a file from its first bytes; None if it matches no known signature."""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    for kind, offset, magic in SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            return kind
+    return None
+
+
+def _too_large(max_bytes):
+    return HTTPException(status_code=413, detail=f"Upload is larger than the {max_bytes // (1024 * 1024)} MB limit.")
+
+
+async def _open_checked(upload, max_bytes, kinds):
+    """Reject by declared size and sniffed type; returns (kind, first bytes)."""
+    if upload.size is not None and upload.size > max_bytes:
+        raise _too_large(max_bytes)
+    head = await upload.read(SNIFF_BYTES)
+    kind = sniff_kind(head)
+    if kind not in kinds:
+        raise HTTPException(status_code=415, detail="Unsupported file type.")
+    return kind, head
+
+
+async def read_upload(upload, max_bytes, kinds):
+    """
+    Read an UploadFile into memory in UPLOAD_CHUNK_BYTES chunks, refusing it as soon as
+    its type is wrong (415) or it grows past max_bytes (413).
+
+    Returns:
+        (contents, kind)
+    """
+    kind, head = await _open_checked(upload, max_bytes, kinds)
+    chunks, size = [head], len(head)
+    while chunk := await upload.read(UPLOAD_CHUNK_BYTES):
+        size += len(chunk)
+        if size > max_bytes:
+            raise _too_large(max_bytes)
+        chunks.append(chunk)
+    return b"".join(chunks), kind
+
+
+async def save_upload(upload, path_without_ext, max_bytes, kinds):
+    """
+    Stream an UploadFile to disk with the same checks as read_upload. The extension
+    comes from the sniffed type, never from the client's filename, and the file only
+    replaces an existing one once it has been written completely.
+
+    Returns:
+        The path written, extension included.
+    """
+    kind, head = await _open_checked(upload, max_bytes, kinds)
+    path = path_without_ext + EXTENSIONS[kind]
+    tmp_path = f"{path}.part"
+    f = await asyncio.to_thread(open, tmp_path, "wb")
+    try:
+        size = len(head)
+        await asyncio.to_thread(f.write, head)
+        while chunk := await upload.read(UPLOAD_CHUNK_BYTES):
+            size += len(chunk)
+            if size > max_bytes:
+                raise _too_large(max_bytes)
+            await asyncio.to_thread(f.write, chunk)
+        await asyncio.to_thread(f.close)
+        await asyncio.to_thread(os.replace, tmp_path, path)
+    except BaseException:
+        await asyncio.to_thread(_discard, f, tmp_path)
+        raise
+    return path
+
+
+def _discard(f, tmp_path):
+    f.close()
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+
+class BodySizeLimitMiddleware:
+    """
+    ASGI middleware capping the request body of the given paths (path -> max bytes).
+    A Content-Length over the limit is answered with 413 straight away; bodies without
+    one are counted as they arrive and the request fails with 413 once past the limit.
+    """
+
+    def __init__(self, app, limits):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            response = JSONResponse({"detail": _too_large(limit).detail}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise _too_large(limit)
+            return message
+
+        await self.app(scope, limited_receive, send)
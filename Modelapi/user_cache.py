@@ -0,0 +1,93 @@
+# user_cache.py
+# Short-TTL cache of user documents for get_current_user, keyed by email.
+#
+# USER_CACHE_BACKEND=memory (default) keeps an LRU per API worker; writes on this worker
+# invalidate immediately, other workers see the change once their entry expires
+# (USER_CACHE_TTL_SECONDS). USER_CACHE_BACKEND=redis shares one cache between workers,
+# so every invalidation is global. Pass redis_client= to use a stand-in such as fakeredis.
+
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import bson
+
+import metrics
+
+USER_CACHE_BACKEND = os.getenv("USER_CACHE_BACKEND", "memory")
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_REDIS_URL = os.getenv("USER_CACHE_REDIS_URL", "redis://localhost:6379/0")
+REDIS_KEY_PREFIX = "alzaware:user:"
+
+
+class UserCache:
+    def __init__(self, backend="memory", ttl_seconds=30.0, max_entries=10000, redis_client=None, redis_url=None):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = redis_client
+        if backend == "redis" and self._redis is None:
+            import redis.asyncio as redis
+
+            self._redis = redis.from_url(redis_url)
+        elif backend not in ["memory", "redis"]:
+            raise ValueError(f"Unknown USER_CACHE_BACKEND '{backend}'. Choose 'memory' or 'redis'.")
+        self.hits = metrics.counter("user_cache_hits_total")
+        self.misses = metrics.counter("user_cache_misses_total")
+        self.invalidations = metrics.counter("user_cache_invalidations_total")
+
+    async def get(self, email):
+        """A private copy of the cached user, or None on a miss."""
+        if self.backend == "redis":
+            try:
+                raw = await self._redis.get(REDIS_KEY_PREFIX + email)
+            except Exception as e:
+                # The cache is an optimization: fall back to MongoDB
+                print(f"[WARN] User cache read failed: {str(e)}")
+                raw = None
+            user = bson.decode(raw) if raw is not None else None
+        else:
+            with self._lock:
+                entry = self._entries.get(email)
+                if entry is not None and entry[0] < time.monotonic():
+                    del self._entries[email]
+                    entry = None
+                if entry is not None:
+                    self._entries.move_to_end(email)
+            user = copy.deepcopy(entry[1]) if entry is not None else None
+        (self.hits if user is not None else self.misses).inc()
+        return user
+
+    async def put(self, email, user):
+        if self.backend == "redis":
+            try:
+                await self._redis.set(REDIS_KEY_PREFIX + email, bson.encode(user), px=int(self.ttl_seconds * 1000))
+            except Exception as e:
+                print(f"[WARN] User cache write failed: {str(e)}")
+            return
+        with self._lock:
+            self._entries[email] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(user))
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def invalidate(self, *emails):
+        """Forget users whose document was just written."""
+        emails = [e for e in emails if e]
+        if not emails:
+            return
+        self.invalidations.inc(len(emails))
+        if self.backend == "redis":
+            try:
+                await self._redis.delete(*[REDIS_KEY_PREFIX + e for e in emails])
+            except Exception as e:
+                print(f"[ERROR] User cache invalidation failed (entries expire in {self.ttl_seconds}s): {str(e)}")
+            return
+        with self._lock:
+            for email in emails:
+                self._entries.pop(email, None)
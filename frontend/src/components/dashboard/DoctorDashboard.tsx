@@ -8,6 +8,7 @@ import { Card, CardContent, CardHeader, CardTitle, CardDescription } from '@/com
 import { Alert, AlertDescription, AlertTitle } from '@/components/ui/alert';
 import { Users, AlertTriangle, Brain, Activity, Clock, Award, Eye, UserPlus, AlertCircle, MessageCircle } from 'lucide-react';
 import PatientRequests from '@/components/doctor/PatientRequests';
+import { fetchAllPages, LIST_PAGE_SIZE } from '@/lib/pagination';
 
 interface Patient {
   full_name: string;
@@ -51,6 +52,9 @@ export default function DoctorDashboard() {
   const [dashboardData, setDashboardData] = useState<DoctorDashboardData | null>(null);
   const [allPatients, setAllPatients] = useState<Patient[]>([]);
   const [allHighRiskCases, setAllHighRiskCases] = useState<HighRiskCase[]>([]);
+  // X-Next-Cursor of the last high-risk page; null once every case is loaded
+  const [highRiskCursor, setHighRiskCursor] = useState<string | null>(null);
+  const [loadingMoreHighRisk, setLoadingMoreHighRisk] = useState(false);
   const [activeTab, setActiveTab] = useState('overview');
   const [error, setError] = useState<string | null>(null);
   const [assigningPatient, setAssigningPatient] = useState<string | null>(null);
@@ -125,12 +129,11 @@ export default function DoctorDashboard() {
     }
     
     try {
-      const response = await fetch('http://127.0.0.1:8000/patients/all', {
+      const response = await fetchAllPages<Patient>('http://127.0.0.1:8000/patients/all', {
         headers: { Authorization: `Bearer ${token}` },
       });
       if (response.ok) {
-        const data = await response.json();
-        setAllPatients(data);
+        setAllPatients(response.data);
         setError(null);
       } else {
         handleAuthError(response.status, 'fetchAllPatients');
@@ -141,32 +144,48 @@ export default function DoctorDashboard() {
     }
   };
 
-  const fetchAllHighRiskCases = async () => {
+  // Without a cursor, (re)loads the first page; with one, appends the next page
+  const fetchAllHighRiskCases = async (cursor?: string) => {
     if (!token || token.trim() === '') {
       console.error('[DoctorDashboard] Invalid token for high-risk cases');
       return;
     }
     
+    const params = new URLSearchParams({ limit: String(LIST_PAGE_SIZE) });
+    if (cursor) params.set('cursor', cursor);
     try {
       const response = await fetch(
-        'http://127.0.0.1:8000/assessments/high-risk',
+        `http://127.0.0.1:8000/assessments/high-risk?${params}`,
         {
           headers: { Authorization: `Bearer ${token}` },
         }
       );
       if (response.ok) {
-        const data = await response.json();
-        setAllHighRiskCases(data);
+        const data: HighRiskCase[] = await response.json();
+        setAllHighRiskCases(prev => (cursor ? [...prev, ...data] : data));
+        setHighRiskCursor(response.headers.get('X-Next-Cursor'));
         setError(null);
       } else {
         // Silently handle errors - don't show to user
         console.error('[DoctorDashboard] Failed to fetch high-risk cases:', response.status);
-        setAllHighRiskCases([]);
+        if (!cursor) setAllHighRiskCases([]);
+        setHighRiskCursor(null);
       }
     } catch (error) {
       // Silently handle errors - don't show to user
       console.error('[DoctorDashboard] Failed to fetch high-risk cases:', error);
-      setAllHighRiskCases([]);
+      if (!cursor) setAllHighRiskCases([]);
+      setHighRiskCursor(null);
+    }
+  };
+
+  const loadMoreHighRiskCases = async () => {
+    if (!highRiskCursor) return;
+    setLoadingMoreHighRisk(true);
+    try {
+      await fetchAllHighRiskCases(highRiskCursor);
+    } finally {
+      setLoadingMoreHighRisk(false);
     }
   };
 
@@ -700,6 +719,18 @@ export default function DoctorDashboard() {
                           })}
                         </div>
                       )}
+                      {highRiskCursor && (
+                        <div className="text-center mt-6">
+                          <Button
+                            variant="outline"
+                            onClick={loadMoreHighRiskCases}
+                            disabled={loadingMoreHighRisk}
+                            className="border-red-200 text-red-700 hover:bg-red-50"
+                          >
+                            {loadingMoreHighRisk ? 'Loading...' : 'Load more cases'}
+                          </Button>
+                        </div>
+                      )}
                     </CardContent>
                   </Card>
                 </TabsContent>
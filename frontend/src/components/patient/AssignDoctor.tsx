@@ -3,6 +3,7 @@ import { useState, useEffect } from 'react';
 import { useAuth } from '@/context/AuthContext';
 import { Button } from "@/components/ui/button";
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@/components/ui/select";
+import { fetchAllPages } from '@/lib/pagination';
 
 interface Doctor {
   _id: string;
@@ -33,12 +34,11 @@ export default function AssignDoctor() {
     const fetchDoctors = async () => {
       if (token) {
         try {
-          const response = await fetch('http://127.0.0.1:8000/doctors/all', {
+          const response = await fetchAllPages<Doctor>('http://127.0.0.1:8000/doctors/all', {
             headers: { 'Authorization': `Bearer ${token}` },
           });
           if (response.ok) {
-            const data = await response.json();
-            setDoctors(data);
+            setDoctors(response.data);
           }
         } catch (error) {
           console.error('Failed to fetch doctors:', error);
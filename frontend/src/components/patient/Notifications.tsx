@@ -1,6 +1,7 @@
 import { useEffect, useState } from 'react';
 import { useAuth } from '@/context/AuthContext';
 import axios from 'axios';
+import { getAllPages } from '@/lib/pagination';
 import { Bell, Check } from 'lucide-react';
 import { Button } from '@/components/ui/button';
 
@@ -19,7 +20,7 @@ interface NotificationsProps {
 }
 
 export default function Notifications({ maxDisplay = 3, showMarkAllRead = true }: NotificationsProps) {
-  const { token } = useAuth();
+  const { user, token } = useAuth();
   const [notifications, setNotifications] = useState<Notification[]>([]);
   const [loading, setLoading] = useState(true);
   const [showToast, setShowToast] = useState(false);
@@ -32,7 +33,7 @@ export default function Notifications({ maxDisplay = 3, showMarkAllRead = true }
     }
 
     try {
-      const response = await axios.get('http://127.0.0.1:8000/notifications/', {
+      const response = await getAllPages<Notification>('http://127.0.0.1:8000/notifications/', {
         headers: { Authorization: `Bearer ${token}` },
       });
       
@@ -99,13 +100,61 @@ export default function Notifications({ maxDisplay = 3, showMarkAllRead = true }
 
   useEffect(() => {
     fetchNotifications();
-    
-    // Poll for new notifications every 30 seconds
-    const interval = setInterval(fetchNotifications, 30000);
-    
-    return () => clearInterval(interval);
   }, [token]);
 
+  // New notifications are pushed over the WebSocket as they're created, so no polling
+  useEffect(() => {
+    if (!user?.email || !token) return;
+
+    let websocket: WebSocket | null = null;
+    let reconnectTimer: ReturnType<typeof setTimeout> | undefined;
+    let stopped = false;
+
+    const connect = () => {
+      websocket = new WebSocket(`ws://127.0.0.1:8000/ws/${user.email}?token=${encodeURIComponent(token)}`);
+
+      websocket.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+
+        // Server heartbeat: answer so the connection isn't reaped as dead
+        if (data.type === 'ping') {
+          websocket?.send(JSON.stringify({ type: 'pong' }));
+          return;
+        }
+        // Chat messages share the socket; the chat page shows them
+        if (data.type !== 'notification') return;
+
+        const notification: Notification = data.notification;
+        setNotifications(prev =>
+          prev.some(n => n._id === notification._id) ? prev : [notification, ...prev]
+        );
+        setToastMessage(`You have ${data.unread_count} new notification${data.unread_count > 1 ? 's' : ''} from your doctor!`);
+        setShowToast(true);
+        setTimeout(() => setShowToast(false), 5000);
+        console.log('[Notifications] Received', notification);
+      };
+
+      websocket.onclose = (event) => {
+        // 4401: token rejected, retrying won't help (anything else, e.g. 1013 for a
+        // slow connection, is worth a reconnect)
+        if (stopped || event.code === 4401) return;
+        // Catch up on anything created while disconnected, then reconnect
+        reconnectTimer = setTimeout(() => {
+          fetchNotifications();
+          connect();
+        }, 5000);
+      };
+    };
+
+    connect();
+
+    return () => {
+      stopped = true;
+      clearTimeout(reconnectTimer);
+      websocket?.close();
+    };
+  }, [user?.email, token]);
+
   const displayNotifications = notifications.slice(0, maxDisplay);
   const unreadCount = notifications.filter(n => n.status === 'unread').length;
 
@@ -0,0 +1,36 @@
+import axios, { type AxiosRequestConfig } from "axios"
+
+// List endpoints return one page at a time (see Modelapi/pagination.py): ask for
+// LIST_PAGE_SIZE rows and pass the X-Next-Cursor response header back as ?cursor=
+// until it is absent.
+export const LIST_PAGE_SIZE = 100
+
+// Drop-in for axios.get on a list endpoint: follows every page, rejects like axios.get
+export async function getAllPages<T>(url: string, config: AxiosRequestConfig = {}): Promise<{ data: T[] }> {
+  const data: T[] = []
+  let cursor: string | null = null
+  do {
+    const params: Record<string, unknown> = { ...config.params, limit: LIST_PAGE_SIZE }
+    if (cursor) params.cursor = cursor
+    const response = await axios.get<T[]>(url, { ...config, params })
+    data.push(...response.data)
+    cursor = response.headers["x-next-cursor"] ?? null
+  } while (cursor)
+  return { data }
+}
+
+// fetch() flavour: ok/status describe the first failing page, if any
+export async function fetchAllPages<T>(url: string, init: RequestInit = {}): Promise<{ ok: boolean; status: number; data: T[] }> {
+  const data: T[] = []
+  let cursor: string | null = null
+  do {
+    const pageUrl = new URL(url)
+    pageUrl.searchParams.set("limit", String(LIST_PAGE_SIZE))
+    if (cursor) pageUrl.searchParams.set("cursor", cursor)
+    const response = await fetch(pageUrl.toString(), init)
+    if (!response.ok) return { ok: false, status: response.status, data }
+    data.push(...(await response.json()))
+    cursor = response.headers.get("X-Next-Cursor")
+  } while (cursor)
+  return { ok: true, status: 200, data }
+}
@@ -88,6 +88,7 @@ export default function MriUploadPage() {
       await axios.post('http://127.0.0.1:8000/assessments/', {
         prediction,
         confidence,
+        heatmap_url,
       }, {
         headers: {
           Authorization: `Bearer ${token}`,
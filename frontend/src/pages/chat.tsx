@@ -2,6 +2,7 @@ import { useEffect, useState, useRef } from 'react';
 import { useAuth } from '@/context/AuthContext';
 import { useRouter } from 'next/router';
 import axios from 'axios';
+import { getAllPages } from '@/lib/pagination';
 import { Send, MessageCircle, Loader2, User } from 'lucide-react';
 import { Button } from '@/components/ui/button';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
@@ -14,8 +15,12 @@ interface Message {
   timestamp: string;
   read: boolean;
   delivered?: boolean;
+  type?: string;
 }
 
+// Messages per history request; older pages load on demand
+const HISTORY_PAGE_SIZE = 50;
+
 interface Doctor {
   email: string;
   full_name: string;
@@ -43,6 +48,11 @@ export default function ChatPage() {
   const [latestMessages, setLatestMessages] = useState<Record<string, string>>({});
   const [loadingDoctors, setLoadingDoctors] = useState(false);
   const [loadingPatients, setLoadingPatients] = useState(false);
+  const [olderCursor, setOlderCursor] = useState<string | null>(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
+  // X-Latest-Cursor of the last history response: `since` for the next incremental sync
+  const latestCursorRef = useRef<string | null>(null);
+  const skipScrollRef = useRef(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const inputRef = useRef<HTMLInputElement>(null);
 
@@ -68,9 +78,70 @@ export default function ChatPage() {
   };
 
   useEffect(() => {
+    // Prepending older messages shouldn't jump back to the bottom
+    if (skipScrollRef.current) {
+      skipScrollRef.current = false;
+      return;
+    }
     scrollToBottom();
   }, [messages]);
 
+  const appendNewMessages = (incoming: Message[]) => {
+    setMessages((prev) => {
+      const known = new Set(prev.map((m) => m._id));
+      const added = incoming.filter((m) => !known.has(m._id));
+      return added.length ? [...prev, ...added] : prev;
+    });
+  };
+
+  const loadOlderMessages = async () => {
+    if (!token || !user?.email || !partnerEmail || !olderCursor) return;
+    setLoadingOlder(true);
+    try {
+      const response = await axios.get(
+        `http://127.0.0.1:8000/messages/${user.email}/${partnerEmail}`,
+        {
+          headers: { Authorization: `Bearer ${token}` },
+          params: { limit: HISTORY_PAGE_SIZE, before: olderCursor },
+        }
+      );
+      skipScrollRef.current = true;
+      setMessages((prev) => {
+        const known = new Set(prev.map((m) => m._id));
+        return [...response.data.filter((m: Message) => !known.has(m._id)), ...prev];
+      });
+      setOlderCursor(response.headers['x-next-cursor'] ?? null);
+    } catch (error) {
+      console.error('[Chat] Error loading older messages:', error);
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
+  // Fetch only what arrived since the last history response (e.g. after a reconnect)
+  const syncNewMessages = async () => {
+    if (!token || !user?.email || !partnerEmail || !latestCursorRef.current) return;
+    try {
+      let since: string | null = latestCursorRef.current;
+      while (since) {
+        const response: { data: Message[]; headers: Record<string, string> } = await axios.get(
+          `http://127.0.0.1:8000/messages/${user.email}/${partnerEmail}`,
+          {
+            headers: { Authorization: `Bearer ${token}` },
+            params: { limit: HISTORY_PAGE_SIZE, since },
+          }
+        );
+        appendNewMessages(response.data);
+        if (response.headers['x-latest-cursor']) {
+          latestCursorRef.current = response.headers['x-latest-cursor'];
+        }
+        since = response.headers['x-next-cursor'] ?? null;
+      }
+    } catch (error) {
+      console.error('[Chat] Error syncing new messages:', error);
+    }
+  };
+
   // Fetch assigned doctors for patients
   useEffect(() => {
     if (!user || user.role !== 'patient' || !token) return;
@@ -80,7 +151,7 @@ export default function ChatPage() {
       try {
         console.log('[Chat] Fetching assigned doctors for patient:', user.email);
         // Use /users/doctors endpoint which returns doctors with assigned_patients info
-        const res = await axios.get('http://127.0.0.1:8000/users/doctors', {
+        const res = await getAllPages<Doctor>('http://127.0.0.1:8000/users/doctors', {
           headers: { Authorization: `Bearer ${token}` },
         });
         
@@ -175,17 +246,23 @@ export default function ChatPage() {
 
     console.log('[Chat] Fetching messages between:', user.email, 'and', partnerEmail);
     setLoadingHistory(true);
+    setOlderCursor(null);
+    latestCursorRef.current = null;
     const fetchHistory = async () => {
       try {
         const response = await axios.get(
           `http://127.0.0.1:8000/messages/${user.email}/${partnerEmail}`,
           {
             headers: { Authorization: `Bearer ${token}` },
+            // Newest page only; older pages via "Load older messages"
+            params: { limit: HISTORY_PAGE_SIZE },
           }
         );
         console.log('[Chat] Messages received:', response.data);
         console.log('[Chat] Loaded', response.data.length, 'messages');
         setMessages(response.data);
+        setOlderCursor(response.headers['x-next-cursor'] ?? null);
+        latestCursorRef.current = response.headers['x-latest-cursor'] ?? null;
         
         // Update latest message for this doctor
         if (response.data.length > 0) {
@@ -232,22 +309,34 @@ export default function ChatPage() {
 
   // WebSocket connection
   useEffect(() => {
-    if (!user?.email) {
-      console.log('[WebSocket] No user email, skipping connection');
+    if (!user?.email || !token) {
+      console.log('[WebSocket] No user email or token, skipping connection');
       return;
     }
 
     console.log('[WebSocket] Connecting for user:', user.email);
-    const websocket = new WebSocket(`ws://127.0.0.1:8000/ws/${user.email}`);
+    const websocket = new WebSocket(`ws://127.0.0.1:8000/ws/${user.email}?token=${encodeURIComponent(token)}`);
 
     websocket.onopen = () => {
       console.log('[WebSocket] Connected successfully');
       console.log('[WebSocket] Ready state:', websocket.readyState);
       setIsConnected(true);
+      // Pick up anything sent while this page wasn't connected
+      syncNewMessages();
     };
 
     websocket.onmessage = (event) => {
       const message: Message = JSON.parse(event.data);
+
+      // Server heartbeat: answer so the connection isn't reaped as dead
+      if (message.type === 'ping') {
+        websocket.send(JSON.stringify({ type: 'pong' }));
+        return;
+      }
+      // Notifications share the socket; the Notifications panel shows them
+      if (message.type === 'notification') {
+        return;
+      }
       console.log('[WebSocket] Received message:', message);
 
       if (message.error) {
@@ -292,7 +381,7 @@ export default function ChatPage() {
         websocket.close();
       }
     };
-  }, [user?.email, partnerEmail]);
+  }, [user?.email, token, partnerEmail]);
 
   const sendMessage = async () => {
     if (!newMessage.trim() || !ws || !partnerEmail || typeof partnerEmail !== 'string') return;
@@ -537,6 +626,13 @@ export default function ChatPage() {
                   </div>
                 ) : (
                   <div className="space-y-4">
+                    {olderCursor && (
+                      <div className="flex justify-center">
+                        <Button variant="outline" size="sm" onClick={loadOlderMessages} disabled={loadingOlder}>
+                          {loadingOlder ? <Loader2 className="h-4 w-4 animate-spin" /> : 'Load older messages'}
+                        </Button>
+                      </div>
+                    )}
                     {Object.entries(groupedMessages).map(([date, dateMessages]) => (
                       <div key={date}>
                         <div className="flex items-center justify-center my-4">
@@ -769,6 +865,13 @@ export default function ChatPage() {
                   </div>
                 ) : (
                   <div className="space-y-4">
+                    {olderCursor && (
+                      <div className="flex justify-center">
+                        <Button variant="outline" size="sm" onClick={loadOlderMessages} disabled={loadingOlder}>
+                          {loadingOlder ? <Loader2 className="h-4 w-4 animate-spin" /> : 'Load older messages'}
+                        </Button>
+                      </div>
+                    )}
                     {Object.entries(groupedMessages).map(([date, dateMessages]) => (
                       <div key={date}>
                         <div className="flex items-center justify-center my-4">
@@ -914,6 +1017,13 @@ export default function ChatPage() {
             </div>
           ) : (
             <div className="space-y-4">
+              {olderCursor && (
+                <div className="flex justify-center">
+                  <Button variant="outline" size="sm" onClick={loadOlderMessages} disabled={loadingOlder}>
+                    {loadingOlder ? <Loader2 className="h-4 w-4 animate-spin" /> : 'Load older messages'}
+                  </Button>
+                </div>
+              )}
               {Object.entries(groupedMessages).map(([date, dateMessages]) => (
                 <div key={date}>
                   <div className="flex items-center justify-center my-4">
@@ -4,6 +4,7 @@ import { useRouter } from 'next/router';
 import Link from 'next/link';
 import { Card, CardContent, CardHeader, CardTitle, CardDescription } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
+import { fetchAllPages } from '@/lib/pagination';
 import { 
   Star, 
   Award, 
@@ -81,14 +82,14 @@ export default function DoctorDetailPage() {
     
     try {
       // Fetch all doctors and find the one with matching ID
-      const response = await fetch('http://127.0.0.1:8000/doctors/all', {
+      const response = await fetchAllPages<Doctor>('http://127.0.0.1:8000/doctors/all', {
         headers: {
           Authorization: `Bearer ${token}`,
         },
       });
 
       if (response.ok) {
-        const doctors = await response.json();
+        const doctors = response.data;
         const foundDoctor = doctors.find((d: Doctor) => d._id === id);
         if (foundDoctor) {
           setDoctor(foundDoctor);
@@ -3,6 +3,7 @@ import { useAuth } from '../../context/AuthContext';
 import { useRouter } from 'next/router';
 import { NextPage } from 'next';
 import axios, { AxiosError } from 'axios';
+import { getAllPages } from '@/lib/pagination';
 import {
   Table,
   TableBody,
@@ -144,11 +145,13 @@ const PatientDetailPage: NextPage = () => {
       }
       
       // Make requests with individual error handling to prevent uncaught promise rejections
-      const assessmentsPromise = axios.get(`http://127.0.0.1:8000/assessments/?patient_email=${email}`, {
+      const assessmentsPromise = getAllPages<Assessment>('http://127.0.0.1:8000/assessments/', {
+        params: { patient_email: email },
         headers: { Authorization: `Bearer ${token}` }
       }).catch(err => ({ error: err }));
       
-      const cognitiveTestsPromise = axios.get(`http://127.0.0.1:8000/cognitive-tests/?patient_email=${email}`, {
+      const cognitiveTestsPromise = getAllPages<CognitiveTest>('http://127.0.0.1:8000/cognitive-tests/', {
+        params: { patient_email: email },
         headers: { Authorization: `Bearer ${token}` }
       }).catch(err => ({ error: err }));
       
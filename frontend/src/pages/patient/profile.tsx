@@ -5,6 +5,7 @@ import { useAuth } from "../../context/AuthContext";
 import { useRouter } from "next/router";
 import { Card, CardContent, CardHeader, CardTitle, CardDescription } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
+import { fetchAllPages } from '@/lib/pagination';
 import {
   Camera,
   Star,
@@ -60,29 +61,27 @@ export default function PatientProfilePage() {
 
     try {
       // Fetch assessments
-      const assessmentsRes = await fetch('http://127.0.0.1:8000/assessments/', {
+      const assessmentsRes = await fetchAllPages<Assessment>('http://127.0.0.1:8000/assessments/', {
         headers: { Authorization: `Bearer ${token}` }
       });
       if (assessmentsRes.ok) {
-        const assessmentsData = await assessmentsRes.json();
-        setAssessments(assessmentsData);
+        setAssessments(assessmentsRes.data);
       }
 
       // Fetch cognitive tests
-      const cognitiveRes = await fetch('http://127.0.0.1:8000/cognitive-tests/', {
+      const cognitiveRes = await fetchAllPages<CognitiveTest>('http://127.0.0.1:8000/cognitive-tests/', {
         headers: { Authorization: `Bearer ${token}` }
       });
       if (cognitiveRes.ok) {
-        const cognitiveData = await cognitiveRes.json();
-        setCognitiveTests(cognitiveData);
+        setCognitiveTests(cognitiveRes.data);
       }
 
       // Fetch all doctors (to show assigned doctors)
-      const doctorsRes = await fetch('http://127.0.0.1:8000/doctors/all', {
+      const doctorsRes = await fetchAllPages<any>('http://127.0.0.1:8000/doctors/all', {
         headers: { Authorization: `Bearer ${token}` }
       });
       if (doctorsRes.ok) {
-        const doctorsData = await doctorsRes.json();
+        const doctorsData = doctorsRes.data;
         // Filter doctors who have this patient assigned
         const assigned = doctorsData.filter((doctor: any) => 
           doctor.assigned_patients?.includes(user?.email)
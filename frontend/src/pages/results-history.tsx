@@ -2,7 +2,7 @@ import { useEffect, useState } from 'react';
 import { useAuth } from '../context/AuthContext';
 import { useRouter } from 'next/router';
 import { NextPage } from 'next';
-import axios from 'axios';
+import { getAllPages } from '@/lib/pagination';
 import {
   Table,
   TableBody,
@@ -72,15 +72,15 @@ const ResultsHistoryPage: NextPage = () => {
 
           // Fetch all result types in parallel
           const [assessmentsResponse, cognitiveTestsResponse, audioRecallResponse] = await Promise.all([
-            axios.get('http://127.0.0.1:8000/assessments/', { headers }).catch(err => {
+            getAllPages<Assessment>('http://127.0.0.1:8000/assessments/', { headers }).catch(err => {
               console.error('Failed to fetch assessments:', err);
               return { data: [] };
             }),
-            axios.get('http://127.0.0.1:8000/cognitive-tests/', { headers }).catch(err => {
+            getAllPages<CognitiveTest>('http://127.0.0.1:8000/cognitive-tests/', { headers }).catch(err => {
               console.error('Failed to fetch cognitive tests:', err);
               return { data: [] };
             }),
-            axios.get('http://127.0.0.1:8000/cognitive-tests/audio-recall', { headers }).catch(err => {
+            getAllPages<AudioRecallTest>('http://127.0.0.1:8000/cognitive-tests/audio-recall', { headers }).catch(err => {
               console.error('Failed to fetch audio recall tests:', err);
               return { data: [] };
             }),
@@ -5,6 +5,7 @@ import Link from 'next/link';
 import { Card, CardContent, CardHeader, CardTitle, CardDescription } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
+import { fetchAllPages } from '@/lib/pagination';
 import { 
   Users, 
   Star, 
@@ -65,14 +66,14 @@ export default function ViewDoctorsPage() {
     if (!token) return;
     
     try {
-      const response = await fetch('http://127.0.0.1:8000/doctors/all', {
+      const response = await fetchAllPages<Doctor>('http://127.0.0.1:8000/doctors/all', {
         headers: {
           Authorization: `Bearer ${token}`,
         },
       });
 
       if (response.ok) {
-        const data = await response.json();
+        const data = response.data;
         setDoctors(data);
         setFilteredDoctors(data);
       } else {